@@ -1,28 +1,36 @@
 import os
+import uuid
 import subprocess
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.mime.base import MIMEBase
-from email import encoders
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, request, jsonify, render_template, send_from_directory, stream_with_context, url_for
 from werkzeug.utils import secure_filename
 from dotenv import load_dotenv
-from openai import OpenAI
 from docx import Document
+from jobs import (STATUS_QUEUED, STATUS_RUNNING, DeltaPublisher, JobQueue, QueueFullError, ensure_workers,
+                  event_stream, start_event_sweeper, tenant_key)
+from mailer import DOWNLOAD_FOLDER, EMAIL_JOB_KIND, deliver_email, enqueue_email
+from metrics import record_usage, render_metrics, span
+from openai_client import call_with_retries, get_client
+from prompts import get_prompt
+from ratelimit import estimate_tokens, get_limiter
+from resumable_upload import (STATUS_UPLOADING, UploadError, UploadStore, start_prefix_extraction,
+                              wait_for_extraction)
+from translation import TRANSLATE_RPM, TRANSLATE_TPM
+from transcription import transcribe_audio_cached
+from media import pcm_wav_bytes, prepare_audio, probe_media, stream_convert
+from scratch import ScratchFullError, scratch
+from vad import VAD_ENABLED, trim_silence
 
 # Tải biến môi trường từ file .env
 load_dotenv()
 
-# Cấu hình client OpenAI
-client = OpenAI(
-    api_key=os.getenv("OPENAI_API_KEY")  # Lấy API Key từ biến môi trường
-)
+# Client OpenAI dùng chung (connection pool, thử lại khi 429/5xx, hạn mức giữa các worker)
+client = get_client()
+BILINGUAL_PROMPT = get_prompt("bilingual")
 
 # Cấu hình ứng dụng Flask
 app = Flask(__name__, template_folder='templates')  # Đảm bảo đường dẫn tới thư mục templates
 
-app.config['UPLOAD_FOLDER'] = 'uploads'
+app.config['UPLOAD_FOLDER'] = scratch.root  # Mỗi job một thư mục con uploads/<job_id>/
 app.config['ALLOWED_EXTENSIONS'] = {
     'wav', 'mp3', 'flac', 'm4a', 'aac', 'mp4', 'mov', 'avi', 'mkv', 'amsr', 'ogg'
 }
@@ -30,120 +38,195 @@ app.config['ALLOWED_EXTENSIONS'] = {
 # Đảm bảo thư mục uploads tồn tại
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
-# Cấu hình email server
-SMTP_SERVER = "smtp.gmail.com"
-SMTP_PORT = 587
-SMTP_USERNAME = os.getenv("SMTP_USERNAME")  # Email của bạn
-SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")  # Mật khẩu email của bạn
+# Hàng đợi xử lý nền: /upload chỉ lưu file và trả về job id
+JOB_KIND = "audio"
+job_queue = JobQueue()
+upload_store = UploadStore(app.config['UPLOAD_FOLDER'])
 
 # Kiểm tra định dạng file hợp lệ
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
-# Chuyển đổi định dạng âm thanh/video sang WAV bằng FFmpeg
-def convert_audio(input_path, output_path):
+# Đọc thông tin file một lần bằng ffprobe; kết quả dùng lại cho chuyển đổi và ước lượng độ dài
+def probe_audio(input_path):
     try:
-        processed_output_path = f"{os.path.splitext(output_path)[0]}_processed.wav"
-        subprocess.run([ 
-            'ffmpeg', '-y', '-i', input_path, 
-            '-ar', '16000',  # Tần số lấy mẫu 
-            '-ac', '1',      # Mono channel 
-            '-f', 'wav', 
-            processed_output_path 
-        ], check=True)
-        return processed_output_path
-    except subprocess.CalledProcessError as e:
+        return probe_media(input_path)
+    except (subprocess.CalledProcessError, ValueError) as e:
+        print(f"FFprobe error: {e}")
+        return None
+
+# Chuyển đổi định dạng âm thanh/video cho Whisper: dùng nguyên, tách luồng âm thanh hoặc chuyển sang WAV
+def convert_audio(input_path, output_path, probe=None):
+    try:
+        with span('convert', bytes=os.path.getsize(input_path),
+                  audio_seconds=probe['duration'] if probe else None) as current:
+            # VAD cần WAV PCM nên khi bật VAD không copy luồng âm thanh nén
+            result_path = prepare_audio(input_path, output_path, probe, require_pcm=VAD_ENABLED)
+            current.set(output_bytes=os.path.getsize(result_path))
+            return result_path
+    except (subprocess.CalledProcessError, ValueError) as e:
         print(f"FFmpeg error: {e}")
         return None
 
-# Chuyển đổi giọng nói thành văn bản bằng Whisper API, bao gồm timestamp
-def transcribe_audio(file_path):
+# Chuyển đổi giọng nói thành văn bản bằng Whisper API (có cache, file dài được cắt và phiên âm song song)
+def transcribe_audio(file_path, duration=None):
     try:
-        with open(file_path, 'rb') as audio_file:
-            response = client.audio.transcriptions.create(
-                model="whisper-1",  # Bạn có thể thay đổi model nếu cần
-                file=audio_file,
-                language="vi"  # Ngôn ngữ: tiếng Việt
-            )
-        return response.text  # Trả về văn bản hoàn chỉnh
+        with span('transcribe', bytes=os.path.getsize(file_path), audio_seconds=duration) as current:
+            transcript = transcribe_audio_cached(client, file_path, duration=duration)  # Transcript (các đoạn có timestamp)
+            current.set(segments=len(transcript))
+            return transcript
     except Exception as e:
         print(f"Whisper API error for file {file_path}: {e}")
-        return "..."
+        return None  # Để job báo lỗi thay vì gửi bản dịch rỗng
 
-# Dịch song ngữ bằng ChatGPT
-def translate_bilingual(text):
+# Dịch song ngữ bằng ChatGPT; kết quả được stream theo từng token, on_delta nhận từng phần mới
+def translate_bilingual(transcript, on_delta=None):
+    text = transcript.text  # Dịch cả bài một lần nên chỉ cần văn bản hoàn chỉnh
     if not text or text.strip() == "...":
         return "..."
-    
-    prompt = f"""
-    Bạn nhận được đầu ra từ Whisper API. Nếu có phần không rõ ràng, hãy thay thế bằng dấu "...". Nhiệm vụ của bạn là:
-
-    1. Chỉnh sửa nội dung để rõ ràng, dễ đọc hơn.
-    2. Cắt nhỏ, mỗi đoạn không quá 20 từ.
-    3. Dịch nội dung sang tiếng Anh theo định dạng:
-       - : <Câu gốc tiếng Việt, nếu không rõ thì giữ nguyên dấu "...">
-       -> B : <Bản dịch tiếng Anh, nếu không rõ thì giữ nguyên "...">
-    Nội dung: "{text}"
-    """
+
+    # Hướng dẫn nằm ở system (prompts/bilingual.txt), nội dung bài ở cuối để dùng lại prompt cache
+    messages = BILINGUAL_PROMPT.messages(text=text)
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role": "system", "content": "Bạn là chuyên gia dịch thuật..."},
-                      {"role": "user", "content": prompt}],
-            max_tokens=3000,
-            temperature=0.3,
-        )
-        return response.choices[0].message.content.strip()
+        with span('translate', characters=len(text)):
+            response = call_with_retries(
+                lambda: client.chat.completions.create(
+                    model="gpt-4o",
+                    messages=messages,
+                    max_tokens=3000,
+                    temperature=0.3,
+                    stream=True,
+                    stream_options={"include_usage": True},  # Chunk cuối mang số token đã dùng
+                ),
+                limiter=get_limiter("chat:gpt-4o", TRANSLATE_RPM, TRANSLATE_TPM),
+                tokens=estimate_tokens(messages[0]['content'] + messages[1]['content']) + 3000
+            )
+            parts = []
+            for chunk in response:
+                if chunk.usage:
+                    record_usage(chunk.usage)
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    parts.append(delta)
+                    if on_delta:
+                        on_delta(delta)
+            return "".join(parts).strip()
     except Exception as e:
         print(f"ChatGPT API error: {e}")
-        return "..."
+        return None  # Để job báo lỗi thay vì gửi bản dịch rỗng
 # Xuất kết quả ra file Word (không có timestamp)
 def export_to_word(bilingual_text, output_file):
     try:
-        document = Document()
-        document.add_heading("Bản Dịch Song Ngữ", level=1)
-        document.add_paragraph(bilingual_text)
-        document.save(output_file)
-        return output_file
+        with span('export', characters=len(bilingual_text)) as current:
+            document = Document()
+            document.add_heading("Bản Dịch Song Ngữ", level=1)
+            document.add_paragraph(bilingual_text)
+            document.save(output_file)
+            current.set(bytes=os.path.getsize(output_file))
+            return output_file
     except Exception as e:
         print(f"Lỗi khi xuất file Word: {e}")
         return None
 
-# Gửi email với file đính kèm
-def send_email_with_attachment(to_email, subject, body, attachment_paths):
-    try:
-        msg = MIMEMultipart()
-        msg['From'] = SMTP_USERNAME
-        msg['To'] = to_email
-        msg['Subject'] = subject
-
-        msg.attach(MIMEText(body, 'plain'))
-
-        for attachment_path in attachment_paths:
-            with open(attachment_path, 'rb') as attachment:
-                part = MIMEBase('application', 'octet-stream')
-                part.set_payload(attachment.read())
-                encoders.encode_base64(part)
-                part.add_header(
-                    'Content-Disposition',
-                    f'attachment; filename={os.path.basename(attachment_path)}'
-                )
-                msg.attach(part)
-
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            server.starttls()
-            server.login(SMTP_USERNAME, SMTP_PASSWORD)
-            server.send_message(msg)
-        print(f"Email đã được gửi tới {to_email}")
-    except Exception as e:
-        print(f"Không thể gửi email: {e}")
+# Thư mục tạm của job/upload còn đang dùng thì luồng dọn dẹp không được xóa
+def scratch_in_use(job_id):
+    job = job_queue.get(job_id)
+    if job:
+        return job['status'] in (STATUS_QUEUED, STATUS_RUNNING)
+    session = upload_store.get(job_id)
+    return session is not None and session['status'] == STATUS_UPLOADING
+
+# Chạy toàn bộ pipeline cho một job trong luồng nền; thư mục tạm của job luôn được xóa khi xong hoặc lỗi
+def process_job(job, queue):
+    with scratch.job(job['id']) as work:
+        return run_pipeline(job, queue, work)
+
+def run_pipeline(job, queue, work):
+    payload = job['payload']
+    input_path = payload.get('input_path')
+    filename = payload['filename']
+
+    # Upload dạng luồng đã được chuyển đổi ngay khi nhận, bỏ qua bước này
+    processed_output_path = payload.get('converted_path')
+    # Upload nối tiếp: âm thanh có thể đã được trích trong lúc nhận các khối
+    if not processed_output_path and payload.get('upload_id'):
+        processed_output_path = wait_for_extraction(upload_store, payload['upload_id'])
+    probe = None
+    if not processed_output_path:
+        queue.set_stage(job['id'], 'converting')
+        # Dùng lại kết quả ffprobe đo lúc upload (để xếp lịch) nếu có
+        probe = payload.get('probe') or probe_audio(input_path)
+        if not probe:
+            raise RuntimeError('Không đọc được thông tin file âm thanh/video.')
+        # File WAV trung gian đặt trên tmpfs nếu còn đủ chỗ
+        output_path = work.fast_path(f"{os.path.splitext(filename)[0]}.wav", pcm_wav_bytes(probe['duration']))
+        processed_output_path = convert_audio(input_path, output_path, probe)
+        if not processed_output_path:
+            raise RuntimeError('Lỗi trong quá trình chuyển đổi định dạng âm thanh/video.')
+
+    # Bỏ các khoảng lặng dài trước khi gửi Whisper
+    queue.set_stage(job['id'], 'trimming')
+    with span('trim', bytes=os.path.getsize(processed_output_path)) as current:
+        speech_output = work.fast_path(f"{os.path.splitext(filename)[0]}_speech.wav",
+                                       os.path.getsize(processed_output_path))
+        speech_path, _, vad_stats = trim_silence(processed_output_path, speech_output)
+        if vad_stats:
+            current.set(audio_seconds=vad_stats['original_seconds'], kept_seconds=vad_stats['kept_seconds'])
+
+    queue.set_stage(job['id'], 'transcribing')
+    duration = vad_stats['kept_seconds'] if vad_stats else (probe['duration'] if probe else None)
+    transcript = transcribe_audio(speech_path, duration=duration)
+    if not transcript:
+        raise RuntimeError('Lỗi trong quá trình phiên âm âm thanh.')
+
+    # Bản dịch được đẩy tới trình duyệt (SSE) ngay khi ChatGPT sinh ra
+    queue.set_stage(job['id'], 'translating')
+    publisher = DeltaPublisher(queue, job['id'])
+    bilingual_text = translate_bilingual(transcript, on_delta=publisher.push)
+    publisher.flush()
+    if not bilingual_text:
+        raise RuntimeError('Lỗi trong quá trình dịch song ngữ.')
+
+    queue.set_stage(job['id'], 'exporting')
+    # File kết quả nằm trong outbox của job, worker email xóa sau khi gửi
+    word_file_path = os.path.join(work.outbox(), f"{os.path.splitext(filename)[0]}_result.docx")
+    if not export_to_word(bilingual_text, word_file_path):
+        raise RuntimeError('Lỗi khi xuất file Word.')
+
+    queue.set_stage(job['id'], 'emailing')
+    # Chỉ đưa thư vào hàng đợi; worker "email" gửi qua kết nối SMTP dùng chung và tự thử lại
+    enqueue_email(
+        queue, payload['email'],
+        subject="Kết quả dịch âm thanh",
+        body="Vui lòng kiểm tra file đính kèm để xem kết quả.",
+        attachment_paths=[word_file_path],
+        base_url=payload.get('base_url'),
+        cleanup_dir=work.outbox()
+    )
+
+    # Bản dịch đã được gửi qua sự kiện "delta" và email, không lưu lại trong kết quả job
+    return {'message': 'Kết quả sẽ được gửi qua email.', 'vad': vad_stats}
+
+# Khởi động pool worker trong mỗi tiến trình (kể cả sau khi gunicorn fork)
+@app.before_request
+def start_job_workers():
+    ensure_workers(job_queue, JOB_KIND, process_job)
+    # Một worker gửi thư mỗi tiến trình để dùng lại một kết nối SMTP
+    ensure_workers(job_queue, EMAIL_JOB_KIND, deliver_email, num_workers=1)
+    scratch.start_sweeper(scratch_in_use)
+    start_event_sweeper(job_queue)
+
+# Hàng đợi đầy: trả 429 kèm Retry-After để trình duyệt/client biết khi nào thử lại
+def queue_full_response(error):
+    body = jsonify({'error': str(error), 'retry_after': error.retry_after})
+    return body, 429, {'Retry-After': str(error.retry_after)}
 
 # Trang chính của ứng dụng
 @app.route('/')
 def index():
     return render_template('index.html')
 
-# Xử lý upload file
+# Xử lý upload file: lưu file, đưa vào hàng đợi và trả về job id ngay
 @app.route('/upload', methods=['POST'])
 def upload_file():
     if 'audio' not in request.files or 'email' not in request.form:
@@ -155,47 +238,208 @@ def upload_file():
         return jsonify({'error': 'Không có file nào được chọn hoặc email không hợp lệ.'}), 400
 
     if file and allowed_file(file.filename):
+        tenant = tenant_key(email)
+        try:
+            scratch.check_quota(request.content_length)
+            job_queue.check_admission(JOB_KIND, tenant)
+        except ScratchFullError as e:
+            return jsonify({'error': str(e)}), 507
+        except QueueFullError as e:
+            return queue_full_response(e)
+
+        # Lưu vào thư mục riêng của job nên hai người upload cùng tên file không ghi đè nhau
         filename = secure_filename(file.filename)
-        input_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(input_path)
+        job_id = uuid.uuid4().hex
+        try:
+            input_path = os.path.join(scratch.job_dir(job_id), filename)
+            file.save(input_path)
+            # Độ dài âm thanh đo ngay lúc upload để hàng đợi ưu tiên file ngắn
+            probe = probe_audio(input_path)
+            job_queue.enqueue(JOB_KIND, {
+                'input_path': input_path,
+                'filename': filename,
+                'email': email,
+                'base_url': request.host_url,
+                'probe': probe
+            }, job_id=job_id, cost=probe['duration'] if probe else None, tenant=tenant, admit=True)
+        except QueueFullError as e:
+            scratch.release(job_id)
+            return queue_full_response(e)
+        except Exception:
+            scratch.release(job_id)
+            raise
+        return jsonify({
+            'message': 'File đã được đưa vào hàng đợi xử lý.',
+            'job_id': job_id,
+            'status_url': url_for('job_status', job_id=job_id),
+            'events_url': url_for('job_events', job_id=job_id)
+        }), 202
 
-        output_filename = f"{os.path.splitext(filename)[0]}.wav"
-        output_path = os.path.join(app.config['UPLOAD_FOLDER'], output_filename)
-        converted = convert_audio(input_path, output_path)
-        if not converted:
-            return jsonify({'error': 'Lỗi trong quá trình chuyển đổi định dạng âm thanh/video.'}), 500
+    else:
+        return jsonify({'error': 'Định dạng file không được hỗ trợ.'}), 400
 
-        processed_output_path = converted
+# Upload dạng luồng: thân request là nội dung file, âm thanh được trích ngay trong lúc nhận
+# nên không phải lưu cả file video xuống uploads/ trước khi chuyển đổi
+@app.route('/upload/stream', methods=['POST'])
+def upload_stream():
+    filename = secure_filename(request.args.get('filename', ''))
+    email = request.args.get('email', '')
+    if not filename or not email:
+        return jsonify({'error': 'Không có file nào được chọn hoặc email không hợp lệ.'}), 400
+    if not allowed_file(filename):
+        return jsonify({'error': 'Định dạng file không được hỗ trợ.'}), 400
 
-        transcript = transcribe_audio(processed_output_path)
+    tenant = tenant_key(email)
+    try:
+        scratch.check_quota(request.content_length)
+        job_queue.check_admission(JOB_KIND, tenant)
+    except ScratchFullError as e:
+        return jsonify({'error': str(e)}), 507
+    except QueueFullError as e:
+        return queue_full_response(e)
 
-        if not transcript:
-            return jsonify({'error': 'Lỗi trong quá trình phiên âm âm thanh.'}), 500
+    job_id = uuid.uuid4().hex
+    job_dir = scratch.job_dir(job_id)
+    try:
+        converted = stream_convert(
+            request.stream, os.path.join(job_dir, f"{os.path.splitext(filename)[0]}_processed.wav"),
+            extension=filename.rsplit('.', 1)[1],
+            spool_path=os.path.join(job_dir, filename)
+        )
+        if not converted:
+            scratch.release(job_id)
+            return jsonify({'error': 'Lỗi trong quá trình chuyển đổi định dạng âm thanh/video.'}), 500
+        probe = probe_audio(converted)
+        job_queue.enqueue(JOB_KIND, {
+            'converted_path': converted,
+            'filename': filename,
+            'email': email,
+            'base_url': request.host_url
+        }, job_id=job_id, cost=probe['duration'] if probe else None, tenant=tenant, admit=True)
+    except QueueFullError as e:
+        scratch.release(job_id)
+        return queue_full_response(e)
+    except Exception:
+        scratch.release(job_id)
+        raise
+    return jsonify({
+        'message': 'File đã được đưa vào hàng đợi xử lý.',
+        'job_id': job_id,
+        'status_url': url_for('job_status', job_id=job_id),
+        'events_url': url_for('job_events', job_id=job_id)
+    }), 202
 
-        bilingual_text = translate_bilingual(transcript)
-        if not bilingual_text:
-            return jsonify({'error': 'Lỗi trong quá trình dịch song ngữ.'}), 500
+# Upload nối tiếp được cho file lớn: tạo phiên, nhận từng khối (song song, gửi lại được), rồi hoàn tất
+@app.route('/uploads', methods=['POST'])
+def create_upload():
+    data = request.get_json(silent=True) or {}
+    filename = secure_filename(data.get('filename', ''))
+    email = data.get('email', '')
+    size = data.get('size')
+    if not filename or not email or not isinstance(size, int):
+        return jsonify({'error': 'Không có file nào được chọn hoặc email không hợp lệ.'}), 400
+    if not allowed_file(filename):
+        return jsonify({'error': 'Định dạng file không được hỗ trợ.'}), 400
+    try:
+        scratch.check_quota(size)
+        # Nhận vào hàng đợi từ lúc tạo phiên để không phải từ chối sau khi đã upload xong cả file
+        job_queue.check_admission(JOB_KIND, tenant_key(email))
+        session = upload_store.create(filename, size, email)
+    except ScratchFullError as e:
+        return jsonify({'error': str(e)}), 507
+    except QueueFullError as e:
+        return queue_full_response(e)
+    except UploadError as e:
+        return jsonify({'error': str(e)}), e.status
+    # Container đọc tuần tự được thì trích âm thanh ngay trên phần đầu đã nhận
+    start_prefix_extraction(upload_store, session)
+    return jsonify(upload_store.describe(session)), 201
 
-        word_file_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{os.path.splitext(filename)[0]}_result.docx")
-        export_to_word(bilingual_text, word_file_path)
+# Các khối đã nhận, để trình duyệt tiếp tục upload sau khi mất kết nối
+@app.route('/uploads/<upload_id>', methods=['GET'])
+def upload_status(upload_id):
+    session = upload_store.get(upload_id)
+    if not session:
+        return jsonify({'error': 'Không tìm thấy phiên upload.'}), 404
+    return jsonify(upload_store.describe(session))
 
-        send_email_with_attachment(
-            to_email=email,
-            subject="Kết quả dịch âm thanh",
-            body="Vui lòng kiểm tra file đính kèm để xem kết quả.",
-            attachment_paths=[word_file_path]
+# Nhận một khối: thân request được ghi thẳng vào file, không qua bộ đệm form của Werkzeug
+@app.route('/uploads/<upload_id>', methods=['PUT'])
+def upload_chunk(upload_id):
+    try:
+        session = upload_store.write_chunk(
+            upload_id, request.args.get('offset', type=int), request.stream,
+            request.content_length, request.headers.get('X-Chunk-SHA256')
         )
+    except UploadError as e:
+        return jsonify({'error': str(e)}), e.status
+    return jsonify({'received_bytes': session['received_bytes']})
 
-        try:
-            os.remove(input_path)
-            os.remove(processed_output_path)
-        except Exception as e:
-            print(f"Error deleting files: {e}")
+@app.route('/uploads/<upload_id>/complete', methods=['POST'])
+def complete_upload(upload_id):
+    session = upload_store.get(upload_id)
+    if not session:
+        return jsonify({'error': 'Không tìm thấy phiên upload.'}), 404
+    if session['status'] == STATUS_UPLOADING:
+        if session['contiguous_bytes'] < session['size']:
+            return jsonify({'error': 'Chưa nhận đủ dữ liệu của file.', **upload_store.describe(session)}), 409
+        # Job dùng luôn upload id để thư mục uploads/<upload_id>/ trở thành thư mục làm việc của job.
+        # Gọi hoàn tất nhiều lần (trình duyệt thử lại) chỉ tạo một job.
+        job_id = upload_id
+        if upload_store.mark_complete(upload_id, job_id):
+            probe = probe_audio(session['path'])
+            job_queue.enqueue(JOB_KIND, {
+                'input_path': session['path'],
+                'filename': session['filename'],
+                'email': session['email'],
+                'base_url': request.host_url,
+                'upload_id': upload_id,
+                'probe': probe
+            }, job_id=job_id, cost=probe['duration'] if probe else None, tenant=tenant_key(session['email']))
+        session = upload_store.get(upload_id)
+    return jsonify({
+        'message': 'File đã được đưa vào hàng đợi xử lý.',
+        'job_id': session['job_id'],
+        'status_url': url_for('job_status', job_id=session['job_id']),
+        'events_url': url_for('job_events', job_id=session['job_id'])
+    }), 202
 
-        return jsonify({'message': 'Kết quả đã được gửi qua email.', 'bilingual_text': bilingual_text})
+# Trạng thái hiện tại của một job
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if not job:
+        return jsonify({'error': 'Không tìm thấy job.'}), 404
+    return jsonify({
+        'job_id': job['id'],
+        'status': job['status'],
+        'stage': job['stage'],
+        'error': job['error'],
+        'result': job['result']
+    })
 
-    else:
-        return jsonify({'error': 'Định dạng file không được hỗ trợ.'}), 400
+# Tiến trình của job dưới dạng Server-Sent Events: bước xử lý và từng phần bản dịch
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    if not job_queue.get(job_id):
+        return jsonify({'error': 'Không tìm thấy job.'}), 404
+    last_event_id = request.headers.get('Last-Event-ID', type=int, default=0)
+    return Response(
+        stream_with_context(event_stream(job_queue, job_id, last_event_id)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+# Số liệu từng bước xử lý cho Prometheus (cộng dồn từ mọi worker trên máy)
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+# Link tải kết quả được gửi qua email khi file quá lớn để đính kèm
+@app.route('/downloads/<token>/<path:filename>', methods=['GET'])
+def download_result(token, filename):
+    return send_from_directory(os.path.join(os.path.abspath(DOWNLOAD_FOLDER), secure_filename(token)), filename,
+                               as_attachment=True)
 
 if __name__ == '__main__':
     app.run(debug=True)
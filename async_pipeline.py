@@ -0,0 +1,175 @@
+import os
+import asyncio
+import subprocess
+from dotenv import load_dotenv
+
+from media import conversion_attempts, parse_probe, pcm_wav_bytes, probe_command
+from metrics import span
+from resumable_upload import wait_for_extraction
+from openai_client import make_async_client
+from transcription import transcribe_audio_cached
+from translation import TRANSLATE_CONCURRENCY, bilingual_segments, translate_segments_async
+from vad import VAD_ENABLED, restore_timestamps, trim_silence
+
+# Đọc cấu hình từ file .env trước khi lấy các biến môi trường bên dưới
+load_dotenv()
+
+# Xử lý nhiều file của một lần upload theo kiểu dây chuyền: file 2 đang chuyển đổi trong khi
+# file 1 đang phiên âm và file 0 đang dịch. Mỗi bước có giới hạn song song riêng.
+CONVERT_CONCURRENCY = int(os.getenv("PIPELINE_CONVERT_CONCURRENCY", str(os.cpu_count() or 1)))
+TRANSCRIBE_CONCURRENCY = int(os.getenv("PIPELINE_TRANSCRIBE_CONCURRENCY", "2"))  # Số file gọi Whisper cùng lúc
+
+# Chạy lệnh ffmpeg/ffprobe mà không chặn event loop
+async def run_command(command):
+    process = await asyncio.create_subprocess_exec(
+        *command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    stdout, stderr = await process.communicate()
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, command, stdout, stderr)
+    return stdout
+
+async def probe_media_async(path):
+    output = await run_command(probe_command(path))
+    return parse_probe(output.decode(), path)
+
+# Giống media.prepare_audio: dùng nguyên file, copy luồng âm thanh hoặc chuyển sang WAV
+async def prepare_audio_async(input_path, output_path, probe, require_pcm=False):
+    attempts = conversion_attempts(input_path, output_path, probe, require_pcm)
+    if not attempts:
+        print(f"File đã đúng định dạng, không cần chuyển đổi: {input_path}")
+        return input_path
+
+    for index, (command, result_path) in enumerate(attempts):
+        try:
+            await run_command(command)
+            print(f"Chuyển đổi thành công: {result_path}")
+            return result_path
+        except subprocess.CalledProcessError as e:
+            if index == len(attempts) - 1:
+                raise
+            print(f"Không copy được luồng âm thanh, chuyển sang mã hóa lại: {e}")
+
+
+class AudioPipeline:
+    """Chạy chuyển đổi -> lọc khoảng lặng -> phiên âm -> dịch -> xuất file cho nhiều file cùng lúc.
+
+    export(transcript, output_stem) ghi Transcript đã dịch và trả về {định dạng: đường dẫn}.
+    on_stage(filename, stage) được gọi mỗi khi một file chuyển sang bước mới.
+    on_segment(filename, index, text) được gọi ngay khi một đoạn dịch xong.
+    Hai callback được gọi trong thread riêng (asyncio.to_thread) nên có thể ghi SQLite.
+    upload_store: file từ upload nối tiếp (có upload_id) dùng phần âm thanh đã trích trong lúc nhận.
+    scratch: JobScratch của job, file trung gian đặt trong thư mục của job (tmpfs nếu còn chỗ).
+    """
+
+    def __init__(self, sync_client, output_dir, export, on_stage=None, on_segment=None, upload_store=None,
+                 scratch=None):
+        self.sync_client = sync_client
+        self.output_dir = output_dir
+        self.export = export
+        self.on_stage = on_stage or (lambda filename, stage: None)
+        self.on_segment = on_segment
+        self.upload_store = upload_store
+        self.scratch = scratch
+
+    # on_stage thường ghi vào hàng đợi SQLite: chạy trong thread để không chặn các file khác
+    async def _set_stage(self, filename, stage):
+        await asyncio.to_thread(self.on_stage, filename, stage)
+
+    # Đường dẫn file trung gian: thư mục tạm của job nếu có, không thì output_dir
+    def _work_path(self, name, expected_bytes):
+        if self.scratch:
+            return self.scratch.fast_path(name, expected_bytes)
+        return os.path.join(self.output_dir, name)
+
+    async def run(self, files):
+        self.client = make_async_client()
+        self.convert_slots = asyncio.Semaphore(max(1, CONVERT_CONCURRENCY))
+        self.transcribe_slots = asyncio.Semaphore(max(1, TRANSCRIBE_CONCURRENCY))
+        self.translate_slots = asyncio.Semaphore(max(1, TRANSLATE_CONCURRENCY))
+        try:
+            # Kết quả theo đúng thứ tự file; lỗi của một file không dừng các file khác
+            return list(await asyncio.gather(*(self.process_file(item) for item in files)))
+        finally:
+            await self.client.close()
+
+    async def process_file(self, item):
+        filename = item['filename']
+        input_path = item.get('input_path')
+        converted = item.get('converted_path')
+        speech_path = None
+        try:
+            # Upload dạng luồng đã được chuyển đổi ngay khi nhận, bỏ qua bước này
+            if not converted and item.get('upload_id') and self.upload_store:
+                converted = await asyncio.to_thread(wait_for_extraction, self.upload_store, item['upload_id'])
+            probe = None
+            if not converted:
+                async with self.convert_slots:
+                    await self._set_stage(filename, 'converting')
+                    with span('convert', file=filename, bytes=os.path.getsize(input_path)) as current:
+                        # Dùng lại kết quả ffprobe đo lúc upload (để xếp lịch) nếu có
+                        probe = item.get('probe') or await probe_media_async(input_path)
+                        current.set(audio_seconds=probe['duration'])
+                        output_path = self._work_path(f"{os.path.splitext(filename)[0]}.wav",
+                                                      pcm_wav_bytes(probe['duration']))
+                        # VAD cần WAV PCM nên khi bật VAD không copy luồng âm thanh nén
+                        converted = await prepare_audio_async(input_path, output_path, probe,
+                                                              require_pcm=VAD_ENABLED)
+
+            # Bỏ các khoảng lặng dài trước khi gửi Whisper, giữ bảng ánh xạ để khôi phục timestamp
+            await self._set_stage(filename, 'trimming')
+            with span('trim', file=filename, bytes=os.path.getsize(converted)) as current:
+                speech_output = self._work_path(f"{os.path.splitext(filename)[0]}_speech.wav",
+                                                os.path.getsize(converted))
+                speech_path, offset_map, vad_stats = await asyncio.to_thread(trim_silence, converted, speech_output)
+                if vad_stats:
+                    current.set(audio_seconds=vad_stats['original_seconds'], kept_seconds=vad_stats['kept_seconds'])
+
+            # Whisper dùng lại đường phiên âm có cache và cắt đoạn song song (chạy trong thread)
+            async with self.transcribe_slots:
+                await self._set_stage(filename, 'transcribing')
+                duration = vad_stats['kept_seconds'] if vad_stats else (probe['duration'] if probe else None)
+                with span('transcribe', file=filename, bytes=os.path.getsize(speech_path),
+                          audio_seconds=duration) as current:
+                    transcript = await asyncio.to_thread(
+                        transcribe_audio_cached, self.sync_client, speech_path, duration=duration
+                    )
+                    current.set(segments=len(transcript) if transcript else 0)
+            if not transcript:
+                raise RuntimeError(f'Lỗi trong quá trình phiên âm âm thanh của file {filename}.')
+            transcript = restore_timestamps(transcript, offset_map)
+
+            await self._set_stage(filename, 'translating')
+            on_result = (lambda index, text: self.on_segment(filename, index, text)) if self.on_segment else None
+            with span('translate', file=filename, segments=len(transcript)):
+                translations = await translate_segments_async(self.client, transcript, self.translate_slots,
+                                                              on_result=on_result)
+
+            await self._set_stage(filename, 'exporting')
+            output_stem = os.path.join(self.output_dir, f"{os.path.splitext(filename)[0]}_result")
+            with span('export', file=filename, segments=len(transcript)) as current:
+                output_paths = await asyncio.to_thread(
+                    self.export, bilingual_segments(transcript, translations), output_stem
+                )
+                current.set(bytes=sum(os.path.getsize(path) for path in output_paths.values()),
+                            formats=','.join(output_paths))
+
+            await self._set_stage(filename, 'done')
+            return {'filename': filename, 'status': 'done', 'output_paths': list(output_paths.values()),
+                    'segments': len(transcript), 'vad': vad_stats}
+        except Exception as e:
+            print(f"Lỗi xử lý file {filename}: {e}")
+            await self._set_stage(filename, 'failed')
+            return {'filename': filename, 'status': 'failed', 'error': str(e)}
+        finally:
+            self._cleanup(input_path, converted, speech_path)
+
+    @staticmethod
+    def _cleanup(*paths):
+        for path in dict.fromkeys(path for path in paths if path):
+            try:
+                if os.path.exists(path):
+                    os.remove(path)
+                    print(f"Đã xóa file tạm: {path}")
+            except OSError as e:
+                print(f"Error deleting files: {e}")
@@ -0,0 +1,194 @@
+"""
+Xử lý hàng loạt cả thư mục bài giảng (không qua giao diện web).
+
+Chuyển đổi ffmpeg chạy trong process pool theo số nhân CPU, các bước gọi API (Whisper, ChatGPT)
+chạy song song với giới hạn riêng. Kết quả ghi ra <thư mục con>/<tên file>_result.docx giống report_audio/,
+kèm phụ đề .srt/.vtt và .json (cấu hình bằng EXPORT_FORMATS).
+Chạy lại cùng lệnh sau khi bị gián đoạn sẽ bỏ qua các file đã có kết quả.
+
+Cách dùng:
+    python batch.py "D:/bai giang/hoc ky 1" --output-dir report_audio
+    python batch.py "recordings/*.mp4" --workers 4 --api-concurrency 8
+"""
+import os
+import sys
+import glob
+import time
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+from media import prepare_audio, probe_media
+from exports import export_segments
+from openai_client import get_client
+from transcription import transcribe_audio_cached
+from translation import bilingual_segments, translate_segments
+from vad import VAD_ENABLED, restore_timestamps, trim_silence
+
+ALLOWED_EXTENSIONS = {'wav', 'mp3', 'flac', 'm4a', 'aac', 'mp4', 'mov', 'avi', 'mkv', 'amsr', 'ogg'}
+WORK_DIR_NAME = ".batch_work"
+
+# Phần đường dẫn trước thành phần glob đầu tiên, ví dụ "recordings/*/*.mp4" -> "recordings";
+# đường dẫn file không có ký tự glob thì lấy thư mục chứa file
+def pattern_root(pattern):
+    parts = pattern.replace('\\', '/').split('/')
+    for index, part in enumerate(parts):
+        if glob.has_magic(part):
+            return os.path.abspath('/'.join(parts[:index]) or '.')
+    return os.path.dirname(os.path.abspath(pattern))
+
+# Liệt kê các file âm thanh/video từ thư mục hoặc mẫu glob.
+# Trả về {đường dẫn tuyệt đối: đường dẫn tương đối so với thư mục gốc của tham số}
+def collect_inputs(patterns):
+    files = {}
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            root = os.path.abspath(pattern)
+            candidates = glob.glob(os.path.join(pattern, '**', '*'), recursive=True)
+        else:
+            root = pattern_root(pattern)
+            candidates = glob.glob(pattern, recursive=True)
+        for path in sorted(candidates):
+            if os.path.isfile(path) and path.rsplit('.', 1)[-1].lower() in ALLOWED_EXTENSIONS:
+                files.setdefault(os.path.abspath(path), os.path.relpath(os.path.abspath(path), root))
+
+    # Hai tham số khác nhau vẫn có thể ra cùng tên tương đối: thêm mã băm ngắn của đường dẫn
+    stems = {}
+    for path, relative in files.items():
+        stems.setdefault(os.path.splitext(relative)[0].lower(), []).append(path)
+    for paths in stems.values():
+        if len(paths) > 1:
+            for path in paths:
+                stem, extension = os.path.splitext(files[path])
+                files[path] = f"{stem}_{hashlib.sha1(path.encode()).hexdigest()[:8]}{extension}"
+    return files
+
+# Kết quả giữ cấu trúc thư mục con của đầu vào: a/lec1.mp4 và b/lec1.mp4 không ghi đè lên nhau
+def result_path(relative_path, output_dir):
+    return os.path.join(output_dir, f"{os.path.splitext(relative_path)[0]}_result.docx")
+
+# Bước CPU (chạy trong process pool): ffprobe, chuyển đổi, lọc khoảng lặng
+def convert_one(input_path, work_dir):
+    started = time.perf_counter()
+    stem = hashlib.sha1(input_path.encode()).hexdigest()[:12]
+    probe = probe_media(input_path)
+    converted = prepare_audio(input_path, os.path.join(work_dir, f"{stem}.wav"), probe, require_pcm=VAD_ENABLED)
+    speech_path, offset_map, vad_stats = trim_silence(converted, os.path.join(work_dir, f"{stem}_speech.wav"))
+    return {
+        'input_path': input_path,
+        'converted': converted,
+        'speech_path': speech_path,
+        'offset_map': offset_map,
+        'duration': probe['duration'],
+        'speech_duration': vad_stats['kept_seconds'] if vad_stats else probe['duration'],
+        'convert_seconds': time.perf_counter() - started,
+    }
+
+# Bước API (chạy trong thread pool): phiên âm, dịch, xuất Word
+def process_converted(client, item, output_path, translate_concurrency):
+    started = time.perf_counter()
+    try:
+        transcript = transcribe_audio_cached(client, item['speech_path'], duration=item['speech_duration'])
+        if not transcript:
+            raise RuntimeError("Whisper không trả về nội dung.")
+        transcript = restore_timestamps(transcript, item['offset_map'])
+        transcribed = time.perf_counter()
+
+        translations = translate_segments(client, transcript, concurrency=translate_concurrency)
+        translated = time.perf_counter()
+
+        # File Word theo mẫu report_audio/; DOCX được ghi sau cùng nên có DOCX nghĩa là đã xuất đủ
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        export_segments(
+            bilingual_segments(transcript, translations),
+            os.path.splitext(output_path)[0],
+            title="Kết Quả Xử Lý Âm Thanh", include_original=True
+        )
+        return {
+            'transcribe_seconds': transcribed - started,
+            'translate_seconds': translated - transcribed,
+            'export_seconds': time.perf_counter() - translated,
+        }
+    finally:
+        for path in {item['converted'], item['speech_path']}:
+            if path != item['input_path'] and os.path.exists(path):
+                os.remove(path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Xử lý hàng loạt file bài giảng thành file Word song ngữ")
+    parser.add_argument('inputs', nargs='+', help="Thư mục hoặc mẫu glob, ví dụ \"recordings/*.mp4\"")
+    parser.add_argument('--output-dir', default='report_audio', help="Thư mục ghi file _result.docx")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Số tiến trình ffmpeg song song")
+    parser.add_argument('--api-concurrency', type=int, default=4, help="Số file gọi API cùng lúc")
+    parser.add_argument('--translate-concurrency', type=int, default=8, help="Số request dịch song song mỗi file")
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    work_dir = os.path.join(args.output_dir, WORK_DIR_NAME)
+    os.makedirs(work_dir, exist_ok=True)
+
+    inputs = collect_inputs(args.inputs)
+    outputs = {path: result_path(relative, args.output_dir) for path, relative in inputs.items()}
+    pending = [path for path in inputs if not os.path.exists(outputs[path])]
+    print(f"Tìm thấy {len(inputs)} file, {len(inputs) - len(pending)} file đã có kết quả sẽ được bỏ qua.")
+    if not pending:
+        return
+
+    client = get_client()
+    started = time.perf_counter()
+    done, failed = [], []
+    totals = {'audio_seconds': 0.0, 'convert_seconds': 0.0, 'transcribe_seconds': 0.0,
+              'translate_seconds': 0.0, 'export_seconds': 0.0}
+
+    with ProcessPoolExecutor(max_workers=max(1, args.workers)) as converters, \
+            ThreadPoolExecutor(max_workers=max(1, args.api_concurrency)) as api_pool:
+        conversions = {converters.submit(convert_one, path, work_dir): path for path in pending}
+        api_jobs = {}
+        for future in as_completed(conversions):
+            path = conversions[future]
+            try:
+                item = future.result()
+            except Exception as e:
+                # Gồm cả BrokenProcessPool: một file lỗi không làm dừng cả lô
+                print(f"[Lỗi chuyển đổi] {path}: {e}")
+                failed.append(path)
+                continue
+            totals['audio_seconds'] += item['duration']
+            totals['convert_seconds'] += item['convert_seconds']
+            api_jobs[api_pool.submit(process_converted, client, item, outputs[path],
+                                     args.translate_concurrency)] = path
+
+        for future in as_completed(api_jobs):
+            path = api_jobs[future]
+            try:
+                timings = future.result()
+            except Exception as e:
+                print(f"[Lỗi xử lý] {path}: {e}")
+                failed.append(path)
+                continue
+            for name, seconds in timings.items():
+                totals[name] += seconds
+            done.append(path)
+            print(f"[{len(done) + len(failed)}/{len(pending)}] Xong: {outputs[path]}")
+
+    try:
+        os.rmdir(work_dir)
+    except OSError:
+        pass  # Còn file tạm của lần chạy khác
+
+    elapsed = time.perf_counter() - started
+    audio_minutes = totals['audio_seconds'] / 60
+    print("\nTổng kết:")
+    print(f"  Thành công: {len(done)}, lỗi: {len(failed)}, bỏ qua: {len(inputs) - len(pending)}")
+    print(f"  Thời gian chạy: {elapsed:.1f}s cho {audio_minutes:.1f} phút âm thanh "
+          f"({audio_minutes / max(elapsed / 60, 1e-9):.1f} phút âm thanh / phút)")
+    for name in ('convert_seconds', 'transcribe_seconds', 'translate_seconds', 'export_seconds'):
+        print(f"  Tổng {name.replace('_seconds', '')}: {totals[name]:.1f}s")
+    if failed:
+        print("  File lỗi (chạy lại lệnh để thử lại):")
+        for path in failed:
+            print(f"    {path}")
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
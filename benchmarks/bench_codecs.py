@@ -0,0 +1,77 @@
+"""
+So sánh các định dạng gửi Whisper (WAV, FLAC, Opus) trên các file mẫu:
+dung lượng upload, thời gian mã hóa, độ trễ API và độ lệch bản phiên âm so với WAV
+(WAV quá lớn cho một request thì so với codec đầu tiên gửi được, tên codec tham chiếu được in ra).
+
+Cách dùng:
+    python benchmarks/bench_codecs.py bai_giang_1.mp4 bai_giang_2.wav
+    python benchmarks/bench_codecs.py --no-api bai_giang_1.mp4   # chỉ đo dung lượng
+"""
+import os
+import sys
+import time
+import difflib
+import argparse
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+from openai import OpenAI
+
+from media import UPLOAD_CODECS, WAV_OUTPUT_ARGS, encode_audio
+from transcription import WHISPER_MAX_BYTES, get_duration, transcribe_file
+
+# Tỉ lệ từ khác nhau giữa hai bản phiên âm (xấp xỉ WER so với bản WAV)
+def word_difference(reference, candidate):
+    ratio = difflib.SequenceMatcher(None, reference.lower().split(), candidate.lower().split()).ratio()
+    return 1.0 - ratio
+
+def bench_file(client, input_path, work_dir):
+    wav_path = os.path.join(work_dir, "source.wav")
+    subprocess.run(['ffmpeg', '-y', '-v', 'error', '-i', input_path, *WAV_OUTPUT_ARGS, wav_path], check=True)
+    duration = get_duration(wav_path)
+    print(f"\n{input_path} ({duration / 60:.1f} phút)")
+    print(f"{'codec':<6} {'bytes':>12} {'MB/phút':>8} {'1 request':>10} {'mã hóa(s)':>10} {'API(s)':>8} {'lệch từ':>8}")
+
+    reference_text = reference_codec = None
+    for codec, spec in UPLOAD_CODECS.items():
+        encoded_path = os.path.join(work_dir, f"encoded{spec['extension']}")
+        started = time.perf_counter()
+        encode_audio(wav_path, encoded_path, codec)
+        encode_seconds = time.perf_counter() - started
+        size = os.path.getsize(encoded_path)
+        fits = size <= WHISPER_MAX_BYTES
+
+        api_seconds = difference = None
+        if client and fits:
+            started = time.perf_counter()
+            text = transcribe_file(client, encoded_path).text
+            api_seconds = time.perf_counter() - started
+            if reference_text is None:
+                reference_text, reference_codec = text, codec
+            difference = word_difference(reference_text, text)
+
+        print(f"{codec:<6} {size:>12} {size / 1024 / 1024 / (duration / 60):>8.2f} {'có' if fits else 'không':>10} "
+              f"{encode_seconds:>10.2f} {api_seconds if api_seconds is not None else float('nan'):>8.2f} "
+              f"{difference if difference is not None else float('nan'):>8.1%}")
+        os.remove(encoded_path)
+
+    if reference_codec and reference_codec != 'wav':
+        print(f"WAV quá lớn cho một request: cột 'lệch từ' so với bản phiên âm {reference_codec}, không phải WAV")
+
+def main():
+    parser = argparse.ArgumentParser(description="So sánh định dạng âm thanh gửi Whisper API")
+    parser.add_argument('files', nargs='+', help="Các file âm thanh/video mẫu")
+    parser.add_argument('--no-api', action='store_true', help="Không gọi Whisper, chỉ đo dung lượng và thời gian mã hóa")
+    args = parser.parse_args()
+
+    load_dotenv()
+    client = None if args.no_api else OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    for input_path in args.files:
+        with tempfile.TemporaryDirectory() as work_dir:
+            bench_file(client, input_path, work_dir)
+
+if __name__ == '__main__':
+    main()
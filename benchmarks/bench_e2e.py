@@ -0,0 +1,428 @@
+"""
+Benchmark đầu-cuối cho /upload: chạy ứng dụng (Flask hoặc gunicorn qua wsgi.py) với server OpenAI giả lập
+và SMTP sink cục bộ, không tốn tiền API. Đo độ trễ từng bước (p50/p90/p99) theo sự kiện SSE của job,
+thông lượng, RSS lớn nhất của cây tiến trình server và dung lượng đĩa tạm lớn nhất.
+
+File mẫu (âm thanh có đoạn lặng xen kẽ, video mp4) được tạo một lần và giữ trong benchmarks/fixtures/.
+Mỗi kịch bản (độ dài x số upload đồng thời) chạy trên một server và thư mục làm việc mới.
+
+Cách dùng:
+    python benchmarks/bench_e2e.py --durations 1,15 --concurrency 1,4
+    python benchmarks/bench_e2e.py --durations 1,15,60,180 --format wav,mp4 --server gunicorn --workers 2
+    python benchmarks/bench_e2e.py --save-baseline benchmarks/baselines/default.json
+    python benchmarks/bench_e2e.py --compare benchmarks/baselines/default.json --tolerance 0.2  # lỗi nếu chậm hơn
+    # Tải hỗn hợp (3 file 15 phút gửi trước, 6 file 1 phút ngay sau), so sánh lập lịch fair và fifo:
+    python benchmarks/bench_e2e.py --mix 15x3,1x6 --scheduler fair,fifo
+"""
+import os
+import sys
+import json
+import time
+import wave
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from mock_openai import make_server
+from smtp_sink import make_sink
+
+STAGES = ['upload', 'queued', 'converting', 'trimming', 'transcribing', 'translating', 'exporting', 'emailing']
+SAMPLE_RATE = 16000
+SAMPLE_INTERVAL = 0.2          # Chu kỳ đo RSS và dung lượng đĩa (giây)
+EMAIL_WAIT_SECONDS = 60
+MIX_STAGGER_SECONDS = 0.3      # Tải hỗn hợp: file dài được gửi trước, mỗi upload cách nhau chừng này
+# Chỉ coi là chậm đi khi vượt cả tỉ lệ cho phép lẫn ngưỡng tuyệt đối (tránh nhiễu ở số đo rất nhỏ)
+MIN_REGRESSION_SECONDS = 0.5
+MIN_REGRESSION_MB = 20
+
+
+# Âm thanh giả lập lời nói: các đợt nhiễu có biên độ dao động xen kẽ khoảng lặng (để VAD có việc làm).
+# Ghi theo từng khối một phút nên file 180 phút không cần nằm trong RAM.
+def write_speech_wav(path, minutes, seed):
+    rng = np.random.default_rng(seed)
+    block = SAMPLE_RATE * 60
+    with wave.open(path, 'wb') as output:
+        output.setnchannels(1)
+        output.setsampwidth(2)
+        output.setframerate(SAMPLE_RATE)
+        for _ in range(int(minutes)):
+            samples = rng.normal(0, 1, block)
+            envelope = np.zeros(block)
+            position = 0
+            while position < block:
+                speech = int(rng.uniform(2, 8) * SAMPLE_RATE)
+                pause = int(rng.uniform(0.3, 2.5) * SAMPLE_RATE)
+                length = min(speech, block - position)
+                envelope[position:position + length] = 0.5 + 0.5 * np.sin(np.linspace(0, 20 * np.pi, length))
+                position += speech + pause
+            output.writeframes((samples * envelope * 3000 + rng.normal(0, 30, block)).astype('<i2').tobytes())
+
+def make_fixture(fixture_dir, minutes, kind, seed):
+    os.makedirs(fixture_dir, exist_ok=True)
+    wav_path = os.path.join(fixture_dir, f"speech_{minutes}m_{seed}.wav")
+    if not os.path.exists(wav_path):
+        write_speech_wav(wav_path + ".tmp", minutes, seed)
+        os.replace(wav_path + ".tmp", wav_path)
+    if kind == 'wav':
+        return wav_path
+
+    video_path = os.path.join(fixture_dir, f"lecture_{minutes}m_{seed}.mp4")
+    if not os.path.exists(video_path):
+        subprocess.run([
+            'ffmpeg', '-y', '-v', 'error',
+            '-f', 'lavfi', '-i', 'color=c=gray:s=640x360:r=5',
+            '-i', wav_path, '-shortest',
+            '-c:v', 'libx264', '-preset', 'ultrafast', '-c:a', 'aac', '-b:a', '96k',
+            video_path + ".tmp.mp4"
+        ], check=True)
+        os.replace(video_path + ".tmp.mp4", video_path)
+    return video_path
+
+
+# Đo RSS tổng của server và mọi tiến trình con (gunicorn worker, ffmpeg) cùng dung lượng thư mục làm việc
+class ResourceSampler(threading.Thread):
+    def __init__(self, pid, work_dir):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.work_dir = work_dir
+        self.peak_rss = 0
+        self.peak_disk = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(SAMPLE_INTERVAL):
+            self.peak_rss = max(self.peak_rss, sum(_rss_bytes(pid) for pid in _process_tree(self.pid)))
+            self.peak_disk = max(self.peak_disk, _directory_size(self.work_dir))
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+def _process_tree(root_pid):
+    children = {}
+    for name in os.listdir('/proc'):
+        if name.isdigit():
+            try:
+                with open(f'/proc/{name}/stat') as stat_file:
+                    parent = int(stat_file.read().rsplit(')', 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(parent, []).append(int(name))
+    tree, pending = [], [root_pid]
+    while pending:
+        pid = pending.pop()
+        tree.append(pid)
+        pending.extend(children.get(pid, []))
+    return tree
+
+def _rss_bytes(pid):
+    try:
+        with open(f'/proc/{pid}/status') as status_file:
+            for line in status_file:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+def _directory_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_app(args, work_dir, port, openai_port, smtp_port, scheduler):
+    env = dict(os.environ,
+               JOB_SCHEDULER=scheduler,
+               PYTHONPATH=REPO_DIR,
+               OPENAI_API_KEY='bench', OPENAI_BASE_URL=f'http://127.0.0.1:{openai_port}/v1',
+               SMTP_SERVER='127.0.0.1', SMTP_PORT=str(smtp_port), SMTP_STARTTLS='0',
+               SMTP_USERNAME='', SMTP_PASSWORD='',
+               JOB_EVENT_POLL_INTERVAL='0.05',  # Mốc thời gian từng bước đọc từ SSE nên cần độ phân giải cao
+               JOBS_DB=os.path.join(work_dir, 'jobs.sqlite3'),
+               RATE_LIMIT_DB=os.path.join(work_dir, 'ratelimit.sqlite3'),
+               TRANSCRIPT_CACHE_DIR=os.path.join(work_dir, 'transcripts'),
+               TRANSLATION_MEMORY_DB=os.path.join(work_dir, 'translation_memory.sqlite3'),
+               DOWNLOAD_FOLDER=os.path.join(work_dir, 'downloads'))
+    if args.server == 'gunicorn':
+        # gunicorn.conf.py của dự án (worker gthread cho SSE); chạy trong work_dir nên phải chỉ rõ đường dẫn
+        command = [sys.executable, '-m', 'gunicorn', '-c', os.path.join(REPO_DIR, 'gunicorn.conf.py'),
+                   '-w', str(args.workers), '--threads', '16', '--timeout', '0', '-b', f'127.0.0.1:{port}', 'wsgi:app']
+    else:
+        command = [sys.executable, '-c',
+                   f"from app import app; app.run(host='127.0.0.1', port={port}, threaded=True)"]
+    process = subprocess.Popen(command, cwd=work_dir, env=env,
+                               stdout=open(os.path.join(work_dir, 'server.log'), 'wb'), stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server dừng khi khởi động, xem {work_dir}/server.log")
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            connection.request('GET', '/')
+            connection.getresponse().read()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("Server không khởi động được trong 60 giây")
+
+
+# Upload dạng luồng một file rồi theo dõi sự kiện SSE tới khi job xong; trả về thời điểm của từng bước
+def run_upload(port, path, email, delay=0.0):
+    time.sleep(delay)
+    timings = {'upload': time.time()}
+    query = urllib.parse.urlencode({'filename': os.path.basename(path), 'email': email})
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=3600)
+    with open(path, 'rb') as upload:
+        connection.request('POST', f'/upload/stream?{query}', body=upload,
+                           headers={'Content-Type': 'application/octet-stream',
+                                    'Content-Length': str(os.path.getsize(path))})
+        response = connection.getresponse()
+        data = json.loads(response.read())
+    if response.status != 202:
+        return {'status': 'failed', 'error': data.get('error'), 'timings': timings}
+    timings['queued'] = time.time()
+
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=3600)
+    connection.request('GET', data['events_url'])
+    response = connection.getresponse()
+    event = None
+    while True:
+        line = response.readline()
+        if not line:
+            return {'status': 'failed', 'error': 'Mất kết nối SSE', 'timings': timings}
+        line = line.decode().rstrip('\r\n')
+        if line.startswith('event: '):
+            event = line[len('event: '):]
+        elif line.startswith('data: '):
+            payload = json.loads(line[len('data: '):])
+            if event == 'stage':
+                timings.setdefault(payload['stage'].split(':')[0], time.time())
+            elif event in ('done', 'failed'):
+                timings['finished'] = time.time()
+                return {'status': event, 'error': payload.get('error'), 'timings': timings}
+
+# Độ dài từng bước = thời điểm bước kế tiếp bắt đầu - thời điểm bước này bắt đầu
+def stage_durations(timings):
+    marks = [(stage, timings[stage]) for stage in STAGES if stage in timings] + [('finished', timings['finished'])]
+    return {stage: marks[index + 1][1] - started for index, (stage, started) in enumerate(marks[:-1])}
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))]
+
+def summarize(values):
+    if not values:
+        return None
+    return {'p50': round(percentile(values, 0.5), 3), 'p90': round(percentile(values, 0.9), 3),
+            'p99': round(percentile(values, 0.99), 3), 'max': round(max(values), 3)}
+
+# durations: độ dài (phút) của từng upload khi chạy tải hỗn hợp, mặc định mọi upload dài minutes phút
+def run_scenario(args, minutes, kind, concurrency, fixtures, scheduler, durations=None, stagger=0.0):
+    durations = durations or [minutes] * concurrency
+    work_dir = tempfile.mkdtemp(prefix=f'bench_{minutes}m_{kind}_c{concurrency}_')
+    openai_server = make_server(free_port(), args.latency, args.jitter, args.error_rate, args.rate_limit_rate,
+                                args.retry_after, args.token_delay, unique_text=True)
+    smtp_server = make_sink(free_port())
+    for server in (openai_server, smtp_server):
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    port = free_port()
+    app_process = start_app(args, work_dir, port, openai_server.server_address[1], smtp_server.server_address[1],
+                            scheduler)
+    sampler = ResourceSampler(app_process.pid, work_dir)
+    sampler.start()
+    try:
+        started = time.time()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            runs = list(pool.map(
+                lambda index: run_upload(port, fixtures[index], f'bench{index}@example.com', index * stagger),
+                range(concurrency)
+            ))
+        elapsed = time.time() - started
+
+        # Thư được gửi từ worker "email" sau khi job xong: chờ SMTP sink nhận đủ
+        deadline = time.time() + EMAIL_WAIT_SECONDS
+        done = [index for index, run in enumerate(runs) if run['status'] == 'done']
+        while time.time() < deadline and len(smtp_server.messages) < len(done):
+            time.sleep(0.2)
+    finally:
+        sampler.stop()
+        app_process.terminate()
+        app_process.wait(timeout=30)
+        openai_server.shutdown()
+        smtp_server.shutdown()
+
+    delivered = {recipient: message['time'] for message in smtp_server.messages
+                 for recipient in message['recipients']}
+    stages = {stage: [] for stage in STAGES}
+    totals, email_latency, by_minutes = [], [], {}
+    for index, run in enumerate(runs):
+        if run['status'] != 'done':
+            print(f"  Job {index} lỗi: {run['error']}")
+            continue
+        for stage, seconds in stage_durations(run['timings']).items():
+            stages[stage].append(seconds)
+        totals.append(run['timings']['finished'] - run['timings']['upload'])
+        by_minutes.setdefault(durations[index], []).append(totals[-1])
+        if f'bench{index}@example.com' in delivered:
+            email_latency.append(delivered[f'bench{index}@example.com'] - run['timings']['finished'])
+
+    return {
+        'minutes': minutes,
+        'format': kind,
+        'concurrency': concurrency,
+        'scheduler': scheduler,
+        'succeeded': len(totals),
+        'failed': concurrency - len(totals),
+        'emails': len(delivered),
+        'elapsed_seconds': round(elapsed, 2),
+        'audio_minutes_per_minute': round(sum(durations[index] for index, run in enumerate(runs)
+                                              if run['status'] == 'done') / max(elapsed / 60, 1e-9), 2),
+        'total': summarize(totals),
+        'total_by_minutes': {str(length): summarize(values) for length, values in sorted(by_minutes.items())},
+        'stages': {stage: summarize(values) for stage, values in stages.items() if values},
+        'email_delivery': summarize(email_latency),
+        'peak_rss_mb': round(sampler.peak_rss / 1024 / 1024, 1),
+        'peak_disk_mb': round(sampler.peak_disk / 1024 / 1024, 1),
+        'openai_requests': dict(openai_server.RequestHandlerClass.stats),
+        'work_dir': work_dir,
+    }
+
+def print_result(result):
+    print(f"\n== {result['minutes']} phút {result['format']}, {result['concurrency']} upload đồng thời, "
+          f"lập lịch {result['scheduler']} ==")
+    print(f"  Thành công {result['succeeded']}, lỗi {result['failed']}, email {result['emails']}; "
+          f"{result['elapsed_seconds']}s, {result['audio_minutes_per_minute']} phút âm thanh / phút")
+    print(f"  RSS lớn nhất {result['peak_rss_mb']} MB, đĩa tạm lớn nhất {result['peak_disk_mb']} MB")
+    print(f"  {'bước':<14} {'p50':>8} {'p90':>8} {'p99':>8}")
+    rows = list(result['stages'].items()) + [('tổng', result['total']), ('gửi email', result['email_delivery'])]
+    if len(result['total_by_minutes']) > 1:
+        rows += [(f'tổng {length} phút', stats) for length, stats in result['total_by_minutes'].items()]
+    for name, stats in rows:
+        if stats:
+            print(f"  {name:<14} {stats['p50']:>8.2f} {stats['p90']:>8.2f} {stats['p99']:>8.2f}")
+
+def scenario_key(result):
+    return f"{result['minutes']}m-{result['format']}-c{result['concurrency']}-{result.get('scheduler', 'fifo')}"
+
+# So với baseline: trả về danh sách các chỉ số chậm/tốn hơn quá mức cho phép
+def compare(results, baseline, tolerance):
+    regressions = []
+    previous = {scenario_key(result): result for result in baseline['results']}
+    for result in results:
+        old = previous.get(scenario_key(result))
+        if not old:
+            continue
+        metrics = [('total p50', (result['total'] or {}).get('p50'), (old['total'] or {}).get('p50'),
+                    MIN_REGRESSION_SECONDS)]
+        for stage, stats in result['stages'].items():
+            if stage in old['stages'] and stats:
+                metrics.append((f'{stage} p50', stats['p50'], old['stages'][stage]['p50'], MIN_REGRESSION_SECONDS))
+        metrics.append(('peak RSS MB', result['peak_rss_mb'], old['peak_rss_mb'], MIN_REGRESSION_MB))
+        metrics.append(('peak disk MB', result['peak_disk_mb'], old['peak_disk_mb'], MIN_REGRESSION_MB))
+        for name, new_value, old_value, minimum in metrics:
+            if new_value is None or old_value is None:
+                continue
+            if new_value > old_value * (1 + tolerance) and new_value - old_value > minimum:
+                regressions.append(f"{scenario_key(result)} {name}: {old_value} -> {new_value}")
+        if result['failed'] > old['failed']:
+            regressions.append(f"{scenario_key(result)} số job lỗi: {old['failed']} -> {result['failed']}")
+    return regressions
+
+def parse_list(value, cast=str):
+    return [cast(item) for item in value.split(',') if item.strip()]
+
+# Tải hỗn hợp: file dài gửi trước rồi tới file ngắn, để so thời gian hoàn thành của file ngắn giữa các cách lập lịch
+def run_mix(args, kind, scheduler):
+    groups = [tuple(int(part) for part in item.split('x')) for item in parse_list(args.mix)]
+    durations = [minutes for minutes, count in sorted(groups, reverse=True) for _ in range(count)]
+    fixtures = [make_fixture(args.fixtures_dir, minutes, kind, seed) for seed, minutes in enumerate(durations)]
+    label = '+'.join(f'{minutes}x{count}' for minutes, count in groups)
+    return run_scenario(args, label, kind, len(durations), fixtures, scheduler, durations, MIX_STAGGER_SECONDS)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark đầu-cuối /upload với OpenAI và SMTP giả lập")
+    parser.add_argument('--durations', default='1,15,60,180', help="Độ dài file mẫu (phút), cách nhau bởi dấu phẩy")
+    parser.add_argument('--concurrency', default='1,4', help="Số upload đồng thời cho mỗi kịch bản")
+    parser.add_argument('--format', default='wav', help="Loại file mẫu: wav, mp4")
+    parser.add_argument('--mix', help="Tải hỗn hợp độ_dài x số_file, ví dụ 15x3,1x6 (bỏ qua --durations/--concurrency)")
+    parser.add_argument('--scheduler', default='fair', help="Cách lập lịch hàng đợi: fair, fifo (nhiều giá trị để so sánh)")
+    parser.add_argument('--server', choices=['flask', 'gunicorn'], default='flask')
+    parser.add_argument('--workers', type=int, default=2, help="Số worker gunicorn")
+    parser.add_argument('--fixtures-dir', default=os.path.join(BENCH_DIR, 'fixtures'))
+    parser.add_argument('--latency', type=float, default=0.2, help="Độ trễ trung bình của API giả lập (giây)")
+    parser.add_argument('--jitter', type=float, default=0.05)
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Tỉ lệ lỗi 500 của API giả lập")
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help="Tỉ lệ lỗi 429 của API giả lập")
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--token-delay', type=float, default=0.0)
+    parser.add_argument('--output', help="Ghi toàn bộ kết quả ra file JSON")
+    parser.add_argument('--save-baseline', help="Lưu kết quả làm baseline")
+    parser.add_argument('--compare', help="So với baseline, thoát mã 1 nếu chậm hơn quá --tolerance")
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+
+    results = []
+    for scheduler in parse_list(args.scheduler):
+        for kind in parse_list(args.format):
+            if args.mix:
+                results.append(run_mix(args, kind, scheduler))
+                print_result(results[-1])
+                continue
+            for minutes in parse_list(args.durations, int):
+                for concurrency in parse_list(args.concurrency, int):
+                    # Mỗi upload đồng thời dùng một bản ghi khác nhau để không trúng cache phiên âm của nhau
+                    fixtures = [make_fixture(args.fixtures_dir, minutes, kind, seed) for seed in range(concurrency)]
+                    result = run_scenario(args, minutes, kind, concurrency, fixtures, scheduler)
+                    print_result(result)
+                    results.append(result)
+
+    report = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'server': args.server,
+        'mock': {'latency': args.latency, 'jitter': args.jitter, 'error_rate': args.error_rate,
+                 'rate_limit_rate': args.rate_limit_rate},
+        'results': results,
+    }
+    for path in (args.output, args.save_baseline):
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as output:
+                json.dump(report, output, ensure_ascii=False, indent=2)
+            print(f"\nĐã ghi kết quả: {path}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+        if regressions:
+            print("\nChậm hơn baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("\nKhông có chỉ số nào chậm hơn baseline.")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Đo thời gian và bộ nhớ của bước xuất kết quả (DOCX, SRT, VTT, JSON) với bản ghi rất dài,
+so với cách cũ (ghép bản dịch thành một chuỗi rồi tách dòng để ghi Word).
+
+Cách dùng:
+    python benchmarks/bench_export.py                 # 10.000 đoạn
+    python benchmarks/bench_export.py --segments 50000
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from docx import Document
+
+from exports import WRITERS, export_segments
+from transcript import Segment, Transcript, format_timestamp
+
+# Tạo các đoạn giả lập dài ~5 giây, câu tiếng Việt và tiếng Anh độ dài thực tế
+def make_segments(count):
+    return Transcript(Segment(
+        index * 5.0,
+        index * 5.0 + 4.8,
+        f"Hôm nay chúng ta sẽ học về thì hiện tại hoàn thành, câu số {index + 1}.",
+        en=f"Today we will learn about the present perfect tense, sentence number {index + 1}.",
+    ) for index in range(count))
+
+# Cách xuất cũ: ghép thành một chuỗi lớn rồi tách dòng, mỗi dòng một đoạn văn
+def legacy_export(segments, output_file):
+    bilingual_text = "\n".join(
+        f"-  {format_timestamp(segment.end)}: {segment.text}\n"
+        f"-> {format_timestamp(segment.end)}: {segment.en}" for segment in segments
+    )
+    document = Document()
+    document.add_heading("Bản Dịch Song Ngữ", level=1)
+    for line in bilingual_text.split('\n'):
+        if line.strip():
+            document.add_paragraph(line)
+    document.save(output_file)
+    return {'docx': output_file}
+
+def measure(name, export):
+    tracemalloc.start()
+    started = time.perf_counter()
+    paths = export()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    size = sum(os.path.getsize(path) for path in paths.values())
+    print(f"{name:<14} {elapsed:>9.2f} {peak / 1024 / 1024:>12.1f} {size / 1024:>10.0f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Đo hiệu năng bước xuất kết quả")
+    parser.add_argument('--segments', type=int, default=10000, help="Số đoạn trong bản ghi giả lập")
+    args = parser.parse_args()
+
+    segments = make_segments(args.segments)
+    print(f"{args.segments} đoạn")
+    print(f"{'định dạng':<14} {'giây':>9} {'bộ nhớ(MB)':>12} {'KB':>10}")
+    with tempfile.TemporaryDirectory() as work_dir:
+        measure('docx (cũ)', lambda: legacy_export(segments, os.path.join(work_dir, 'legacy.docx')))
+        for name in WRITERS:
+            measure(name, lambda: export_segments(segments, os.path.join(work_dir, name), formats=[name]))
+        measure('tất cả', lambda: export_segments(segments, os.path.join(work_dir, 'all'), formats=list(WRITERS)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+So sánh thông lượng các backend phiên âm (Whisper API và faster-whisper trên CPU) trên cùng file âm thanh:
+thời gian mỗi lần, hệ số thời gian thực (phút âm thanh / phút chạy), thông lượng khi chạy song song
+và độ lệch bản phiên âm so với backend đầu tiên. Không dùng cache bản phiên âm.
+
+Cách dùng:
+    python benchmarks/bench_transcribe.py bai_giang_1.mp4 --backends api,local --parallel 4
+    # Dùng server giả lập thay cho API thật:
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 OPENAI_API_KEY=test python benchmarks/bench_transcribe.py mau.wav
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_codecs import word_difference
+from local_whisper import load_model, local_model_id
+from media import WAV_OUTPUT_ARGS, probe_media
+from openai_client import get_client
+from transcription import select_backends
+
+def bench_backend(backend, wav_path, duration, runs, parallel):
+    timings, transcript = [], None
+    for _ in range(runs):
+        started = time.perf_counter()
+        transcript = backend.transcribe(wav_path, duration)
+        timings.append(time.perf_counter() - started)
+
+    # Nhiều file cùng lúc: đo số phút âm thanh xử lý được mỗi phút
+    throughput = None
+    if parallel > 1:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=parallel) as pool:
+            list(pool.map(lambda _: backend.transcribe(wav_path, duration), range(parallel)))
+        throughput = parallel * duration / (time.perf_counter() - started)
+    return min(timings), sum(timings) / len(timings), throughput, transcript
+
+def bench_file(client, input_path, backend_names, runs, parallel, work_dir):
+    # Cùng đầu vào cho mọi backend: WAV 16 kHz mono như pipeline sau bước chuyển đổi
+    wav_path = os.path.join(work_dir, "source.wav")
+    subprocess.run(['ffmpeg', '-y', '-v', 'error', '-i', input_path, *WAV_OUTPUT_ARGS, wav_path], check=True)
+    duration = probe_media(wav_path)['duration']
+    print(f"\n{input_path} ({duration / 60:.1f} phút)")
+    print(f"{'backend':<8} {'nhanh nhất(s)':>13} {'trung bình(s)':>13} {'x thời gian thực':>16} "
+          f"{'song song x':>11} {'số đoạn':>8} {'lệch từ':>8}")
+
+    reference_text = None
+    for name in backend_names:
+        backend = select_backends(client, name)[0]
+        best, mean, throughput, transcript = bench_backend(backend, wav_path, duration, runs, parallel)
+        if reference_text is None:
+            reference_text = transcript.text
+        difference = word_difference(reference_text, transcript.text)
+        print(f"{name:<8} {best:>13.2f} {mean:>13.2f} {duration / best:>16.1f} "
+              f"{throughput if throughput is not None else float('nan'):>11.1f} {len(transcript):>8} "
+              f"{difference:>8.1%}")
+
+def main():
+    parser = argparse.ArgumentParser(description="So sánh thông lượng các backend phiên âm")
+    parser.add_argument('files', nargs='+', help="Các file âm thanh/video mẫu")
+    parser.add_argument('--backends', default='api,local', help="Danh sách backend, cách nhau bởi dấu phẩy")
+    parser.add_argument('--runs', type=int, default=1, help="Số lần chạy tuần tự mỗi backend")
+    parser.add_argument('--parallel', type=int, default=1, help="Số file phiên âm cùng lúc khi đo thông lượng")
+    args = parser.parse_args()
+
+    backend_names = [name.strip() for name in args.backends.split(',') if name.strip()]
+    if 'local' in backend_names:
+        # Thời gian nạp model chỉ tốn một lần mỗi worker, không tính vào từng lần phiên âm
+        started = time.perf_counter()
+        load_model()
+        print(f"Nạp {local_model_id()}: {time.perf_counter() - started:.1f}s")
+
+    client = get_client() if 'api' in backend_names else None
+    for input_path in args.files:
+        with tempfile.TemporaryDirectory() as work_dir:
+            bench_file(client, input_path, backend_names, args.runs, args.parallel, work_dir)
+
+if __name__ == '__main__':
+    main()
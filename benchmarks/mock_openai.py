@@ -0,0 +1,221 @@
+"""
+Server giả lập OpenAI API (Whisper + Chat Completions) để thử nghiệm và đo hiệu năng
+mà không tốn tiền API. Có thể cấu hình độ trễ, tỉ lệ lỗi 5xx và tỉ lệ 429 kèm Retry-After.
+Request dịch theo nhóm (JSON) được trả lời đúng định dạng; --missing-rate bỏ bớt đoạn để thử đường dịch lại.
+Prompt cache được mô phỏng như API thật: tiền tố (mọi tin nhắn trừ tin cuối) đã gặp và dài từ 1024 token
+được báo trong usage.prompt_tokens_details.cached_tokens.
+
+Cách dùng:
+    python benchmarks/mock_openai.py --port 8001 --latency 0.5 --rate-limit-rate 0.1
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 OPENAI_API_KEY=test python app.py
+"""
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SEGMENT_SECONDS = 5.0         # Mỗi segment giả lập dài 5 giây
+BYTES_PER_SEGMENT = 40000     # Ước lượng số segment theo dung lượng file gửi lên
+CACHE_MIN_TOKENS = 1024       # Tiền tố ngắn hơn không được cache
+CACHE_STEP_TOKENS = 128       # Phần được cache tăng theo từng khối 128 token
+
+_seen_prefixes = set()
+_seen_prefixes_lock = threading.Lock()
+
+# Số token tiền tố trúng cache; lần đầu gặp một tiền tố thì chỉ ghi nhớ lại
+def cached_prefix_tokens(messages):
+    prefix = "".join(message.get('content', '') for message in messages[:-1])
+    tokens = len(prefix) // 4
+    if tokens < CACHE_MIN_TOKENS:
+        return 0
+    with _seen_prefixes_lock:
+        if prefix not in _seen_prefixes:
+            _seen_prefixes.add(prefix)
+            return 0
+    return CACHE_MIN_TOKENS + (tokens - CACHE_MIN_TOKENS) // CACHE_STEP_TOKENS * CACHE_STEP_TOKENS
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Giữ kết nối để thử connection pooling
+    config = None
+    stats = None
+    stats_lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle(self):
+        try:
+            super().handle()
+        except ConnectionResetError:
+            pass  # Client đóng kết nối keep-alive khi tắt
+
+    def _count(self, name):
+        with self.stats_lock:
+            self.stats[name] = self.stats.get(name, 0) + 1
+
+    def _send_json(self, status, body, headers=None):
+        data = json.dumps(body, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    # Trả lời dạng stream (stream=True): từng từ là một chunk SSE, kết thúc bằng [DONE].
+    # include_usage: thêm chunk cuối không có choices, chỉ mang usage (như stream_options của API thật)
+    def _send_stream(self, completion, include_usage=False):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        content = completion['choices'][0]['message']['content']
+        words = content.split(' ')
+        for index, word in enumerate(words):
+            chunk = {
+                'id': completion['id'],
+                'object': 'chat.completion.chunk',
+                'created': completion['created'],
+                'model': completion['model'],
+                'choices': [{'index': 0, 'delta': {'content': word if index == 0 else ' ' + word},
+                             'finish_reason': None}],
+            }
+            self._write_chunk(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode())
+            time.sleep(self.config.token_delay)
+        if include_usage:
+            chunk = {'id': completion['id'], 'object': 'chat.completion.chunk', 'created': completion['created'],
+                     'model': completion['model'], 'choices': [], 'usage': completion['usage']}
+            self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path == '/stats':
+            with self.stats_lock:
+                self._send_json(200, dict(self.stats))
+        else:
+            self._send_json(404, {'error': {'message': 'not found'}})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self._count('requests')
+
+        # Mô phỏng lỗi trước khi xử lý
+        roll = random.random()
+        if roll < self.config.rate_limit_rate:
+            self._count('rate_limited')
+            return self._send_json(429, {'error': {'message': 'Rate limit reached', 'type': 'requests'}},
+                                   {'Retry-After': str(self.config.retry_after)})
+        if roll < self.config.rate_limit_rate + self.config.error_rate:
+            self._count('errors')
+            return self._send_json(500, {'error': {'message': 'Internal server error'}})
+
+        time.sleep(max(0.0, random.gauss(self.config.latency, self.config.jitter)))
+
+        if self.path.endswith('/audio/transcriptions'):
+            self._count('transcriptions')
+            return self._send_json(200, self._transcription(len(body), self.stats['transcriptions']))
+        if self.path.endswith('/chat/completions'):
+            self._count('chat_completions')
+            request = json.loads(body or b'{}')
+            if request.get('stream'):
+                include_usage = (request.get('stream_options') or {}).get('include_usage', False)
+                return self._send_stream(self._chat_completion(request, self.config.missing_rate), include_usage)
+            return self._send_json(200, self._chat_completion(request, self.config.missing_rate))
+        self._send_json(404, {'error': {'message': 'not found'}})
+
+    # unique_text: thêm số thứ tự request vào câu để các file khác nhau không trúng bộ nhớ dịch của nhau
+    def _transcription(self, size, number):
+        count = max(1, size // BYTES_PER_SEGMENT)
+        suffix = f' (bản {number})' if self.config.unique_text else ''
+        segments = [{
+            'id': index,
+            'seek': 0,
+            'start': index * SEGMENT_SECONDS,
+            'end': (index + 1) * SEGMENT_SECONDS,
+            'text': f' Câu thử nghiệm số {index + 1}{suffix}.',
+            'tokens': [],
+            'temperature': 0.0,
+            'avg_logprob': -0.2,
+            'compression_ratio': 1.0,
+            'no_speech_prob': 0.01,
+        } for index in range(count)]
+        return {
+            'task': 'transcribe',
+            'language': 'vietnamese',
+            'duration': count * SEGMENT_SECONDS,
+            'text': ''.join(segment['text'] for segment in segments).strip(),
+            'segments': segments,
+        }
+
+    @staticmethod
+    def _chat_completion(request, missing_rate=0.0):
+        prompt = request.get('messages', [{}])[-1].get('content', '')
+        # Trả lời bằng dòng nội dung cuối của prompt để kết quả có thể đối chiếu
+        content = prompt.strip().splitlines()[-1] if prompt.strip() else ''
+        try:
+            items = json.loads(content)
+        except ValueError:
+            items = None
+        if isinstance(items, list):
+            # Prompt dịch theo nhóm: dòng cuối là danh sách {"i", "t"}
+            content = json.dumps({'segments': [
+                {'i': item['i'], 'vi': item['t'], 'en': f"[en] {item['t']}"}
+                for item in items if random.random() >= missing_rate
+            ]}, ensure_ascii=False)
+        prompt_tokens = sum(len(message.get('content', '')) for message in request.get('messages', [])) // 4
+        return {
+            'id': 'chatcmpl-mock',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': request.get('model', 'mock'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': content},
+                'finish_reason': 'stop',
+            }],
+            'usage': {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': len(content) // 4,
+                'total_tokens': prompt_tokens + len(content) // 4,
+                'prompt_tokens_details': {'cached_tokens': cached_prefix_tokens(request.get('messages', []))},
+            },
+        }
+
+
+def make_server(port=8001, latency=0.2, jitter=0.05, error_rate=0.0, rate_limit_rate=0.0, retry_after=1,
+                token_delay=0.0, unique_text=False, missing_rate=0.0):
+    config = argparse.Namespace(latency=latency, jitter=jitter, error_rate=error_rate,
+                                rate_limit_rate=rate_limit_rate, retry_after=retry_after,
+                                token_delay=token_delay, unique_text=unique_text, missing_rate=missing_rate)
+    handler = type('ConfiguredMockOpenAIHandler', (MockOpenAIHandler,), {'config': config, 'stats': {}})
+    return ThreadingHTTPServer(('127.0.0.1', port), handler)
+
+def main():
+    parser = argparse.ArgumentParser(description="Server giả lập OpenAI API")
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--latency', type=float, default=0.2, help="Độ trễ trung bình mỗi request (giây)")
+    parser.add_argument('--jitter', type=float, default=0.05, help="Độ lệch chuẩn của độ trễ (giây)")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Tỉ lệ trả lỗi 500")
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help="Tỉ lệ trả lỗi 429")
+    parser.add_argument('--retry-after', type=int, default=1, help="Giá trị header Retry-After khi trả 429")
+    parser.add_argument('--token-delay', type=float, default=0.0, help="Độ trễ giữa các chunk khi stream (giây)")
+    parser.add_argument('--unique-text', action='store_true', help="Mỗi bản phiên âm có nội dung khác nhau")
+    parser.add_argument('--missing-rate', type=float, default=0.0, help="Tỉ lệ đoạn bị bỏ trong kết quả dịch theo nhóm")
+    args = parser.parse_args()
+
+    server = make_server(args.port, args.latency, args.jitter, args.error_rate, args.rate_limit_rate, args.retry_after,
+                         args.token_delay, args.unique_text, args.missing_rate)
+    print(f"Mock OpenAI API đang chạy tại http://127.0.0.1:{args.port}/v1")
+    server.serve_forever()
+
+if __name__ == '__main__':
+    main()
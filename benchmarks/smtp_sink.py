@@ -0,0 +1,84 @@
+"""
+SMTP sink cục bộ: nhận mọi thư và bỏ đi, chỉ ghi lại người nhận, dung lượng và thời điểm nhận.
+Dùng cho benchmark và thử worker gửi thư mà không cần tài khoản Gmail (không hỗ trợ STARTTLS/AUTH).
+
+Cách dùng:
+    python benchmarks/smtp_sink.py --port 8025
+    SMTP_SERVER=127.0.0.1 SMTP_PORT=8025 SMTP_STARTTLS=0 python app.py
+"""
+import time
+import argparse
+import threading
+import socketserver
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    messages = None
+    lock = threading.Lock()
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        self.reply("220 smtp-sink ready")
+        recipients = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors='replace').strip()
+            verb = command[:4].upper()
+            if verb == 'EHLO':
+                self.reply("250-smtp-sink")
+                self.reply("250 8BITMIME")
+            elif verb == 'HELO':
+                self.reply("250 smtp-sink")
+            elif verb == 'MAIL':
+                recipients = []
+                self.reply("250 OK")
+            elif verb == 'RCPT':
+                recipients.append(command.split(':', 1)[1].strip().strip('<>'))
+                self.reply("250 OK")
+            elif verb == 'DATA':
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                size = self._read_data()
+                with self.lock:
+                    self.messages.append({'time': time.time(), 'recipients': recipients, 'bytes': size})
+                self.reply("250 OK: queued")
+            elif verb == 'QUIT':
+                self.reply("221 Bye")
+                return
+            else:  # RSET, NOOP, ...
+                self.reply("250 OK")
+
+    def _read_data(self):
+        size = 0
+        while True:
+            line = self.rfile.readline()
+            if not line or line == b".\r\n":
+                return size
+            size += len(line)
+
+
+class SMTPSinkServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def make_sink(port=8025):
+    handler = type('ConfiguredSMTPSinkHandler', (SMTPSinkHandler,), {'messages': []})
+    server = SMTPSinkServer(('127.0.0.1', port), handler)
+    server.messages = handler.messages
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="SMTP sink cục bộ cho thử nghiệm")
+    parser.add_argument('--port', type=int, default=8025)
+    args = parser.parse_args()
+
+    server = make_sink(args.port)
+    print(f"SMTP sink đang chạy tại 127.0.0.1:{args.port}")
+    server.serve_forever()
+
+if __name__ == '__main__':
+    main()
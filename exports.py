@@ -0,0 +1,164 @@
+import os
+import json
+from dotenv import load_dotenv
+from docx import Document
+from docx.oxml import OxmlElement
+from docx.oxml.ns import qn
+
+from transcript import format_timestamp
+
+# Đọc cấu hình từ file .env trước khi lấy các biến môi trường bên dưới
+load_dotenv()
+
+# Xuất Transcript đã dịch (mỗi Segment có vi, en) ra nhiều định dạng trong một lượt duyệt.
+# Mỗi đoạn được ghi ngay vào từng file (SRT/VTT/JSON ghi thẳng xuống đĩa), không ghép thành chuỗi lớn.
+EXPORT_FORMATS = [name.strip() for name in os.getenv("EXPORT_FORMATS", "docx,srt,vtt,json").split(",") if name.strip()]
+DOCX_TITLE = "Bản Dịch Song Ngữ"
+
+# Mốc thời gian dạng HH:MM:SS,mmm (SRT) hoặc HH:MM:SS.mmm (WebVTT)
+def format_clock(seconds, separator):
+    milliseconds = int(round(max(seconds, 0.0) * 1000))
+    hours, milliseconds = divmod(milliseconds, 3600000)
+    minutes, milliseconds = divmod(milliseconds, 60000)
+    secs, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02}:{minutes:02}:{secs:02}{separator}{milliseconds:03}"
+
+def _vietnamese(segment):
+    return segment.vi if segment.vi is not None else segment.text
+
+
+class _TextWriter:
+    extension = None
+
+    def __init__(self, path):
+        self.path = path
+        self.temp_path = f"{path}.tmp"
+        self.file = open(self.temp_path, 'w', encoding='utf-8', newline='\n')
+        self.count = 0
+
+    def write(self, segment):
+        self.count += 1
+        self.file.write(self.format(segment))
+
+    def close(self):
+        self.file.close()
+        os.replace(self.temp_path, self.path)
+
+    def abort(self):
+        self.file.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+
+class SrtWriter(_TextWriter):
+    extension = '.srt'
+
+    def format(self, segment):
+        return (f"{self.count}\n{format_clock(segment.start, ',')} --> {format_clock(segment.end, ',')}\n"
+                f"{_vietnamese(segment)}\n{segment.en or ''}\n\n")
+
+
+class VttWriter(_TextWriter):
+    extension = '.vtt'
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.file.write("WEBVTT\n\n")
+
+    def format(self, segment):
+        return (f"{format_clock(segment.start, '.')} --> {format_clock(segment.end, '.')}\n"
+                f"{_vietnamese(segment)}\n{segment.en or ''}\n\n")
+
+
+class JsonWriter(_TextWriter):
+    extension = '.json'
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.file.write('{"segments": [')
+
+    def format(self, segment):
+        item = {'start': segment.start, 'end': segment.end, 'vi': _vietnamese(segment), 'en': segment.en or ''}
+        return ("\n" if self.count == 1 else ",\n") + json.dumps(item, ensure_ascii=False)
+
+    def close(self):
+        self.file.write("\n]}\n")
+        super().close()
+
+
+class DocxWriter:
+    """File Word song ngữ; include_original thêm phần "Nội Dung Gốc" giống mẫu report_audio/."""
+    extension = '.docx'
+
+    def __init__(self, path, title=DOCX_TITLE, include_original=False):
+        self.path = path
+        self.temp_path = f"{path}.tmp"
+        self.document = Document()
+        self.document.add_heading(title, level=1)
+        self.original = None
+        if include_original:
+            self.document.add_heading("Nội Dung Gốc:", level=2)
+            self.original = self.document.add_paragraph()
+            self.document.add_heading("Bản Dịch Song Ngữ:", level=2)
+        # Document.add_paragraph() dò lại toàn bộ thân văn bản mỗi lần gọi (O(n²) với bản ghi dài):
+        # giữ sẵn phần tử sectPr cuối thân văn bản và chèn đoạn mới ngay trước nó
+        self.body = self.document.element.body
+        self.sect_pr = self.body.sectPr
+
+    def _append_paragraph(self, text):
+        run_text = OxmlElement('w:t')
+        run_text.text = text
+        run_text.set(qn('xml:space'), 'preserve')
+        run = OxmlElement('w:r')
+        run.append(run_text)
+        paragraph = OxmlElement('w:p')
+        paragraph.append(run)
+        if self.sect_pr is not None:
+            self.sect_pr.addprevious(paragraph)
+        else:
+            self.body.append(paragraph)
+
+    def write(self, segment):
+        time_formatted = format_timestamp(segment.end)  # Giống mốc thời gian trong prompt dịch
+        if self.original is not None:
+            self.original.add_run(segment.text + " ")
+        self._append_paragraph(f"-  {time_formatted}: {_vietnamese(segment)}")
+        self._append_paragraph(f"-> {time_formatted}: {segment.en or ''}")
+
+    def close(self):
+        self.document.save(self.temp_path)
+        os.replace(self.temp_path, self.path)
+
+    def abort(self):
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+
+WRITERS = {'docx': DocxWriter, 'srt': SrtWriter, 'vtt': VttWriter, 'json': JsonWriter}
+
+# Ghi các đoạn ra mọi định dạng trong một lượt; trả về {định dạng: đường dẫn}.
+# File được ghi ra tên tạm rồi đổi tên, DOCX đổi tên sau cùng nên có DOCX nghĩa là đã xuất đủ.
+def export_segments(segments, output_stem, formats=None, title=DOCX_TITLE, include_original=False):
+    formats = sorted(formats or EXPORT_FORMATS, key=lambda name: name == 'docx')
+    unknown = [name for name in formats if name not in WRITERS]
+    if unknown:
+        raise ValueError(f"Định dạng xuất không hỗ trợ: {', '.join(unknown)}")
+
+    writers = {}
+    try:
+        for name in formats:
+            path = output_stem + WRITERS[name].extension
+            if name == 'docx':
+                writers[name] = DocxWriter(path, title, include_original)
+            else:
+                writers[name] = WRITERS[name](path)
+        for segment in segments:
+            for writer in writers.values():
+                writer.write(segment)
+        for writer in writers.values():
+            writer.close()
+    except Exception:
+        for writer in writers.values():
+            writer.abort()
+        raise
+    return {name: writer.path for name, writer in writers.items()}
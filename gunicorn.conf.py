@@ -0,0 +1,26 @@
+"""
+Cấu hình gunicorn cho wsgi.py; gunicorn tự nạp file này khi chạy trong thư mục dự án:
+    gunicorn wsgi:app
+    GUNICORN_WORKERS=4 GUNICORN_THREADS=64 gunicorn wsgi:app
+
+Dùng worker gthread thay cho worker sync mặc định: mỗi trình duyệt đang mở /jobs/<id>/events (SSE)
+giữ một request suốt thời gian job chạy. Với worker sync, vài tab đang theo dõi job đã chiếm hết worker
+và các upload mới phải chờ. Với gthread, mỗi kết nối SSE chỉ giữ một luồng trong GUNICORN_THREADS luồng
+của worker (luồng này phần lớn thời gian ngủ giữa các lần đọc sự kiện từ SQLite).
+
+Số kết nối đồng thời tối đa ~ GUNICORN_WORKERS x GUNICORN_THREADS (upload + SSE + tải file).
+"""
+import os
+from dotenv import load_dotenv
+
+# Đọc cấu hình từ file .env trước khi lấy các biến môi trường bên dưới
+load_dotenv()
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("GUNICORN_WORKERS", "2"))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "32"))
+# Với gthread, timeout chỉ áp dụng cho nhịp báo sống của worker, không cắt upload lớn hay kết nối SSE dài
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
@@ -0,0 +1,401 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from contextlib import closing
+from dotenv import load_dotenv
+
+from metrics import job_context
+
+# Đọc cấu hình từ file .env trước khi lấy các biến môi trường bên dưới
+load_dotenv()
+
+# Hàng đợi công việc lưu trong SQLite, dùng chung giữa các worker gunicorn
+JOBS_DB = os.getenv("JOBS_DB", "jobs.sqlite3")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))          # Số luồng xử lý tối đa mỗi tiến trình
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "2"))
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "21600"))  # Job "running" quá lâu coi như worker đã chết
+JOB_EVENT_POLL_INTERVAL = float(os.getenv("JOB_EVENT_POLL_INTERVAL", "0.3"))  # Chu kỳ đọc sự kiện mới cho SSE
+JOB_DELTA_FLUSH_SECONDS = 0.1  # Gom token stream trong khoảng này thành một sự kiện
+JOB_EVENT_HEARTBEAT = 15.0   # Gửi dòng chú thích định kỳ để proxy không cắt kết nối SSE
+# Sự kiện SSE của job đã xong/lỗi quá lâu thì xóa (DeltaPublisher ghi ~10 sự kiện/giây khi đang stream)
+JOB_EVENT_RETENTION_HOURS = float(os.getenv("JOB_EVENT_RETENTION_HOURS", "24"))
+JOB_EVENT_SWEEP_INTERVAL = 3600
+
+# Lập lịch: "fair" = job ngắn trước (theo độ dài âm thanh đo bằng ffprobe lúc upload), job chờ lâu được
+# cộng điểm dần để file dài không bị bỏ đói, và mỗi email đang có job chạy thì job tiếp theo bị lùi lại.
+# "fifo" = theo thứ tự upload như trước.
+JOB_SCHEDULER = os.getenv("JOB_SCHEDULER", "fair")
+JOB_DEFAULT_COST = float(os.getenv("JOB_DEFAULT_COST", "600"))         # Giây âm thanh khi không đo được độ dài
+# Mỗi giây chờ bù cho bấy nhiêu giây âm thanh: file 3 giờ chờ tối đa ~18 phút sau các file ngắn đến sau
+JOB_AGING_RATE = float(os.getenv("JOB_AGING_RATE", "10"))
+JOB_TENANT_PENALTY = float(os.getenv("JOB_TENANT_PENALTY", "1800"))    # Giây âm thanh cộng thêm cho mỗi job đang chạy cùng email
+# Giới hạn số job đang chờ; vượt quá thì upload mới nhận 429 kèm Retry-After
+JOB_MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", "100"))
+JOB_MAX_QUEUED_PER_TENANT = int(os.getenv("JOB_MAX_QUEUED_PER_TENANT", "5"))
+JOB_RETRY_AFTER_DEFAULT = 60
+JOB_RETRY_AFTER_MIN = 10
+JOB_RETRY_AFTER_MAX = 600
+JOB_RUNTIME_SAMPLE = 20      # Số job xong gần nhất dùng để ước lượng Retry-After
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+
+class QueueFullError(Exception):
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+# Khóa công bằng theo người dùng: cùng email (không phân biệt hoa thường) là cùng một người
+def tenant_key(email):
+    return (email or '').strip().lower() or None
+
+
+class JobQueue:
+    def __init__(self, db_path=JOBS_DB):
+        self.db_path = db_path
+        self._wakeup = threading.Event()
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    stage TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, kind, created_at)")
+            # Cột thêm sau: cost (giây âm thanh), tenant (email), started_at (để ước lượng thời gian chạy)
+            conn.execute("BEGIN IMMEDIATE")
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column, definition in (("cost", "REAL"), ("tenant", "TEXT"), ("started_at", "REAL")):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {definition}")
+            conn.execute("COMMIT")
+            # Nhật ký sự kiện của job (bước xử lý, đoạn dịch mới) để đẩy tới trình duyệt qua SSE,
+            # lưu trong SQLite vì worker và request SSE có thể ở hai tiến trình gunicorn khác nhau
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS job_events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    job_id TEXT NOT NULL,
+                    event TEXT NOT NULL,
+                    data TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_job_events_job ON job_events (job_id, id)")
+
+    def _connect(self):
+        # isolation_level=None: tự quản lý transaction bằng BEGIN IMMEDIATE
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    # Thêm job mới vào hàng đợi, trả về id để client theo dõi.
+    # cost: độ dài âm thanh (giây) để lập lịch; admit=True: từ chối bằng QueueFullError khi hàng đợi đầy
+    def enqueue(self, kind, payload, job_id=None, cost=None, tenant=None, admit=False):
+        job_id = job_id or uuid.uuid4().hex
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            if admit:
+                self._admit(conn, kind, tenant)
+            conn.execute(
+                "INSERT INTO jobs (id, kind, status, stage, payload, created_at, updated_at, cost, tenant) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, STATUS_QUEUED, STATUS_QUEUED, json.dumps(payload), now, now, cost, tenant)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            # BEGIN có thể đã lỗi (database locked) thì không còn transaction để ROLLBACK
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        self._wakeup.set()
+        return job_id
+
+    # Kiểm tra trước khi nhận file (không giữ chỗ; enqueue(admit=True) kiểm tra lại trong transaction)
+    def check_admission(self, kind, tenant=None):
+        with closing(self._connect()) as conn:
+            self._admit(conn, kind, tenant)
+
+    def _admit(self, conn, kind, tenant):
+        queued = conn.execute(
+            "SELECT COUNT(*), SUM(tenant = ?) FROM jobs WHERE kind = ? AND status = ?",
+            (tenant, kind, STATUS_QUEUED)
+        ).fetchone()
+        if queued[0] >= JOB_MAX_QUEUED:
+            raise QueueFullError('Hệ thống đang quá tải, vui lòng thử lại sau.', self._retry_after(conn, kind))
+        if tenant and (queued[1] or 0) >= JOB_MAX_QUEUED_PER_TENANT:
+            raise QueueFullError(f'Bạn đã có {queued[1]} file đang chờ xử lý, vui lòng đợi các file này xong.',
+                                 self._retry_after(conn, kind))
+
+    # Một chỗ trong hàng đợi thường trống sau khoảng thời gian chạy trung bình của một job gần đây
+    def _retry_after(self, conn, kind):
+        row = conn.execute(
+            "SELECT AVG(updated_at - started_at) FROM (SELECT updated_at, started_at FROM jobs "
+            "WHERE kind = ? AND status IN (?, ?) AND started_at IS NOT NULL ORDER BY updated_at DESC LIMIT ?)",
+            (kind, STATUS_DONE, STATUS_FAILED, JOB_RUNTIME_SAMPLE)
+        ).fetchone()
+        if row[0] is None:
+            return JOB_RETRY_AFTER_DEFAULT
+        return int(min(JOB_RETRY_AFTER_MAX, max(JOB_RETRY_AFTER_MIN, row[0])))
+
+    # Lấy job có ưu tiên cao nhất đang chờ và đánh dấu "running" (nguyên tử giữa các tiến trình)
+    def claim(self, kind):
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            # Trả lại hàng đợi các job bị bỏ dở do worker chết giữa chừng
+            conn.execute(
+                "UPDATE jobs SET status = ?, stage = ?, updated_at = ? "
+                "WHERE kind = ? AND status = ? AND updated_at < ?",
+                (STATUS_QUEUED, STATUS_QUEUED, time.time(), kind, STATUS_RUNNING,
+                 time.time() - JOB_STALE_SECONDS)
+            )
+            job_id = self._next_job_id(conn, kind)
+            if job_id is None:
+                conn.execute("COMMIT")
+                return None
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ?, started_at = ? WHERE id = ?",
+                (STATUS_RUNNING, time.time(), time.time(), job_id)
+            )
+            conn.execute("COMMIT")
+            job = self._to_dict(row)
+            job["status"] = STATUS_RUNNING
+            return job
+        except Exception:
+            # BEGIN có thể đã lỗi (database locked) thì không còn transaction để ROLLBACK
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    # Điểm ưu tiên tính bằng giây âm thanh (nhỏ hơn chạy trước):
+    #   độ dài - JOB_AGING_RATE * số giây đã chờ + JOB_TENANT_PENALTY * số job cùng email đang chạy
+    def _next_job_id(self, conn, kind):
+        if JOB_SCHEDULER == "fifo":
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE kind = ? AND status = ? ORDER BY created_at LIMIT 1",
+                (kind, STATUS_QUEUED)
+            ).fetchone()
+            return row["id"] if row else None
+
+        candidates = conn.execute(
+            "SELECT id, cost, tenant, created_at FROM jobs WHERE kind = ? AND status = ?",
+            (kind, STATUS_QUEUED)
+        ).fetchall()
+        if not candidates:
+            return None
+        running = dict(conn.execute(
+            "SELECT tenant, COUNT(*) FROM jobs WHERE kind = ? AND status = ? GROUP BY tenant",
+            (kind, STATUS_RUNNING)
+        ).fetchall())
+        now = time.time()
+
+        def priority(row):
+            cost = row["cost"] if row["cost"] is not None else JOB_DEFAULT_COST
+            penalty = JOB_TENANT_PENALTY * running.get(row["tenant"], 0) if row["tenant"] else 0.0
+            return (cost - JOB_AGING_RATE * (now - row["created_at"]) + penalty, row["created_at"])
+
+        return min(candidates, key=priority)["id"]
+
+    def set_stage(self, job_id, stage):
+        self._update(job_id, stage=stage)
+        self.add_event(job_id, "stage", {"stage": stage})
+
+    def finish(self, job_id, result):
+        self._update(job_id, status=STATUS_DONE, stage=STATUS_DONE, result=json.dumps(result))
+        self.add_event(job_id, STATUS_DONE, result)
+
+    def fail(self, job_id, error):
+        self._update(job_id, status=STATUS_FAILED, stage=STATUS_FAILED, error=str(error))
+        self.add_event(job_id, STATUS_FAILED, {"error": str(error)})
+
+    # Ghi một sự kiện cho job; trình duyệt nhận qua event_stream()
+    def add_event(self, job_id, event, data):
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "INSERT INTO job_events (job_id, event, data, created_at) VALUES (?, ?, ?, ?)",
+                (job_id, event, json.dumps(data, ensure_ascii=False), time.time())
+            )
+
+    # Các sự kiện có id lớn hơn after_id, theo thứ tự ghi
+    def events(self, job_id, after_id=0):
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT id, event, data FROM job_events WHERE job_id = ? AND id > ? ORDER BY id",
+                (job_id, after_id)
+            ).fetchall()
+        return [(row["id"], row["event"], row["data"]) for row in rows]
+
+    # Xóa sự kiện của các job đã xong hoặc lỗi trước thời điểm max_age_seconds trước; trả về số dòng đã xóa
+    def purge_events(self, max_age_seconds):
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "DELETE FROM job_events WHERE job_id IN "
+                "(SELECT id FROM jobs WHERE status IN (?, ?) AND updated_at < ?)",
+                (STATUS_DONE, STATUS_FAILED, time.time() - max_age_seconds)
+            )
+        return cursor.rowcount
+
+    def get(self, job_id):
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def _update(self, job_id, **fields):
+        fields["updated_at"] = time.time()
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with closing(self._connect()) as conn:
+            conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+    @staticmethod
+    def _to_dict(row):
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+
+# Gom các token stream từ ChatGPT thành từng đợt nhỏ để không ghi SQLite cho mỗi token
+class DeltaPublisher:
+    def __init__(self, queue, job_id, event="delta", interval=JOB_DELTA_FLUSH_SECONDS):
+        self.queue = queue
+        self.job_id = job_id
+        self.event = event
+        self.interval = interval
+        self._parts = []
+        self._flushed_at = time.monotonic()
+
+    def push(self, text):
+        self._parts.append(text)
+        if "\n" in text or time.monotonic() - self._flushed_at >= self.interval:
+            self.flush()
+
+    def flush(self):
+        if self._parts:
+            self.queue.add_event(self.job_id, self.event, {"text": "".join(self._parts)})
+            self._parts = []
+        self._flushed_at = time.monotonic()
+
+
+# Sinh luồng Server-Sent Events cho một job: gửi lại các sự kiện sau last_event_id (khi trình duyệt
+# kết nối lại) rồi đẩy sự kiện mới tới khi job xong hoặc lỗi. Dữ liệu đã là JSON nên không phải
+# giữ cả kết quả trong bộ nhớ.
+def event_stream(queue, job_id, last_event_id=0):
+    last_id = last_event_id
+    last_sent = time.monotonic()
+    first_poll = True
+    while True:
+        finished = False
+        events = queue.events(job_id, last_id)
+        for event_id, event, data in events:
+            last_id = event_id
+            finished = finished or event in (STATUS_DONE, STATUS_FAILED)
+            yield f"id: {event_id}\nevent: {event}\ndata: {data}\n\n"
+            last_sent = time.monotonic()
+        if finished:
+            return
+        if first_poll and not events:
+            # Job đã kết thúc mà không còn sự kiện mới: client kết nối lại (Last-Event-ID > 0) đã nhận
+            # trạng thái cuối thì chỉ đóng luồng; client mới mà sự kiện đã bị dọn thì gửi trạng thái cuối
+            # từ bảng jobs
+            job = queue.get(job_id)
+            if job is None or job["status"] in (STATUS_DONE, STATUS_FAILED):
+                if job is not None and not last_event_id:
+                    data = job["result"] if job["status"] == STATUS_DONE else {"error": job["error"]}
+                    yield f"event: {job['status']}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+                return
+        first_poll = False
+        if time.monotonic() - last_sent > JOB_EVENT_HEARTBEAT:
+            yield ": ping\n\n"
+            last_sent = time.monotonic()
+        time.sleep(JOB_EVENT_POLL_INTERVAL)
+
+
+# Vòng lặp của một luồng worker: lấy job, chạy pipeline, ghi kết quả
+def _worker_loop(queue, kind, handler):
+    while True:
+        try:
+            job = queue.claim(kind)
+        except sqlite3.Error as e:
+            print(f"Lỗi khi lấy job từ hàng đợi: {e}")
+            job = None
+
+        if job is None:
+            queue._wakeup.wait(JOB_POLL_INTERVAL)
+            queue._wakeup.clear()
+            continue
+
+        print(f"Bắt đầu xử lý job {job['id']}")
+        try:
+            # Span và log JSON của các bước bên trong được gắn với job id này
+            with job_context(job["id"]):
+                result = handler(job, queue)
+            queue.finish(job["id"], result)
+            print(f"Hoàn thành job {job['id']}")
+        except Exception as e:
+            print(f"Job {job['id']} thất bại: {e}")
+            queue.fail(job["id"], e)
+
+
+_started = set()
+_start_lock = threading.Lock()
+
+# Luồng nền xóa sự kiện SSE cũ, mỗi tiến trình một luồng (an toàn khi gunicorn fork)
+def start_event_sweeper(queue, retention_hours=JOB_EVENT_RETENTION_HOURS, interval=JOB_EVENT_SWEEP_INTERVAL):
+    key = (os.getpid(), "event-sweeper")
+    if key in _started:
+        return
+    with _start_lock:
+        if key in _started:
+            return
+        _started.add(key)
+
+    def loop():
+        while True:
+            try:
+                removed = queue.purge_events(retention_hours * 3600)
+                if removed:
+                    print(f"Dọn sự kiện job: xóa {removed} sự kiện cũ")
+            except sqlite3.Error as e:
+                print(f"Lỗi khi dọn sự kiện job: {e}")
+            time.sleep(interval)
+
+    threading.Thread(target=loop, name="job-event-sweeper", daemon=True).start()
+
+# Khởi động pool worker cho tiến trình hiện tại (an toàn khi gunicorn fork)
+def ensure_workers(queue, kind, handler, num_workers=JOB_WORKERS):
+    key = (os.getpid(), kind)
+    if key in _started:
+        return
+    with _start_lock:
+        if key in _started:
+            return
+        for i in range(num_workers):
+            threading.Thread(
+                target=_worker_loop,
+                args=(queue, kind, handler),
+                name=f"job-worker-{i}",
+                daemon=True
+            ).start()
+        _started.add(key)
@@ -0,0 +1,68 @@
+"""
+Phiên âm ngay trên CPU của máy chủ bằng faster-whisper (CTranslate2, lượng tử hóa int8):
+không phụ thuộc mạng hay hạn mức OpenAI, độ trễ chỉ phụ thuộc vào CPU.
+
+Cài thêm khi dùng backend này:
+    pip install faster-whisper
+
+Model được nạp một lần cho mỗi tiến trình worker (lần phiên âm đầu tiên) và dùng lại cho mọi job.
+"""
+import os
+import time
+import threading
+from dotenv import load_dotenv
+
+from transcript import Segment, Transcript
+
+# Đọc cấu hình từ file .env trước khi lấy các biến môi trường bên dưới
+load_dotenv()
+
+# tiny/base/small/medium/large-v3 hoặc đường dẫn tới model đã chuyển sang CTranslate2
+LOCAL_WHISPER_MODEL = os.getenv("LOCAL_WHISPER_MODEL", "small")
+LOCAL_WHISPER_COMPUTE_TYPE = os.getenv("LOCAL_WHISPER_COMPUTE_TYPE", "int8")
+LOCAL_WHISPER_THREADS = int(os.getenv("LOCAL_WHISPER_THREADS", "0"))     # Luồng CPU cho mỗi file, 0 = tự chọn
+LOCAL_WHISPER_WORKERS = int(os.getenv("LOCAL_WHISPER_WORKERS", "1"))     # Số file phiên âm cùng lúc mỗi tiến trình
+LOCAL_WHISPER_BEAM_SIZE = int(os.getenv("LOCAL_WHISPER_BEAM_SIZE", "5"))
+LOCAL_WHISPER_DOWNLOAD_DIR = os.getenv("LOCAL_WHISPER_DOWNLOAD_DIR")     # Mặc định dùng cache của Hugging Face
+
+_model = None
+_model_pid = None
+_model_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(max(1, LOCAL_WHISPER_WORKERS))
+
+# Tên model dùng trong khóa cache bản phiên âm (khác model hay độ chính xác thì kết quả khác)
+def local_model_id():
+    return f"faster-whisper:{LOCAL_WHISPER_MODEL}:{LOCAL_WHISPER_COMPUTE_TYPE}"
+
+# Nạp model một lần cho mỗi tiến trình (nạp lại nếu tiến trình được fork sau khi đã nạp)
+def load_model():
+    global _model, _model_pid
+    with _model_lock:
+        if _model is None or _model_pid != os.getpid():
+            try:
+                from faster_whisper import WhisperModel
+            except ImportError:
+                raise RuntimeError("Chưa cài faster-whisper, chạy: pip install faster-whisper") from None
+            started = time.perf_counter()
+            _model = WhisperModel(
+                LOCAL_WHISPER_MODEL,
+                device="cpu",
+                compute_type=LOCAL_WHISPER_COMPUTE_TYPE,
+                cpu_threads=LOCAL_WHISPER_THREADS,
+                num_workers=max(1, LOCAL_WHISPER_WORKERS),
+                download_root=LOCAL_WHISPER_DOWNLOAD_DIR
+            )
+            _model_pid = os.getpid()
+            print(f"Đã nạp model {local_model_id()} trong {time.perf_counter() - started:.1f}s")
+        return _model
+
+# Phiên âm cả file (không cần cắt đoạn như khi gửi API); trả về Transcript giống backend API
+def transcribe_local(path, language, beam_size=LOCAL_WHISPER_BEAM_SIZE):
+    model = load_model()
+    with _slots:
+        # segments là generator: việc giải mã thực sự diễn ra khi duyệt qua nó
+        segments, _ = model.transcribe(path, language=language, beam_size=beam_size)
+        return Transcript(
+            Segment(segment.start, segment.end, segment.text.strip())
+            for segment in segments if segment.text.strip()
+        )
@@ -0,0 +1,246 @@
+"""
+Hộp thư đi (outbox): job chỉ đưa thư vào hàng đợi "email", một worker riêng gửi thư qua
+kết nối SMTP đã đăng nhập được dùng lại giữa các thư, thử lại với backoff khi lỗi tạm thời.
+File đính kèm được mã hóa base64 theo từng khối và ghi thẳng vào kết nối, không nạp cả file vào RAM.
+Tổng dung lượng vượt EMAIL_MAX_ATTACHMENT_BYTES thì gửi link tải thay cho file đính kèm.
+
+Thử với SMTP sink cục bộ (không cần tài khoản Gmail):
+    python benchmarks/smtp_sink.py --port 8025
+    SMTP_SERVER=127.0.0.1 SMTP_PORT=8025 SMTP_STARTTLS=0 python app.py
+"""
+import os
+import time
+import uuid
+import base64
+import random
+import shutil
+import smtplib
+import threading
+from email.header import Header
+from email.utils import encode_rfc2231, formatdate, make_msgid
+from dotenv import load_dotenv
+
+from metrics import current_job_id, job_context, span
+from scratch import scratch
+
+# Đọc cấu hình từ file .env trước khi lấy các biến môi trường bên dưới
+load_dotenv()
+
+# Cấu hình email server
+SMTP_SERVER = os.getenv("SMTP_SERVER", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_USERNAME = os.getenv("SMTP_USERNAME")  # Email của bạn
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")  # Mật khẩu email của bạn
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "1") == "1"
+SMTP_TIMEOUT = 60
+SMTP_IDLE_SECONDS = 240                      # Kết nối rảnh lâu hơn mức này thì kiểm tra bằng NOOP trước khi dùng
+
+EMAIL_JOB_KIND = "email"
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", "5"))
+EMAIL_BACKOFF_BASE_SECONDS = 2.0
+EMAIL_BACKOFF_MAX_SECONDS = 120.0
+# Gmail giới hạn 25 MB sau base64 (tăng ~4/3), để dư cho phần đầu thư
+EMAIL_MAX_ATTACHMENT_BYTES = int(os.getenv("EMAIL_MAX_ATTACHMENT_BYTES", str(18 * 1024 * 1024)))
+DOWNLOAD_FOLDER = os.getenv("DOWNLOAD_FOLDER", "downloads")
+DOWNLOAD_BASE_URL = os.getenv("DOWNLOAD_BASE_URL")   # Ví dụ https://beme.example.com; mặc định lấy theo request upload
+DOWNLOAD_TTL_SECONDS = int(os.getenv("DOWNLOAD_TTL_SECONDS", str(7 * 24 * 3600)))  # Link tải hết hạn sau chừng này
+
+BASE64_BLOCK_BYTES = 57 * 1024               # Bội số của 57 byte = các dòng base64 76 ký tự trọn vẹn
+
+# Luồng dọn thư mục tạm cũng xóa các thư mục downloads/<token>/ quá hạn
+scratch.expire(DOWNLOAD_FOLDER, DOWNLOAD_TTL_SECONDS)
+
+
+class SMTPSender:
+    """Giữ một kết nối SMTP đã STARTTLS + đăng nhập, dùng lại cho các thư tiếp theo."""
+
+    def __init__(self, host=SMTP_SERVER, port=SMTP_PORT, username=SMTP_USERNAME, password=SMTP_PASSWORD,
+                 starttls=SMTP_STARTTLS):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self._server = None
+        self._last_used = 0.0
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        if self._server is not None and time.monotonic() - self._last_used > SMTP_IDLE_SECONDS:
+            try:
+                self._server.noop()
+            except smtplib.SMTPException:
+                self.close()
+        if self._server is None:
+            server = smtplib.SMTP(self.host, self.port, timeout=SMTP_TIMEOUT)
+            if self.starttls:
+                server.starttls()
+            if self.username:
+                server.login(self.username, self.password)
+            self._server = server
+        return self._server
+
+    def close(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._server = None
+
+    # Gửi một thư qua kết nối dùng chung; kết nối bị đóng giữa chừng thì mở lại và gửi lại một lần
+    def send(self, sender, recipient, subject, body, attachment_paths):
+        with self._lock:
+            try:
+                self._send_once(sender, recipient, subject, body, attachment_paths)
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                self.close()
+                self._send_once(sender, recipient, subject, body, attachment_paths)
+            finally:
+                self._last_used = time.monotonic()
+
+    def _send_once(self, sender, recipient, subject, body, attachment_paths):
+        server = self._connection()
+        try:
+            server.ehlo_or_helo_if_needed()
+            code, response = server.mail(sender)
+            if code != 250:
+                raise smtplib.SMTPSenderRefused(code, response, sender)
+            code, response = server.rcpt(recipient)
+            if code not in (250, 251):
+                raise smtplib.SMTPRecipientsRefused({recipient: (code, response)})
+            code, response = server.docmd("DATA")
+            if code != 354:
+                raise smtplib.SMTPDataError(code, response)
+            for chunk in iter_message(sender, recipient, subject, body, attachment_paths):
+                server.send(chunk)
+            server.send(b".\r\n")
+            code, response = server.getreply()
+            if code != 250:
+                raise smtplib.SMTPDataError(code, response)
+        except smtplib.SMTPResponseException:
+            # Đưa phiên về trạng thái sạch cho thư sau
+            try:
+                server.rset()
+            except (smtplib.SMTPException, OSError):
+                self.close()
+            raise
+        except (smtplib.SMTPException, OSError):
+            self.close()
+            raise
+
+
+# Sinh nội dung thư MIME theo từng khối bytes. Mọi phần đều mã hóa base64 nên không dòng nào bắt đầu
+# bằng "." (không cần dot-stuffing khi gửi trực tiếp sau lệnh DATA).
+def iter_message(sender, recipient, subject, body, attachment_paths):
+    boundary = f"=={uuid.uuid4().hex}=="
+    headers = [
+        f"From: {sender}",
+        f"To: {recipient}",
+        f"Subject: {Header(subject, 'utf-8').encode()}",
+        f"Date: {formatdate(localtime=True)}",
+        f"Message-ID: {make_msgid()}",
+        "MIME-Version: 1.0",
+        f'Content-Type: multipart/mixed; boundary="{boundary}"',
+    ]
+    yield ("\r\n".join(headers) + "\r\n\r\n").encode()
+
+    yield (f"--{boundary}\r\nContent-Type: text/plain; charset=utf-8\r\n"
+           f"Content-Transfer-Encoding: base64\r\n\r\n").encode()
+    yield _base64_lines(body.encode('utf-8'))
+
+    for path in attachment_paths:
+        filename = os.path.basename(path)
+        yield (f"--{boundary}\r\nContent-Type: application/octet-stream\r\n"
+               f"Content-Transfer-Encoding: base64\r\n"
+               f"Content-Disposition: attachment; filename*={encode_rfc2231(filename, 'utf-8')}\r\n\r\n").encode()
+        with open(path, 'rb') as attachment:
+            while True:
+                block = attachment.read(BASE64_BLOCK_BYTES)
+                if not block:
+                    break
+                yield _base64_lines(block)
+    yield f"--{boundary}--\r\n".encode()
+
+def _base64_lines(data):
+    encoded = base64.b64encode(data)
+    return b"".join(encoded[index:index + 76] + b"\r\n" for index in range(0, len(encoded), 76))
+
+# Chuyển file vào thư mục tải về với đường dẫn khó đoán, trả về link tải
+def publish_download(path, base_url, token):
+    target_dir = os.path.join(DOWNLOAD_FOLDER, token)
+    os.makedirs(target_dir, exist_ok=True)
+    filename = os.path.basename(path)
+    shutil.move(path, os.path.join(target_dir, filename))
+    return f"{base_url.rstrip('/')}/downloads/{token}/{filename}"
+
+# Đưa thư vào hàng đợi gửi; trả về ngay, không chờ SMTP
+# cleanup_dir: thư mục chứa file đính kèm, bị xóa sau khi thư đã gửi xong (hoặc lỗi hẳn)
+def enqueue_email(queue, to_email, subject, body, attachment_paths, base_url=None, cleanup_dir=None):
+    return queue.enqueue(EMAIL_JOB_KIND, {
+        'to': to_email,
+        'subject': subject,
+        'body': body,
+        'attachments': list(attachment_paths),
+        'base_url': DOWNLOAD_BASE_URL or base_url,
+        'source_job_id': current_job_id(),  # Để log của bước gửi thư gắn với job xử lý âm thanh
+        'cleanup_dir': cleanup_dir,
+    })
+
+# Lỗi có thể thử lại: mất kết nối, timeout, mã 4xx (máy chủ tạm thời từ chối)
+def is_transient(error):
+    if isinstance(error, smtplib.SMTPServerDisconnected):
+        return True
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):  # Gồm cả SMTPConnectError
+        return 400 <= error.smtp_code < 500
+    if isinstance(error, smtplib.SMTPException):
+        # SMTPException kế thừa OSError: lỗi cấu hình (ví dụ máy chủ không hỗ trợ AUTH) không thử lại
+        return False
+    return isinstance(error, OSError)
+
+_sender = SMTPSender()
+
+# Handler của worker "email": gửi thư, thử lại với backoff lũy thừa + jitter cho lỗi tạm thời
+def deliver_email(job, queue):
+    payload = job['payload']
+    try:
+        with job_context(payload.get('source_job_id') or job['id']):
+            return _deliver(job, queue, payload)
+    finally:
+        if payload.get('cleanup_dir'):
+            shutil.rmtree(payload['cleanup_dir'], ignore_errors=True)
+
+def _deliver(job, queue, payload):
+    attachments = [path for path in payload['attachments'] if os.path.isfile(path)]
+    for path in set(payload['attachments']) - set(attachments):
+        print(f"File không tồn tại để đính kèm: {path}")
+    body = payload['body']
+
+    # File quá lớn cho email: gửi link tải thay cho file đính kèm
+    total_bytes = sum(os.path.getsize(path) for path in attachments)
+    if total_bytes > EMAIL_MAX_ATTACHMENT_BYTES and payload.get('base_url'):
+        token = uuid.uuid4().hex
+        links = [publish_download(path, payload['base_url'], token) for path in attachments]
+        body += (f"\n\nFile kết quả quá lớn để đính kèm, vui lòng tải trong {DOWNLOAD_TTL_SECONDS // 86400 or 1} "
+                 f"ngày tại:\n" + "\n".join(links))
+        attachments = []
+
+    with span('email', bytes=sum(os.path.getsize(path) for path in attachments),
+              attachments=len(attachments)) as current:
+        for attempt in range(EMAIL_MAX_ATTEMPTS):
+            try:
+                _sender.send(SMTP_USERNAME or "noreply@localhost", payload['to'], payload['subject'], body,
+                             attachments)
+                print(f"Email đã được gửi tới {payload['to']}")
+                return {'to': payload['to'], 'attachments': len(attachments), 'attempts': attempt + 1}
+            except Exception as e:
+                if attempt == EMAIL_MAX_ATTEMPTS - 1 or not is_transient(e):
+                    print(f"Không thể gửi email tới {payload['to']}: {e}")
+                    raise
+                delay = random.uniform(0, min(EMAIL_BACKOFF_MAX_SECONDS, EMAIL_BACKOFF_BASE_SECONDS * 2 ** attempt))
+                print(f"Gửi email lỗi tạm thời ({e}), thử lại lần {attempt + 1} sau {delay:.1f}s")
+                current.add('retries')
+                queue.set_stage(job['id'], f'retrying:{attempt + 1}')
+                time.sleep(delay)
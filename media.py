@@ -0,0 +1,223 @@
+import os
+import json
+import subprocess
+import threading
+from dotenv import load_dotenv
+
+# Đọc cấu hình từ file .env trước khi lấy các biến môi trường bên dưới
+load_dotenv()
+
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", str(1024 * 1024)))
+# Các container có thể giải mã tuần tự từ pipe; MP4/MOV chỉ đọc được khi moov nằm ở đầu file
+STREAMABLE_EXTENSIONS = {'wav', 'mp3', 'flac', 'aac', 'ogg', 'mkv', 'avi', 'amsr'}
+
+# Tham số ffmpeg để ra WAV 16 kHz mono mà Whisper dùng
+WAV_OUTPUT_ARGS = [
+    '-vn',           # Bỏ luồng hình, không giải mã video
+    '-ar', '16000',  # Tần số lấy mẫu
+    '-ac', '1',      # Mono channel
+    '-f', 'wav',
+]
+
+# Dung lượng WAV 16 kHz mono 16-bit cho một thời lượng, để chọn chỗ đặt file trung gian
+def pcm_wav_bytes(duration):
+    return int((duration or 0) * 16000 * 2) + 44
+
+# Codec âm thanh Whisper API nhận trực tiếp -> container để copy luồng (không giải mã lại)
+COPYABLE_AUDIO_CODECS = {
+    'aac': '.m4a',
+    'mp3': '.mp3',
+    'opus': '.ogg',
+    'vorbis': '.ogg',
+    'flac': '.flac',
+}
+# Phần mở rộng Whisper API chấp nhận
+WHISPER_ACCEPTED_EXTENSIONS = {'.flac', '.m4a', '.mp3', '.mp4', '.mpeg', '.mpga', '.oga', '.ogg', '.wav', '.webm'}
+
+def probe_command(path):
+    return [
+        'ffprobe', '-v', 'error',
+        '-print_format', 'json',
+        '-show_format', '-show_streams',
+        path
+    ]
+
+# Rút các thông tin cần dùng từ JSON của ffprobe
+def parse_probe(output, path):
+    info = json.loads(output)
+    streams = info.get('streams', [])
+    fmt = info.get('format', {})
+    audio = next((stream for stream in streams if stream.get('codec_type') == 'audio'), None)
+
+    def to_number(value, cast=float):
+        try:
+            return cast(value)
+        except (TypeError, ValueError):
+            return None
+
+    return {
+        'duration': to_number(fmt.get('duration')) or to_number((audio or {}).get('duration')) or 0.0,
+        'size': to_number(fmt.get('size'), int) or os.path.getsize(path),
+        'format_name': fmt.get('format_name', ''),
+        'has_video': any(stream.get('codec_type') == 'video' and
+                         not stream.get('disposition', {}).get('attached_pic') for stream in streams),
+        'has_audio': audio is not None,
+        'audio_codec': audio.get('codec_name') if audio else None,
+        'sample_rate': to_number(audio.get('sample_rate'), int) if audio else None,
+        'channels': audio.get('channels') if audio else None,
+        'audio_bit_rate': to_number(audio.get('bit_rate'), int) if audio else None,
+    }
+
+# Đọc thông tin file một lần bằng ffprobe (codec, tần số lấy mẫu, số kênh, độ dài, dung lượng)
+def probe_media(path):
+    result = subprocess.run(probe_command(path), stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            text=True, check=True)
+    return parse_probe(result.stdout, path)
+
+# Chọn cách chuyển đổi rẻ nhất cho Whisper:
+#   passthrough - đã là WAV PCM 16 kHz mono, dùng luôn
+#   copy        - codec API nhận được (AAC/MP3/Opus/...), chỉ tách luồng âm thanh với -vn -c:a copy
+#   transcode   - còn lại: giải mã và chuyển sang WAV 16 kHz mono
+#   require_pcm - bước sau (VAD) cần WAV PCM nên không được copy luồng nén
+def plan_conversion(probe, require_pcm=False):
+    if not probe['has_audio']:
+        raise ValueError("File không có luồng âm thanh.")
+    if (probe['audio_codec'] == 'pcm_s16le' and probe['sample_rate'] == 16000
+            and probe['channels'] == 1 and 'wav' in probe['format_name'].split(',')
+            and not probe['has_video']):
+        return 'passthrough'
+    if probe['audio_codec'] in COPYABLE_AUDIO_CODECS and not require_pcm:
+        return 'copy'
+    return 'transcode'
+
+# Các lệnh ffmpeg sẽ thử lần lượt theo kế hoạch (rỗng nếu dùng nguyên file).
+# Trả về danh sách (lệnh, file kết quả); copy luồng thất bại thì thử mã hóa lại.
+def conversion_attempts(input_path, output_path, probe, require_pcm=False):
+    plan = plan_conversion(probe, require_pcm)
+    output_stem = f"{os.path.splitext(output_path)[0]}_processed"
+    if plan == 'passthrough':
+        return []
+
+    attempts = []
+    if plan == 'copy':
+        copied_path = output_stem + COPYABLE_AUDIO_CODECS[probe['audio_codec']]
+        attempts.append((['ffmpeg', '-y', '-v', 'error', '-i', input_path,
+                          '-map', '0:a:0', '-vn', '-c:a', 'copy', copied_path], copied_path))
+    processed_output_path = f"{output_stem}.wav"
+    attempts.append((['ffmpeg', '-y', '-v', 'error', '-i', input_path, *WAV_OUTPUT_ARGS, processed_output_path],
+                     processed_output_path))
+    return attempts
+
+# Chuẩn bị file âm thanh cho Whisper theo kế hoạch từ ffprobe; trả về đường dẫn kết quả
+def prepare_audio(input_path, output_path, probe=None, require_pcm=False):
+    probe = probe or probe_media(input_path)
+    attempts = conversion_attempts(input_path, output_path, probe, require_pcm)
+    if not attempts:
+        print(f"File đã đúng định dạng, không cần chuyển đổi: {input_path}")
+        return input_path
+
+    for index, (command, result_path) in enumerate(attempts):
+        try:
+            subprocess.run(command, check=True)
+            print(f"Chuyển đổi thành công: {result_path}")
+            return result_path
+        except subprocess.CalledProcessError as e:
+            if index == len(attempts) - 1:
+                raise
+            # Một số luồng không đóng gói lại được (ví dụ timestamp hỏng): chuyển sang mã hóa lại
+            print(f"Không copy được luồng âm thanh, chuyển sang mã hóa lại: {e}")
+
+def _drain(pipe, sink):
+    for line in iter(pipe.readline, b''):
+        sink.append(line)
+    pipe.close()
+
+# Đẩy dữ liệu đang upload thẳng vào stdin của ffmpeg, trích âm thanh trong lúc nhận.
+# Với container không chắc đọc tuần tự được, ghi song song một bản sao vào spool_path
+# để có thể chuyển đổi lại từ file nếu ffmpeg thất bại.
+def stream_convert(stream, output_path, extension, spool_path=None):
+    spool = None
+    if extension.lower() not in STREAMABLE_EXTENSIONS and spool_path:
+        spool = open(spool_path, 'wb')
+
+    process = subprocess.Popen(
+        ['ffmpeg', '-y', '-v', 'error', '-i', 'pipe:0', *WAV_OUTPUT_ARGS, output_path],
+        stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+    errors = []
+    stderr_thread = threading.Thread(target=_drain, args=(process.stderr, errors), daemon=True)
+    stderr_thread.start()
+
+    received = 0
+    ffmpeg_alive = True
+    try:
+        for chunk in iter(lambda: stream.read(STREAM_CHUNK_SIZE), b''):
+            received += len(chunk)
+            if spool:
+                spool.write(chunk)
+            if ffmpeg_alive:
+                try:
+                    process.stdin.write(chunk)
+                except BrokenPipeError:
+                    # ffmpeg đã dừng (lỗi định dạng); vẫn nhận tiếp để giữ bản spool đầy đủ
+                    ffmpeg_alive = False
+                    if not spool:
+                        break
+    finally:
+        try:
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+        if spool:
+            spool.close()
+    process.wait()
+    stderr_thread.join()
+
+    if process.returncode == 0 and os.path.exists(output_path):
+        if spool:
+            os.remove(spool_path)
+        print(f"Chuyển đổi trực tiếp thành công ({received} bytes): {output_path}")
+        return output_path
+
+    print(f"FFmpeg stream error: {b''.join(errors).decode(errors='replace').strip()}")
+    if spool:
+        # Giải mã lại từ bản spool (ví dụ MP4 có moov ở cuối file)
+        try:
+            subprocess.run(['ffmpeg', '-y', '-v', 'error', '-i', spool_path, *WAV_OUTPUT_ARGS, output_path],
+                           check=True)
+            return output_path
+        except subprocess.CalledProcessError as e:
+            print(f"FFmpeg error: {e}")
+        finally:
+            os.remove(spool_path)
+    return None
+
+# Định dạng gửi lên Whisper: WAV ~1.9 MB/phút, FLAC không mất dữ liệu ~0.5-0.6 lần WAV,
+# Opus 24 kbps ~0.18 MB/phút (bài giảng 2 giờ dưới 25 MB, gửi trong một request)
+WHISPER_UPLOAD_CODEC = os.getenv("WHISPER_UPLOAD_CODEC", "flac")
+OPUS_BITRATE = os.getenv("OPUS_BITRATE", "24k")
+UPLOAD_CODECS = {
+    'wav': {'extension': '.wav', 'args': ['-c:a', 'pcm_s16le']},
+    'flac': {'extension': '.flac', 'args': ['-c:a', 'flac', '-compression_level', '8']},
+    'opus': {'extension': '.ogg', 'args': ['-c:a', 'libopus', '-b:a', OPUS_BITRATE, '-application', 'voip']},
+}
+
+# Mã hóa (một đoạn của) file WAV 16 kHz sang định dạng gửi Whisper
+def encode_audio(input_path, output_path, codec=WHISPER_UPLOAD_CODEC, start=None, end=None):
+    seek_args = []
+    if start is not None:
+        seek_args += ['-ss', f'{start:.3f}']
+    if end is not None:
+        seek_args += ['-t', f'{end - (start or 0.0):.3f}']
+    subprocess.run([
+        'ffmpeg', '-y', '-v', 'error',
+        *seek_args,
+        '-i', input_path,
+        '-ar', '16000', '-ac', '1',
+        *UPLOAD_CODECS[codec]['args'],
+        output_path
+    ], check=True)
+    return output_path
+
+def upload_extension(codec=WHISPER_UPLOAD_CODEC):
+    return UPLOAD_CODECS[codec]['extension']
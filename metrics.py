@@ -0,0 +1,254 @@
+"""
+Đo thời gian từng bước xử lý (span) và xuất số liệu cho Prometheus tại /metrics.
+
+Mỗi span (convert, trim, transcribe, translate, export, email) ghi lại:
+  - thời gian chạy vào histogram beme_stage_duration_seconds{stage, status}
+  - thời lượng âm thanh, số byte, token OpenAI, số lần thử lại vào các counter tương ứng
+  - một dòng log JSON kèm job_id để đối chiếu các bước của cùng một job
+
+Số liệu được cộng dồn trong SQLite (giống hạn mức và hàng đợi job) nên mọi worker gunicorn
+cùng ghi vào một chỗ và /metrics ở worker nào cũng trả về số liệu của cả máy.
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+# Đọc cấu hình từ file .env trước khi lấy các biến môi trường bên dưới
+load_dotenv()
+
+METRICS_DB = os.getenv("METRICS_DB", os.path.join("cache", "metrics.sqlite3"))
+SPAN_LOG_FILE = os.getenv("SPAN_LOG_FILE")   # File log JSON lines; mặc định in ra stdout
+# Bước xử lý kéo dài từ vài chục ms (xuất file) tới hàng giờ (phiên âm bài giảng dài)
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+# Thuộc tính số của span -> (counter, nhãn thêm)
+SPAN_COUNTERS = {
+    'audio_seconds': ('beme_stage_audio_seconds_total', {}),
+    'bytes': ('beme_stage_bytes_total', {}),
+    'retries': ('beme_stage_retries_total', {}),
+    'prompt_tokens': ('beme_openai_tokens_total', {'type': 'prompt'}),
+    'completion_tokens': ('beme_openai_tokens_total', {'type': 'completion'}),
+    'cached_tokens': ('beme_openai_tokens_total', {'type': 'cached'}),  # Phần prompt_tokens trúng prompt cache
+}
+METRIC_HELP = {
+    'beme_stage_duration_seconds': ('histogram', "Thời gian chạy mỗi bước xử lý"),
+    'beme_stage_audio_seconds_total': ('counter', "Tổng thời lượng âm thanh đã qua mỗi bước"),
+    'beme_stage_bytes_total': ('counter', "Tổng số byte đầu vào/đầu ra của mỗi bước"),
+    'beme_stage_retries_total': ('counter', "Số lần thử lại trong mỗi bước"),
+    'beme_openai_tokens_total': ('counter', "Token OpenAI đã dùng theo bước"),
+    'beme_openai_retries_total': ('counter', "Số lần thử lại request OpenAI theo loại lỗi"),
+}
+
+_current_job = contextvars.ContextVar('job_id', default=None)
+_current_span = contextvars.ContextVar('span', default=None)
+
+
+class MetricsStore:
+    """Các giá trị cộng dồn (counter, bucket histogram) theo tên + nhãn, dùng chung giữa các tiến trình."""
+
+    def __init__(self, db_path=METRICS_DB):
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS metrics (
+                    name TEXT NOT NULL,
+                    labels TEXT NOT NULL,
+                    value REAL NOT NULL,
+                    PRIMARY KEY (name, labels)
+                )
+            """)
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+
+    # Cộng nhiều giá trị trong một transaction: [(tên, nhãn, lượng), ...]
+    def add(self, updates):
+        rows = [(name, format_labels(labels), amount) for name, labels, amount in updates]
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany("""
+                INSERT INTO metrics (name, labels, value) VALUES (?, ?, ?)
+                ON CONFLICT (name, labels) DO UPDATE SET value = value + excluded.value
+            """, rows)
+            conn.execute("COMMIT")
+
+    def samples(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT name, labels, value FROM metrics").fetchall()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_labels(labels):
+    # Nhãn theo thứ tự tên, le (bucket histogram) luôn đứng cuối
+    ordered = sorted(labels.items(), key=lambda item: (item[0] == 'le', item[0]))
+    return ",".join(f'{key}="{_escape(value)}"' for key, value in ordered)
+
+def _format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+def _bucket_label(bound):
+    return "+Inf" if bound == float('inf') else _format_value(bound)
+
+# Văn bản theo định dạng exposition của Prometheus (text/plain; version=0.0.4)
+def render_metrics(store=None):
+    store = store or get_store()
+    families = {}
+    for name, labels, value in store.samples():
+        family = name
+        for suffix in ('_bucket', '_sum', '_count'):
+            if name.endswith(suffix) and name[:-len(suffix)] in METRIC_HELP:
+                family = name[:-len(suffix)]
+        families.setdefault(family, []).append((name, labels, value))
+
+    lines = []
+    for family in sorted(families):
+        kind, help_text = METRIC_HELP.get(family, ('untyped', ''))
+        lines.append(f"# HELP {family} {help_text}")
+        lines.append(f"# TYPE {family} {kind}")
+        # Bucket phải theo thứ tự le tăng dần trong mỗi nhóm nhãn
+        for name, labels, value in sorted(families[family], key=_sample_order):
+            lines.append(f"{name}{{{labels}}} {_format_value(value)}" if labels else f"{name} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+def _sample_order(sample):
+    name, labels, _ = sample
+    others, le = [], 0.0
+    for part in labels.split(','):
+        if part.startswith('le="'):
+            le = float(part[4:-1].replace('+Inf', 'inf'))
+        else:
+            others.append(part)
+    return (','.join(others), name, le)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = MetricsStore()
+        return _store
+
+
+def _make_span_logger():
+    logger = logging.getLogger("beme.spans")
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    if SPAN_LOG_FILE:
+        handler = logging.FileHandler(SPAN_LOG_FILE, encoding='utf-8')
+    else:
+        handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    return logger
+
+span_logger = _make_span_logger()
+
+
+# Gắn job id cho mọi span chạy trong khối này (kể cả task asyncio và asyncio.to_thread tạo bên trong)
+@contextmanager
+def job_context(job_id):
+    token = _current_job.set(job_id)
+    try:
+        yield
+    finally:
+        _current_job.reset(token)
+
+def current_job_id():
+    return _current_job.get()
+
+
+class Span:
+    def __init__(self, stage, attributes):
+        self.stage = stage
+        self.attributes = dict(attributes)
+        self._lock = threading.Lock()
+
+    def set(self, **attributes):
+        with self._lock:
+            self.attributes.update(attributes)
+
+    # Cộng dồn thuộc tính số (token, số lần thử lại); có thể gọi từ nhiều thread của cùng bước
+    def add(self, name, amount=1):
+        with self._lock:
+            self.attributes[name] = (self.attributes.get(name) or 0) + amount
+
+
+# Đo một bước xử lý: with span('transcribe', audio_seconds=...) as current: ...
+@contextmanager
+def span(stage, **attributes):
+    current = Span(stage, attributes)
+    token = _current_span.set(current)
+    started = time.perf_counter()
+    status, error = 'ok', None
+    try:
+        yield current
+    except BaseException as e:
+        status, error = 'error', f"{e.__class__.__name__}: {e}"
+        raise
+    finally:
+        _current_span.reset(token)
+        _record(current, time.perf_counter() - started, status, error)
+
+def current_span():
+    return _current_span.get()
+
+# Token sử dụng của một response OpenAI (response.usage hoặc chunk cuối khi stream)
+def record_usage(usage):
+    current = current_span()
+    if current is None or usage is None:
+        return
+    current.add('prompt_tokens', getattr(usage, 'prompt_tokens', 0) or 0)
+    current.add('completion_tokens', getattr(usage, 'completion_tokens', 0) or 0)
+    details = getattr(usage, 'prompt_tokens_details', None)
+    current.add('cached_tokens', getattr(details, 'cached_tokens', 0) or 0)
+
+def record_retry(reason):
+    current = current_span()
+    if current is not None:
+        current.add('retries')
+    _safe_add([('beme_openai_retries_total', {'reason': reason}, 1)])
+
+def _record(current, elapsed, status, error):
+    labels = {'stage': current.stage, 'status': status}
+    updates = [
+        ('beme_stage_duration_seconds_sum', labels, elapsed),
+        ('beme_stage_duration_seconds_count', labels, 1),
+    ]
+    for bound in DURATION_BUCKETS + (float('inf'),):
+        updates.append(('beme_stage_duration_seconds_bucket', dict(labels, le=_bucket_label(bound)),
+                        1 if elapsed <= bound else 0))
+    for attribute, (name, extra) in SPAN_COUNTERS.items():
+        value = current.attributes.get(attribute)
+        if isinstance(value, (int, float)) and value:
+            updates.append((name, dict(extra, stage=current.stage), value))
+    _safe_add(updates)
+
+    record = {'ts': round(time.time(), 3), 'span': current.stage, 'job_id': current_job_id(),
+              'status': status, 'duration_ms': round(elapsed * 1000, 1)}
+    record.update(current.attributes)
+    if error:
+        record['error'] = error
+    span_logger.info(json.dumps(record, ensure_ascii=False, default=str))
+
+# Lỗi ghi số liệu không được làm hỏng job
+def _safe_add(updates):
+    try:
+        get_store().add(updates)
+    except sqlite3.Error as e:
+        print(f"Lỗi khi ghi số liệu: {e}")
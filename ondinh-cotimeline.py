@@ -1,27 +1,31 @@
 import os
+import uuid
+import asyncio
 import subprocess
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.mime.base import MIMEBase
-from email import encoders
-from flask import Flask, request, jsonify, render_template
+import threading
+from flask import Flask, Response, request, jsonify, render_template, send_from_directory, stream_with_context, url_for
 from werkzeug.utils import secure_filename
 from dotenv import load_dotenv
-from openai import OpenAI
-from docx import Document
+from jobs import (STATUS_QUEUED, STATUS_RUNNING, JobQueue, QueueFullError, ensure_workers, event_stream,
+                  start_event_sweeper, tenant_key)
+from mailer import DOWNLOAD_FOLDER, EMAIL_JOB_KIND, deliver_email, enqueue_email
+from openai_client import get_client
+from async_pipeline import AudioPipeline
+from exports import export_segments
+from media import probe_media, stream_convert
+from metrics import render_metrics
+from resumable_upload import STATUS_UPLOADING, UploadError, UploadStore, start_prefix_extraction
+from scratch import ScratchFullError, scratch
 
 # Tải biến môi trường từ file .env
 load_dotenv()
 
-# Cấu hình client OpenAI
-client = OpenAI(
-    api_key=os.getenv("OPENAI_API_KEY")  # Lấy API Key từ biến môi trường
-)
+# Client OpenAI dùng chung (connection pool, thử lại khi 429/5xx, hạn mức giữa các worker)
+client = get_client()
 
 # Cấu hình ứng dụng Flask
 app = Flask(__name__)
-app.config['UPLOAD_FOLDER'] = 'uploads'
+app.config['UPLOAD_FOLDER'] = scratch.root  # Mỗi job một thư mục con uploads/<job_id>/
 app.config['ALLOWED_EXTENSIONS'] = {
     'wav', 'mp3', 'flac', 'm4a', 'aac', 'mp4', 'mov', 'avi', 'mkv', 'amsr', 'ogg'
 }
@@ -29,177 +33,122 @@ app.config['ALLOWED_EXTENSIONS'] = {
 # Đảm bảo thư mục uploads tồn tại
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
-# Cấu hình email server
-SMTP_SERVER = "smtp.gmail.com"
-SMTP_PORT = 587
-SMTP_USERNAME = os.getenv("SMTP_USERNAME")  # Email của bạn
-SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")  # Mật khẩu email của bạn
+# Hàng đợi xử lý nền: /upload chỉ lưu file và trả về job id
+JOB_KIND = "audio_timeline"
+job_queue = JobQueue()
+upload_store = UploadStore(app.config['UPLOAD_FOLDER'])
 
 # Kiểm tra định dạng file hợp lệ
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
-# Chuyển đổi định dạng âm thanh/video sang WAV bằng FFmpeg
-def convert_audio(input_path, output_path):
+# Đo độ dài âm thanh lúc upload để hàng đợi ưu tiên file ngắn; lỗi thì để worker báo khi chuyển đổi
+def probe_audio(input_path):
     try:
-        processed_output_path = f"{os.path.splitext(output_path)[0]}_processed.wav"
-        subprocess.run([
-            'ffmpeg', '-y', '-i', input_path,
-            '-ar', '16000',  # Tần số lấy mẫu
-            '-ac', '1',       # Mono channel
-            '-f', 'wav',
-            processed_output_path
-        ], check=True)
-        if os.path.exists(processed_output_path):
-            print(f"Chuyển đổi thành công: {processed_output_path}")
-            return processed_output_path
-        else:
-            print(f"Chuyển đổi thất bại: {processed_output_path} không tồn tại.")
-            return None
-    except subprocess.CalledProcessError as e:
-        print(f"FFmpeg error: {e}")
+        return probe_media(input_path)
+    except (subprocess.CalledProcessError, ValueError) as e:
+        print(f"FFprobe error: {e}")
         return None
 
-# Chuyển đổi giọng nói thành văn bản bằng Whisper API
-def transcribe_audio(file_path):
-    try:
-        with open(file_path, 'rb') as audio_file:
-            response = client.audio.transcriptions.create(
-                model="whisper-1",
-                file=audio_file,
-                language="vi",  # Ngôn ngữ: tiếng Việt
-                response_format="verbose_json"  # Định dạng phản hồi bao gồm timestamps
-            )
-        
-        # Kiểm tra xem phản hồi có chứa thuộc tính 'segments' không
-        if hasattr(response, 'segments') and response.segments:
-            transcript_with_timestamps = []
-            for segment in response.segments:
-                start_time = segment.start
-                end_time = segment.end
-                text = segment.text.strip()
-                transcript_with_timestamps.append({
-                    "start": start_time,
-                    "end": end_time,
-                    "text": text
-                })
-            return transcript_with_timestamps
-        else:
-            # Nếu không có segments, chỉ lấy toàn bộ văn bản
-            return [{"start": 0, "end": 0, "text": response.text.strip()}]
-    except Exception as e:
-        print(f"Whisper API error for file {file_path}: {e}")
-        return []
-
-# Dịch song ngữ bằng ChatGPT
-def translate_bilingual(transcript_with_timestamps):
-    if not transcript_with_timestamps:
-        return "..."
-
-    bilingual_segments = []
-    
-    for segment in transcript_with_timestamps:
-        vietnamese_text = segment['text']
-        end_time = segment['end']
-        
-        # Chuyển end_time thành định dạng phút:giây
-        end_min = int(end_time // 60)
-        end_sec = int(end_time % 60)
-        time_formatted = f"[{end_min}:{end_sec:02}]"
-        
-        prompt = f"""
-Bạn nhận được đoạn văn bản sau đây từ Whisper API. Nếu có phần không rõ ràng, hãy thay thế bằng dấu "...".
-Nhiệm vụ của bạn là:
-
-1. Chỉnh sửa nội dung để rõ ràng, dễ đọc hơn.
-2. Dịch nội dung sang tiếng Anh theo định dạng:
-   - {time_formatted}: {vietnamese_text}
-   -> {time_formatted}: <Bản dịch tiếng Anh>
-
-   Làm theo mẫu sau:
--  [0:02]: Anh nhớ, đừng lấy những cái nót ở đó.
--> [0:02]: Remember, don't take those notes there.
-
--  [0:04]: Anh nhớ, đừng lấy những cái nót ở đó.
--> [0:04]: Remember, don't take those notes there.
-Nội dung: "{vietnamese_text}"
-"""
-        try:
-            response = client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "Bạn là chuyên gia dịch thuật."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=3000,
-                temperature=0.3,
-            )
-            # Đảm bảo truy cập đúng cấu trúc phản hồi
-            translated_text = response.choices[0].message.content.strip()
-            bilingual_segments.append(translated_text)
-        except Exception as e:
-            print(f"ChatGPT API error: {e}")
-            bilingual_segments.append(f"A (Tiếng Việt) {time_formatted}: {vietnamese_text}\nB (English) {time_formatted}: ...")
-    
-    return "\n".join(bilingual_segments)
-
-
-# Xuất kết quả ra file Word
-def export_to_word(bilingual_text, output_file):
-    try:
-        document = Document()
-        document.add_heading("Bản Dịch Song Ngữ", level=1)
-        
-        bilingual_lines = bilingual_text.split('\n')
-        for line in bilingual_lines:
-            if line.strip():  # Kiểm tra nếu dòng không rỗng
-                document.add_paragraph(line)
-        
-        document.save(output_file)
-        print(f"Xuất file Word thành công: {output_file}")
-        return output_file
-    except Exception as e:
-        print(f"Lỗi khi xuất file Word: {e}")
-        return None
+# Tổng độ dài các file của một job (giây); None nếu không đo được file nào
+def job_cost(probes):
+    durations = [probe['duration'] for probe in probes if probe]
+    return sum(durations) if durations else None
+
+# Hàng đợi đầy: trả 429 kèm Retry-After để trình duyệt/client biết khi nào thử lại
+def queue_full_response(error):
+    body = jsonify({'error': str(error), 'retry_after': error.retry_after})
+    return body, 429, {'Retry-After': str(error.retry_after)}
+
+# Thư mục tạm của job/upload còn đang dùng thì luồng dọn dẹp không được xóa
+def scratch_in_use(job_id):
+    job = job_queue.get(job_id)
+    if job:
+        return job['status'] in (STATUS_QUEUED, STATUS_RUNNING)
+    session = upload_store.get(job_id)
+    return session is not None and session['status'] == STATUS_UPLOADING
+
+# Chạy toàn bộ pipeline cho một job (nhiều file) trong luồng nền: các file đi qua
+# các bước theo kiểu dây chuyền, file lỗi được báo riêng và không làm hỏng cả job.
+# Thư mục tạm của job luôn được xóa khi xong hoặc lỗi.
+def process_job(job, queue):
+    with scratch.job(job['id']) as work:
+        return run_pipeline(job, queue, work)
+
+def run_pipeline(job, queue, work):
+    payload = job['payload']
+    stages = {item['filename']: 'queued' for item in payload['files']}
+    stages_lock = threading.Lock()
+
+    # Pipeline gọi callback trong thread riêng: khóa để bản ghi mới nhất không bị bản cũ ghi đè
+    def on_stage(filename, stage):
+        with stages_lock:
+            stages[filename] = stage
+            queue.set_stage(job['id'], '; '.join(f'{stage}:{name}' for name, stage in stages.items()))
+
+    # Mỗi đoạn dịch xong được đẩy ngay tới trình duyệt (SSE), không chờ cả file
+    def on_segment(filename, index, text):
+        queue.add_event(job['id'], 'segment', {'filename': filename, 'index': index, 'text': text})
+
+    # File kết quả nằm trong outbox của job, worker email xóa sau khi gửi
+    pipeline = AudioPipeline(client, work.outbox(), export_segments, on_stage, on_segment,
+                             upload_store=upload_store, scratch=work)
+    file_results = asyncio.run(pipeline.run(payload['files']))
+
+    # Mỗi file thành công có bản Word, phụ đề SRT/VTT và JSON
+    attachments = [path for result in file_results if result['status'] == 'done' for path in result['output_paths']]
+    if not attachments:
+        errors = '; '.join(f"{result['filename']}: {result['error']}" for result in file_results)
+        raise RuntimeError(f'Không có file nào được xử lý thành công để gửi email. {errors}')
 
-# Gửi email với file đính kèm
-def send_email_with_attachment(to_email, subject, body, attachment_paths):
-    try:
-        msg = MIMEMultipart()
-        msg['From'] = SMTP_USERNAME
-        msg['To'] = to_email
-        msg['Subject'] = subject
-
-        msg.attach(MIMEText(body, 'plain'))
-
-        for attachment_path in attachment_paths:
-            if not os.path.isfile(attachment_path):
-                print(f"File không tồn tại để đính kèm: {attachment_path}")
-                continue
-            with open(attachment_path, 'rb') as attachment:
-                part = MIMEBase('application', 'octet-stream')
-                part.set_payload(attachment.read())
-                encoders.encode_base64(part)
-                part.add_header(
-                    'Content-Disposition',
-                    f'attachment; filename={os.path.basename(attachment_path)}'
-                )
-                msg.attach(part)
-
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            server.starttls()
-            server.login(SMTP_USERNAME, SMTP_PASSWORD)
-            server.send_message(msg)
-        print(f"Email đã được gửi tới {to_email}")
-    except Exception as e:
-        print(f"Không thể gửi email: {e}")
+    # Gửi email với các file Word đính kèm
+    queue.set_stage(job['id'], 'emailing')
+    # Chỉ đưa thư vào hàng đợi; worker "email" gửi qua kết nối SMTP dùng chung và tự thử lại
+    enqueue_email(
+        queue, payload['email'],
+        subject="Kết quả dịch âm thanh",
+        body="Vui lòng kiểm tra file đính kèm để xem kết quả.",
+        attachment_paths=attachments,
+        base_url=payload.get('base_url'),
+        cleanup_dir=work.outbox()
+    )
+
+    all_results = {}
+    for idx, result in enumerate(file_results):
+        # Bản dịch đã được gửi qua sự kiện "segment" và email, không lưu lại trong kết quả job
+        all_results[f"file_{idx + 1}"] = {key: value for key, value in result.items() if key != 'output_paths'}
+    failed = sum(1 for result in file_results if result['status'] == 'failed')
+    message = 'Kết quả sẽ được gửi qua email.'
+    if failed:
+        message += f' {failed} file bị lỗi, xem chi tiết trong kết quả.'
+    return {'message': message, 'results': all_results}
+
+# Khởi động pool worker trong mỗi tiến trình (kể cả sau khi gunicorn fork)
+@app.before_request
+def start_job_workers():
+    ensure_workers(job_queue, JOB_KIND, process_job)
+    # Một worker gửi thư mỗi tiến trình để dùng lại một kết nối SMTP
+    ensure_workers(job_queue, EMAIL_JOB_KIND, deliver_email, num_workers=1)
+    scratch.start_sweeper(scratch_in_use)
+    start_event_sweeper(job_queue)
 
 # Trang chính của ứng dụng
 @app.route('/')
 def index():
     return render_template('index.html')
 
-# Xử lý upload file
+# Tên file không trùng (kể cả khác đuôi) với các file khác trong cùng job: thêm _2, _3... vào sau tên.
+# Tên file là khóa của trạng thái từng file, file tạm và file kết quả <tên>_result.* của job.
+def unique_filename(filename, taken):
+    stem, extension = os.path.splitext(filename)
+    candidate, counter = stem, 1
+    while candidate.lower() in taken:
+        counter += 1
+        candidate = f"{stem}_{counter}"
+    taken.add(candidate.lower())
+    return f"{candidate}{extension}"
+
+# Xử lý upload file: lưu các file, đưa vào hàng đợi và trả về job id ngay
 @app.route('/upload', methods=['POST'])
 def upload_file():
     if 'audio' not in request.files or 'email' not in request.form:
@@ -210,68 +159,207 @@ def upload_file():
     if not files or not email:
         return jsonify({'error': 'Không có file nào được chọn hoặc email không hợp lệ.'}), 400
 
-    all_results = {}
-    attachments = []
-
-    for idx, file in enumerate(files):
-        if file and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
-            input_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(input_path)
-            print(f"Đã tải lên file: {input_path}")
-
-            output_filename = f"{os.path.splitext(filename)[0]}.wav"
-            output_path = os.path.join(app.config['UPLOAD_FOLDER'], output_filename)
-            converted = convert_audio(input_path, output_path)
-            if not converted:
-                return jsonify({'error': f'Lỗi trong quá trình chuyển đổi định dạng âm thanh/video của file {filename}.'}), 500
-
-            # Chuyển đổi WAV thành văn bản
-            transcript_with_timestamps = transcribe_audio(converted)
-            if not transcript_with_timestamps:
-                return jsonify({'error': f'Lỗi trong quá trình phiên âm âm thanh của file {filename}.'}), 500
-
-            bilingual_text = translate_bilingual(transcript_with_timestamps)
-            if not bilingual_text:
-                return jsonify({'error': f'Lỗi trong quá trình dịch song ngữ của file {filename}.'}), 500
-
-            word_file_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{os.path.splitext(filename)[0]}_result.docx")
-            export_status = export_to_word(bilingual_text, word_file_path)
-            if not export_status:
-                return jsonify({'error': f'Lỗi trong quá trình xuất file Word của file {filename}.'}), 500
-
-            attachments.append(word_file_path)
-            print(f"Đã thêm file Word vào đính kèm: {word_file_path}")
-
-            # Lưu kết quả vào biến tạm
-            variable_name = f"file_{idx + 1}"
-            all_results[variable_name] = {
-                "bilingual_text": bilingual_text
-            }
-
-            # Xóa file gốc và file đã chuyển đổi
-            try:
-                if os.path.exists(input_path):
-                    os.remove(input_path)
-                    print(f"Đã xóa file gốc: {input_path}")
-                if os.path.exists(converted):
-                    os.remove(converted)
-                    print(f"Đã xóa file chuyển đổi: {converted}")
-            except Exception as e:
-                print(f"Error deleting files: {e}")
-
-    if not attachments:
-        return jsonify({'error': 'Không có file nào được xử lý thành công để gửi email.'}), 500
+    tenant = tenant_key(email)
+    try:
+        scratch.check_quota(request.content_length)
+        job_queue.check_admission(JOB_KIND, tenant)
+    except ScratchFullError as e:
+        return jsonify({'error': str(e)}), 507
+    except QueueFullError as e:
+        return queue_full_response(e)
+
+    # Lưu vào thư mục riêng của job nên hai người upload cùng tên file không ghi đè nhau
+    job_id = uuid.uuid4().hex
+    try:
+        saved_files = []
+        taken = set()
+        for file in files:
+            if file and allowed_file(file.filename):
+                filename = unique_filename(secure_filename(file.filename), taken)
+                input_path = os.path.join(scratch.job_dir(job_id), filename)
+                file.save(input_path)
+                print(f"Đã tải lên file: {input_path}")
+                saved_files.append({'input_path': input_path, 'filename': filename,
+                                    'probe': probe_audio(input_path)})
+
+        if not saved_files:
+            scratch.release(job_id)
+            return jsonify({'error': 'Định dạng file không được hỗ trợ.'}), 400
+
+        job_queue.enqueue(JOB_KIND, {'files': saved_files, 'email': email, 'base_url': request.host_url},
+                          job_id=job_id, cost=job_cost(item['probe'] for item in saved_files), tenant=tenant,
+                          admit=True)
+    except QueueFullError as e:
+        scratch.release(job_id)
+        return queue_full_response(e)
+    except Exception:
+        scratch.release(job_id)
+        raise
+    return jsonify({
+        'message': 'File đã được đưa vào hàng đợi xử lý.',
+        'job_id': job_id,
+        'status_url': url_for('job_status', job_id=job_id),
+        'events_url': url_for('job_events', job_id=job_id)
+    }), 202
+
+# Upload dạng luồng: thân request là nội dung một file, âm thanh được trích ngay trong lúc nhận
+# nên không phải lưu cả file video xuống uploads/ trước khi chuyển đổi
+@app.route('/upload/stream', methods=['POST'])
+def upload_stream():
+    filename = secure_filename(request.args.get('filename', ''))
+    email = request.args.get('email', '')
+    if not filename or not email:
+        return jsonify({'error': 'Không có file nào được chọn hoặc email không hợp lệ.'}), 400
+    if not allowed_file(filename):
+        return jsonify({'error': 'Định dạng file không được hỗ trợ.'}), 400
 
-    # Gửi email với các file Word đính kèm
-    send_email_with_attachment(
-        to_email=email,
-        subject="Kết quả dịch âm thanh",
-        body="Vui lòng kiểm tra file đính kèm để xem kết quả.",
-        attachment_paths=attachments
+    tenant = tenant_key(email)
+    try:
+        scratch.check_quota(request.content_length)
+        job_queue.check_admission(JOB_KIND, tenant)
+    except ScratchFullError as e:
+        return jsonify({'error': str(e)}), 507
+    except QueueFullError as e:
+        return queue_full_response(e)
+
+    job_id = uuid.uuid4().hex
+    job_dir = scratch.job_dir(job_id)
+    try:
+        converted = stream_convert(
+            request.stream, os.path.join(job_dir, f"{os.path.splitext(filename)[0]}_processed.wav"),
+            extension=filename.rsplit('.', 1)[1],
+            spool_path=os.path.join(job_dir, filename)
+        )
+        if not converted:
+            scratch.release(job_id)
+            return jsonify({'error': f'Lỗi trong quá trình chuyển đổi định dạng âm thanh/video của file {filename}.'}), 500
+        job_queue.enqueue(JOB_KIND, {
+            'files': [{'converted_path': converted, 'filename': filename}],
+            'email': email,
+            'base_url': request.host_url
+        }, job_id=job_id, cost=job_cost([probe_audio(converted)]), tenant=tenant, admit=True)
+    except QueueFullError as e:
+        scratch.release(job_id)
+        return queue_full_response(e)
+    except Exception:
+        scratch.release(job_id)
+        raise
+    return jsonify({
+        'message': 'File đã được đưa vào hàng đợi xử lý.',
+        'job_id': job_id,
+        'status_url': url_for('job_status', job_id=job_id),
+        'events_url': url_for('job_events', job_id=job_id)
+    }), 202
+
+# Upload nối tiếp được cho file lớn: tạo phiên, nhận từng khối (song song, gửi lại được), rồi hoàn tất
+@app.route('/uploads', methods=['POST'])
+def create_upload():
+    data = request.get_json(silent=True) or {}
+    filename = secure_filename(data.get('filename', ''))
+    email = data.get('email', '')
+    size = data.get('size')
+    if not filename or not email or not isinstance(size, int):
+        return jsonify({'error': 'Không có file nào được chọn hoặc email không hợp lệ.'}), 400
+    if not allowed_file(filename):
+        return jsonify({'error': 'Định dạng file không được hỗ trợ.'}), 400
+    try:
+        scratch.check_quota(size)
+        # Nhận vào hàng đợi từ lúc tạo phiên để không phải từ chối sau khi đã upload xong cả file
+        job_queue.check_admission(JOB_KIND, tenant_key(email))
+        session = upload_store.create(filename, size, email)
+    except ScratchFullError as e:
+        return jsonify({'error': str(e)}), 507
+    except QueueFullError as e:
+        return queue_full_response(e)
+    except UploadError as e:
+        return jsonify({'error': str(e)}), e.status
+    # Container đọc tuần tự được thì trích âm thanh ngay trên phần đầu đã nhận
+    start_prefix_extraction(upload_store, session)
+    return jsonify(upload_store.describe(session)), 201
+
+# Các khối đã nhận, để trình duyệt tiếp tục upload sau khi mất kết nối
+@app.route('/uploads/<upload_id>', methods=['GET'])
+def upload_status(upload_id):
+    session = upload_store.get(upload_id)
+    if not session:
+        return jsonify({'error': 'Không tìm thấy phiên upload.'}), 404
+    return jsonify(upload_store.describe(session))
+
+# Nhận một khối: thân request được ghi thẳng vào file, không qua bộ đệm form của Werkzeug
+@app.route('/uploads/<upload_id>', methods=['PUT'])
+def upload_chunk(upload_id):
+    try:
+        session = upload_store.write_chunk(
+            upload_id, request.args.get('offset', type=int), request.stream,
+            request.content_length, request.headers.get('X-Chunk-SHA256')
+        )
+    except UploadError as e:
+        return jsonify({'error': str(e)}), e.status
+    return jsonify({'received_bytes': session['received_bytes']})
+
+@app.route('/uploads/<upload_id>/complete', methods=['POST'])
+def complete_upload(upload_id):
+    session = upload_store.get(upload_id)
+    if not session:
+        return jsonify({'error': 'Không tìm thấy phiên upload.'}), 404
+    if session['status'] == STATUS_UPLOADING:
+        if session['contiguous_bytes'] < session['size']:
+            return jsonify({'error': 'Chưa nhận đủ dữ liệu của file.', **upload_store.describe(session)}), 409
+        # Job dùng luôn upload id để thư mục uploads/<upload_id>/ trở thành thư mục làm việc của job.
+        # Gọi hoàn tất nhiều lần (trình duyệt thử lại) chỉ tạo một job.
+        job_id = upload_id
+        if upload_store.mark_complete(upload_id, job_id):
+            probe = probe_audio(session['path'])
+            job_queue.enqueue(JOB_KIND, {
+                'files': [{'input_path': session['path'], 'filename': session['filename'], 'upload_id': upload_id,
+                           'probe': probe}],
+                'email': session['email'],
+                'base_url': request.host_url
+            }, job_id=job_id, cost=job_cost([probe]), tenant=tenant_key(session['email']))
+        session = upload_store.get(upload_id)
+    return jsonify({
+        'message': 'File đã được đưa vào hàng đợi xử lý.',
+        'job_id': session['job_id'],
+        'status_url': url_for('job_status', job_id=session['job_id']),
+        'events_url': url_for('job_events', job_id=session['job_id'])
+    }), 202
+
+# Trạng thái hiện tại của một job
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if not job:
+        return jsonify({'error': 'Không tìm thấy job.'}), 404
+    return jsonify({
+        'job_id': job['id'],
+        'status': job['status'],
+        'stage': job['stage'],
+        'error': job['error'],
+        'result': job['result']
+    })
+
+# Tiến trình của job dưới dạng Server-Sent Events: bước xử lý của từng file và từng đoạn dịch
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    if not job_queue.get(job_id):
+        return jsonify({'error': 'Không tìm thấy job.'}), 404
+    last_event_id = request.headers.get('Last-Event-ID', type=int, default=0)
+    return Response(
+        stream_with_context(event_stream(job_queue, job_id, last_event_id)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
     )
 
-    return jsonify({'message': 'Kết quả đã được gửi qua email.', 'results': all_results})
+# Số liệu từng bước xử lý cho Prometheus (cộng dồn từ mọi worker trên máy)
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+# Link tải kết quả được gửi qua email khi file quá lớn để đính kèm
+@app.route('/downloads/<token>/<path:filename>', methods=['GET'])
+def download_result(token, filename):
+    return send_from_directory(os.path.join(os.path.abspath(DOWNLOAD_FOLDER), secure_filename(token)), filename,
+                               as_attachment=True)
 
 if __name__ == '__main__':
     app.run(debug=True)
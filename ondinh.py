@@ -10,6 +10,7 @@ from werkzeug.utils import secure_filename
 from dotenv import load_dotenv
 from openai import OpenAI
 from docx import Document
+from prompts import get_prompt
 
 # Tải biến môi trường từ file .env
 load_dotenv()
@@ -19,6 +20,9 @@ client = OpenAI(
     api_key=os.getenv("OPENAI_API_KEY")  # Lấy API Key từ biến môi trường
 )
 
+# Prompt dịch trong thư mục prompts/ (bilingual_ab hoặc clean_bilingual)
+BILINGUAL_PROMPT = get_prompt(os.getenv("BILINGUAL_PROMPT", "bilingual_ab"))
+
 # Cấu hình ứng dụng Flask
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = 'uploads'
@@ -73,22 +77,11 @@ def transcribe_audio(file_path):
 def translate_bilingual(text):
     if not text or text.strip() == "...":
         return "..."
-    
-    prompt = f"""
-    Bạn nhận được đầu ra từ Whisper API. Nếu có phần không rõ ràng, hãy thay thế bằng dấu "...". Nhiệm vụ của bạn là:
-
-    1. Chỉnh sửa nội dung để rõ ràng, dễ đọc hơn.
-    2. Cắt nhỏ, mỗi đoạn không quá 20 từ.
-    3. Dịch nội dung sang tiếng Anh theo định dạng:
-       - A (Tiếng Việt): <Câu gốc tiếng Việt, nếu không rõ thì giữ nguyên dấu "...">
-       - B (English): <Bản dịch tiếng Anh, nếu không rõ thì giữ nguyên "...">
-    Nội dung: "{text}"
-    """
+
     try:
         response = client.chat.completions.create(
             model="gpt-4o",
-            messages=[{"role": "system", "content": "Bạn là chuyên gia dịch thuật..."},
-                      {"role": "user", "content": prompt}],
+            messages=BILINGUAL_PROMPT.messages(text=text),
             max_tokens=3000,
             temperature=0.3,
         )
@@ -0,0 +1,125 @@
+import os
+import time
+import asyncio
+import random
+import threading
+import httpx
+import openai
+from openai import AsyncOpenAI, OpenAI
+from dotenv import load_dotenv
+
+from metrics import record_retry, record_usage
+
+# Đọc cấu hình từ file .env trước khi lấy các biến môi trường bên dưới
+load_dotenv()
+
+# Một client OpenAI dùng chung cho cả Whisper và ChatGPT trong mỗi tiến trình
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None       # Ví dụ http://127.0.0.1:8001/v1 cho server giả lập
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "64"))
+OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "32"))
+OPENAI_KEEPALIVE_EXPIRY = 60.0
+OPENAI_CONNECT_TIMEOUT = 10.0
+OPENAI_READ_TIMEOUT = float(os.getenv("OPENAI_READ_TIMEOUT", "600"))  # Whisper với file lớn có thể trả lời chậm
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "5"))
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            http_client = httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=OPENAI_MAX_CONNECTIONS,
+                    max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+                    keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY
+                ),
+                timeout=httpx.Timeout(OPENAI_READ_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT)
+            )
+            _client = OpenAI(
+                api_key=os.getenv("OPENAI_API_KEY"),  # Lấy API Key từ biến môi trường
+                base_url=OPENAI_BASE_URL,
+                http_client=http_client,
+                max_retries=0  # Thử lại do call_with_retries đảm nhiệm
+            )
+        return _client
+
+# Client bất đồng bộ cho pipeline asyncio; mỗi event loop tạo một client riêng và đóng khi xong
+def make_async_client():
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+            keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY
+        ),
+        timeout=httpx.Timeout(OPENAI_READ_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT)
+    )
+    return AsyncOpenAI(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        base_url=OPENAI_BASE_URL,
+        http_client=http_client,
+        max_retries=0
+    )
+
+def is_retryable(error):
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES or error.status_code >= 500
+    return False
+
+# Thời gian chờ server yêu cầu qua header Retry-After / retry-after-ms (nếu có)
+def retry_after_seconds(error):
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if 'retry-after-ms' in headers:
+            return float(headers['retry-after-ms']) / 1000
+        if 'retry-after' in headers:
+            return float(headers['retry-after'])
+    except ValueError:
+        return None
+    return None
+
+# Gọi API với hạn mức dùng chung và thử lại (backoff lũy thừa + jitter, tôn trọng Retry-After)
+# cho lỗi 429/5xx/kết nối. Lỗi không thể thử lại hoặc hết lượt thì ném ra cho nơi gọi xử lý.
+def call_with_retries(request, limiter=None, tokens=0, max_retries=OPENAI_MAX_RETRIES):
+    for attempt in range(max_retries + 1):
+        if limiter:
+            limiter.acquire(tokens)
+        try:
+            response = request()
+            record_usage(getattr(response, 'usage', None))
+            return response
+        except Exception as e:
+            if attempt == max_retries or not is_retryable(e):
+                raise
+            time.sleep(_retry_delay(e, attempt))
+
+# Giống call_with_retries nhưng cho coroutine; chờ hạn mức trong thread để không chặn event loop
+async def call_with_retries_async(request, limiter=None, tokens=0, max_retries=OPENAI_MAX_RETRIES):
+    for attempt in range(max_retries + 1):
+        if limiter:
+            await asyncio.to_thread(limiter.acquire, tokens)
+        try:
+            response = await request()
+            record_usage(getattr(response, 'usage', None))
+            return response
+        except Exception as e:
+            if attempt == max_retries or not is_retryable(e):
+                raise
+            await asyncio.sleep(_retry_delay(e, attempt))
+
+def _retry_delay(error, attempt):
+    record_retry(error.__class__.__name__)
+    delay = retry_after_seconds(error)
+    if delay is None:
+        delay = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+    print(f"OpenAI API lỗi tạm thời ({error.__class__.__name__}), thử lại lần {attempt + 1} sau {delay:.1f}s")
+    return delay
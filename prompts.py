@@ -0,0 +1,82 @@
+"""
+Kho prompt: mỗi prompt là một file prompts/<tên>.txt, đọc một lần khi khởi động.
+
+    # dòng chú thích (bỏ qua)
+    [system]
+    Hướng dẫn, mẫu ví dụ... (giữ nguyên từng byte giữa các request)
+    [user]
+    Dữ liệu riêng của request, ví dụ: Nội dung: "{text}"
+
+Phần [system] không chứa dữ liệu của từng đoạn nên mọi request cùng prompt có chung một tiền tố
+dài, giống hệt nhau; nhà cung cấp dùng lại prompt cache cho tiền tố đó (nhanh hơn, rẻ hơn cho token
+đầu vào). Chỉ [user] được điền giá trị bằng str.format và luôn đứng cuối.
+
+Mỗi prompt có version là mã băm nội dung file: sửa prompt thì bộ nhớ dịch tự bỏ kết quả cũ.
+"""
+import os
+import hashlib
+from dotenv import load_dotenv
+
+# Đọc cấu hình từ file .env trước khi lấy các biến môi trường bên dưới
+load_dotenv()
+
+PROMPT_DIR = os.getenv("PROMPT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompts"))
+PROMPT_EXTENSION = ".txt"
+SECTIONS = ('system', 'user')
+
+
+class PromptTemplate:
+    __slots__ = ('name', 'system', 'user', 'version')
+
+    def __init__(self, name, system, user):
+        self.name = name
+        self.system = system
+        self.user = user
+        self.version = hashlib.sha256(f"{system}\0{user}".encode('utf-8')).hexdigest()[:12]
+
+    # Nội dung tin nhắn user đã điền giá trị
+    def render(self, **values):
+        return self.user.format(**values)
+
+    # Danh sách messages cho Chat Completions: tiền tố tĩnh trước, dữ liệu sau
+    def messages(self, **values):
+        return [
+            {"role": "system", "content": self.system},
+            {"role": "user", "content": self.render(**values)}
+        ]
+
+
+# Tách file prompt thành các phần [system] / [user]
+def parse_prompt(name, content):
+    sections, current = {}, None
+    for line in content.splitlines():
+        marker = line.strip()
+        if marker.startswith('[') and marker.endswith(']') and marker[1:-1] in SECTIONS:
+            current = marker[1:-1]
+            sections[current] = []
+        elif current:
+            sections[current].append(line)
+        elif marker and not marker.startswith('#'):
+            raise ValueError(f"Prompt {name}: nội dung nằm ngoài phần [system]/[user]")
+    missing = [section for section in SECTIONS if section not in sections]
+    if missing:
+        raise ValueError(f"Prompt {name}: thiếu phần {', '.join(missing)}")
+    return PromptTemplate(name, *("\n".join(sections[section]).strip() for section in SECTIONS))
+
+def load_prompts(directory=PROMPT_DIR):
+    prompts = {}
+    for filename in sorted(os.listdir(directory)):
+        name, extension = os.path.splitext(filename)
+        if extension == PROMPT_EXTENSION:
+            with open(os.path.join(directory, filename), encoding='utf-8') as prompt_file:
+                prompts[name] = parse_prompt(name, prompt_file.read())
+    return prompts
+
+# Nạp một lần khi import: prompt lỗi hoặc thiếu thì ứng dụng báo lỗi ngay lúc khởi động
+registry = load_prompts()
+
+def get_prompt(name):
+    try:
+        return registry[name]
+    except KeyError:
+        raise KeyError(f"Không có prompt '{name}' trong {PROMPT_DIR}") from None
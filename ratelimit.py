@@ -0,0 +1,102 @@
+import os
+import time
+import sqlite3
+import threading
+from contextlib import closing
+from dotenv import load_dotenv
+
+# Đọc cấu hình từ file .env trước khi lấy các biến môi trường bên dưới
+load_dotenv()
+
+# File SQLite chứa hạn mức dùng chung giữa các tiến trình trên cùng máy
+RATE_LIMIT_DB = os.getenv("RATE_LIMIT_DB", os.path.join("cache", "ratelimit.sqlite3"))
+
+# Ước lượng thô số token của một đoạn văn bản (khoảng 4 ký tự mỗi token)
+def estimate_tokens(text):
+    return len(text) // 4 + 1
+
+
+# Giới hạn tốc độ gọi API theo số request/phút và số token/phút (0 = không giới hạn),
+# dùng chung giữa các tiến trình (các worker gunicorn) qua một file SQLite.
+# acquire(tokens) chờ tới khi đủ hạn mức cho một request dùng khoảng `tokens` token.
+class SharedRateLimiter:
+    def __init__(self, db_path, name, requests_per_minute=0, tokens_per_minute=0):
+        self.db_path = db_path
+        self.name = name
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS buckets (
+                    name TEXT PRIMARY KEY,
+                    request_allowance REAL NOT NULL,
+                    token_allowance REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute(
+                "INSERT OR IGNORE INTO buckets VALUES (?, ?, ?, ?)",
+                (name, requests_per_minute, tokens_per_minute, time.time())
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+
+    def acquire(self, tokens=0):
+        if not self.requests_per_minute and not self.tokens_per_minute:
+            return
+        if self.tokens_per_minute:
+            tokens = min(tokens, self.tokens_per_minute)
+        while True:
+            conn = self._connect()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                request_allowance, token_allowance, updated_at = conn.execute(
+                    "SELECT request_allowance, token_allowance, updated_at FROM buckets WHERE name = ?",
+                    (self.name,)
+                ).fetchone()
+                now = time.time()
+                elapsed = max(0.0, now - updated_at)
+                request_allowance = min(self.requests_per_minute,
+                                        request_allowance + elapsed * self.requests_per_minute / 60)
+                token_allowance = min(self.tokens_per_minute,
+                                      token_allowance + elapsed * self.tokens_per_minute / 60)
+
+                wait = 0.0
+                if self.requests_per_minute and request_allowance < 1:
+                    wait = max(wait, (1 - request_allowance) * 60 / self.requests_per_minute)
+                if self.tokens_per_minute and token_allowance < tokens:
+                    wait = max(wait, (tokens - token_allowance) * 60 / self.tokens_per_minute)
+                if wait == 0:
+                    if self.requests_per_minute:
+                        request_allowance -= 1
+                    if self.tokens_per_minute:
+                        token_allowance -= tokens
+                conn.execute(
+                    "UPDATE buckets SET request_allowance = ?, token_allowance = ?, updated_at = ? WHERE name = ?",
+                    (request_allowance, token_allowance, now, self.name)
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                # BEGIN có thể đã lỗi (database locked) thì không còn transaction để ROLLBACK
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+            finally:
+                conn.close()
+            if wait == 0:
+                return
+            time.sleep(wait)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+# Lấy (hoặc tạo) bộ giới hạn dùng chung theo tên, ví dụ "chat:gpt-4" hoặc "audio:whisper-1"
+def get_limiter(name, requests_per_minute=0, tokens_per_minute=0):
+    with _limiters_lock:
+        if name not in _limiters:
+            _limiters[name] = SharedRateLimiter(RATE_LIMIT_DB, name, requests_per_minute, tokens_per_minute)
+        return _limiters[name]
@@ -0,0 +1,319 @@
+"""
+Upload nối tiếp được cho file bài giảng lớn (video MKV/MP4 vài GB):
+  POST /uploads                    {"filename", "size", "email"} -> upload_id, chunk_size
+  PUT  /uploads/<id>?offset=N      thân request là một khối, header X-Chunk-SHA256 (tùy chọn)
+  GET  /uploads/<id>               các khối đã nhận, để tiếp tục sau khi mất kết nối
+  POST /uploads/<id>/complete      kiểm tra đủ dữ liệu rồi đưa file vào hàng đợi xử lý
+
+Mỗi khối được ghi thẳng vào đúng vị trí trong file đích (không qua bộ đệm của Werkzeug) nên
+trình duyệt gửi song song nhiều khối và chỉ gửi lại các khối chưa nhận được.
+Trạng thái lưu trong SQLite để mọi worker gunicorn cùng nhận khối của một lần upload.
+
+Với container đọc tuần tự được (MKV, MP3, WAV, ...) ffmpeg bắt đầu trích âm thanh ngay trên
+phần đầu liên tục đã nhận, nên khi khối cuối tới thì bước chuyển đổi cũng gần xong.
+"""
+import os
+import time
+import uuid
+import sqlite3
+import shutil
+import hashlib
+import threading
+from dotenv import load_dotenv
+
+from media import STREAMABLE_EXTENSIONS, stream_convert
+
+# Đọc cấu hình từ file .env trước khi lấy các biến môi trường bên dưới
+load_dotenv()
+
+UPLOAD_SESSIONS_DB = os.getenv("UPLOAD_SESSIONS_DB", os.path.join("cache", "uploads.sqlite3"))
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(8 * 1024 * 1024)))
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(8 * 1024 * 1024 * 1024)))
+UPLOAD_SESSION_TTL = int(os.getenv("UPLOAD_SESSION_TTL", str(24 * 3600)))   # Upload bỏ dở quá lâu thì xóa
+UPLOAD_IDLE_SECONDS = int(os.getenv("UPLOAD_IDLE_SECONDS", "1800"))         # Không nhận thêm dữ liệu -> dừng trích
+UPLOAD_EXTRACT_WAIT = int(os.getenv("UPLOAD_EXTRACT_WAIT", "600"))          # Job chờ trích âm thanh xong tối đa
+UPLOAD_POLL_INTERVAL = 0.2
+WRITE_BLOCK_SIZE = 1024 * 1024
+EXTRACT_HEARTBEAT_SECONDS = 5.0
+EXTRACT_STALE_SECONDS = 60.0        # Tiến trình trích âm thanh không báo sống lâu hơn mức này coi như đã chết
+
+STATUS_UPLOADING = "uploading"
+STATUS_COMPLETE = "complete"
+EXTRACT_RUNNING = "running"
+EXTRACT_DONE = "done"
+EXTRACT_FAILED = "failed"
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class UploadStore:
+    def __init__(self, upload_folder, db_path=UPLOAD_SESSIONS_DB):
+        self.upload_folder = upload_folder
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS upload_sessions (
+                    id TEXT PRIMARY KEY,
+                    filename TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    email TEXT NOT NULL,
+                    chunk_size INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    job_id TEXT,
+                    extract_status TEXT,
+                    converted_path TEXT,
+                    extract_heartbeat REAL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS upload_chunks (
+                    upload_id TEXT NOT NULL,
+                    offset INTEGER NOT NULL,
+                    length INTEGER NOT NULL,
+                    PRIMARY KEY (upload_id, offset)
+                )
+            """)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    # Tạo phiên upload và file đích đủ kích thước (file thưa, chưa chiếm đĩa) trong thư mục riêng
+    # uploads/<upload_id>/, cũng là thư mục làm việc của job sau khi hoàn tất (job id = upload id)
+    def create(self, filename, size, email):
+        if size <= 0 or size > UPLOAD_MAX_BYTES:
+            raise UploadError(f'Kích thước file phải từ 1 byte tới {UPLOAD_MAX_BYTES} bytes.')
+        self.expire()
+        upload_id = uuid.uuid4().hex
+        os.makedirs(os.path.join(self.upload_folder, upload_id))
+        path = os.path.join(self.upload_folder, upload_id, filename)
+        with open(path, 'wb') as target:
+            target.truncate(size)
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO upload_sessions (id, filename, path, size, email, chunk_size, status, "
+                "created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (upload_id, filename, path, size, email, UPLOAD_CHUNK_SIZE, STATUS_UPLOADING, now, now)
+            )
+        return self.get(upload_id)
+
+    def get(self, upload_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM upload_sessions WHERE id = ?", (upload_id,)).fetchone()
+            if row is None:
+                return None
+            chunks = conn.execute(
+                "SELECT offset, length FROM upload_chunks WHERE upload_id = ? ORDER BY offset", (upload_id,)
+            ).fetchall()
+        session = dict(row)
+        session['chunks'] = [(chunk['offset'], chunk['length']) for chunk in chunks]
+        if session['status'] == STATUS_COMPLETE:
+            # Danh sách khối đã bị xóa khi hoàn tất: file đã đủ dữ liệu
+            session['received_bytes'] = session['contiguous_bytes'] = session['size']
+        else:
+            session['received_bytes'] = sum(length for _, length in session['chunks'])
+            session['contiguous_bytes'] = contiguous_prefix(session['chunks'])
+        return session
+
+    # Số byte liên tục từ đầu file đã nhận đủ
+    def contiguous_bytes(self, upload_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT status, size FROM upload_sessions WHERE id = ?", (upload_id,)).fetchone()
+            if row is not None and row['status'] == STATUS_COMPLETE:
+                return row['size']
+            chunks = conn.execute(
+                "SELECT offset, length FROM upload_chunks WHERE upload_id = ? ORDER BY offset", (upload_id,)
+            ).fetchall()
+        return contiguous_prefix(chunks)
+
+    # Ghi một khối vào đúng vị trí; chỉ đánh dấu đã nhận khi đủ độ dài và đúng SHA-256
+    def write_chunk(self, upload_id, offset, stream, length, checksum=None):
+        session = self.get(upload_id)
+        if session is None:
+            raise UploadError('Không tìm thấy phiên upload.', 404)
+        if session['status'] != STATUS_UPLOADING:
+            raise UploadError('Phiên upload đã hoàn tất.', 409)
+        if offset is None or length is None or offset < 0 or length <= 0:
+            raise UploadError('Thiếu offset hoặc Content-Length.')
+        if length > session['chunk_size'] or offset + length > session['size']:
+            raise UploadError('Khối vượt quá kích thước cho phép.', 413)
+
+        if (offset, length) in session['chunks']:
+            # Khối đã nhận (trình duyệt gửi lại sau khi mất phản hồi): bỏ qua để không ghi đè dữ liệu đã kiểm tra
+            while stream.read(WRITE_BLOCK_SIZE):
+                pass
+            return session
+
+        digest = hashlib.sha256()
+        written = 0
+        with open(session['path'], 'r+b') as target:
+            target.seek(offset)
+            while written < length:
+                block = stream.read(min(WRITE_BLOCK_SIZE, length - written))
+                if not block:
+                    break
+                digest.update(block)
+                target.write(block)
+                written += len(block)
+        if written != length:
+            raise UploadError(f'Khối bị ngắt giữa chừng ({written}/{length} bytes).')
+        if checksum and checksum.lower() != digest.hexdigest():
+            raise UploadError('Checksum của khối không khớp, vui lòng gửi lại.', 422)
+
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO upload_chunks (upload_id, offset, length) VALUES (?, ?, ?)",
+                         (upload_id, offset, length))
+            conn.execute("UPDATE upload_sessions SET updated_at = ? WHERE id = ?", (time.time(), upload_id))
+        return self.get(upload_id)
+
+    # Chuyển phiên sang "complete" đúng một lần (nhiều request hoàn tất cùng lúc chỉ một cái thắng).
+    # File đã đủ dữ liệu nên không cần giữ danh sách khối nữa.
+    def mark_complete(self, upload_id, job_id):
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE upload_sessions SET status = ?, job_id = ?, updated_at = ? WHERE id = ? AND status = ?",
+                (STATUS_COMPLETE, job_id, time.time(), upload_id, STATUS_UPLOADING)
+            )
+            if cursor.rowcount != 1:
+                return False
+            conn.execute("DELETE FROM upload_chunks WHERE upload_id = ?", (upload_id,))
+            return True
+
+    def set_extract(self, upload_id, status, converted_path=None):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE upload_sessions SET extract_status = ?, converted_path = ?, extract_heartbeat = ? "
+                "WHERE id = ?",
+                (status, converted_path, time.time(), upload_id)
+            )
+
+    def touch_extract(self, upload_id):
+        with self._connect() as conn:
+            conn.execute("UPDATE upload_sessions SET extract_heartbeat = ? WHERE id = ?", (time.time(), upload_id))
+
+    # Xóa các phiên upload không thay đổi quá UPLOAD_SESSION_TTL. Phiên bỏ dở bị xóa cùng file của chúng;
+    # thư mục của phiên đã hoàn tất là thư mục làm việc của job, do ScratchManager dọn.
+    def expire(self):
+        cutoff = time.time() - UPLOAD_SESSION_TTL
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, status FROM upload_sessions WHERE updated_at < ?", (cutoff,)
+            ).fetchall()
+            for row in rows:
+                conn.execute("DELETE FROM upload_chunks WHERE upload_id = ?", (row['id'],))
+                conn.execute("DELETE FROM upload_sessions WHERE id = ?", (row['id'],))
+        for row in rows:
+            if row['status'] == STATUS_UPLOADING:
+                shutil.rmtree(os.path.join(self.upload_folder, row['id']), ignore_errors=True)
+
+    # Trạng thái trả về cho trình duyệt
+    def describe(self, session):
+        return {
+            'upload_id': session['id'],
+            'size': session['size'],
+            'chunk_size': session['chunk_size'],
+            'received': [offset for offset, _ in session['chunks']],
+            'received_bytes': session['received_bytes'],
+            'status': session['status'],
+            'job_id': session['job_id'],
+        }
+
+
+def contiguous_prefix(chunks):
+    end = 0
+    for offset, length in chunks:
+        if offset > end:
+            break
+        end = max(end, offset + length)
+    return end
+
+
+# Đọc tuần tự phần đầu liên tục của file đang upload: chờ khi chưa có dữ liệu mới, hết file thì trả b''
+class PrefixReader:
+    def __init__(self, store, session):
+        self.store = store
+        self.upload_id = session['id']
+        self.size = session['size']
+        self.file = open(session['path'], 'rb')
+        self.position = 0
+        self.available = 0
+        self.aborted = False
+        self._last_data = time.monotonic()
+        self._last_heartbeat = 0.0
+
+    def read(self, size):
+        while self.position < self.size and not self.aborted:
+            now = time.monotonic()
+            if now - self._last_heartbeat > EXTRACT_HEARTBEAT_SECONDS:
+                self.store.touch_extract(self.upload_id)
+                self._last_heartbeat = now
+            if self.position < self.available:
+                data = self.file.read(min(size, self.available - self.position))
+                self.position += len(data)
+                self._last_data = now
+                return data
+            if now - self._last_data > UPLOAD_IDLE_SECONDS:
+                # Người dùng bỏ dở: trả b'' để ffmpeg kết thúc, kết quả dở dang bị bỏ
+                print(f"Upload {self.upload_id} không nhận thêm dữ liệu, dừng trích âm thanh")
+                self.aborted = True
+                break
+            time.sleep(UPLOAD_POLL_INTERVAL)
+            self.available = self.store.contiguous_bytes(self.upload_id)
+        return b''
+
+    def close(self):
+        self.file.close()
+
+def _extract_prefix(store, session, output_path):
+    reader = PrefixReader(store, session)
+    try:
+        converted = stream_convert(reader, output_path, extension=session['filename'].rsplit('.', 1)[1])
+    except Exception as e:
+        print(f"Lỗi trích âm thanh trong lúc upload {session['id']}: {e}")
+        converted = None
+    finally:
+        reader.close()
+    if converted and not reader.aborted:
+        store.set_extract(session['id'], EXTRACT_DONE, converted)
+        return
+    if os.path.exists(output_path):
+        os.remove(output_path)
+    store.set_extract(session['id'], EXTRACT_FAILED)
+
+# Bắt đầu trích âm thanh song song với upload (chỉ container đọc tuần tự được)
+def start_prefix_extraction(store, session):
+    extension = session['filename'].rsplit('.', 1)[-1].lower()
+    if extension not in STREAMABLE_EXTENSIONS:
+        return False
+    output_name = f"{os.path.splitext(session['filename'])[0]}_processed.wav"
+    output_path = os.path.join(store.upload_folder, session['id'], output_name)
+    store.set_extract(session['id'], EXTRACT_RUNNING)
+    threading.Thread(target=_extract_prefix, args=(store, session, output_path),
+                     name=f"upload-extract-{session['id'][:8]}", daemon=True).start()
+    return True
+
+# Dùng trong job: chờ phần trích âm thanh chạy song song với upload; None = tự chuyển đổi từ file đầy đủ
+def wait_for_extraction(store, upload_id, timeout=UPLOAD_EXTRACT_WAIT):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        session = store.get(upload_id)
+        if session is None or session['extract_status'] in (None, EXTRACT_FAILED):
+            return None
+        if session['extract_status'] == EXTRACT_DONE:
+            return session['converted_path']
+        if time.time() - (session['extract_heartbeat'] or 0) > EXTRACT_STALE_SECONDS:
+            print(f"Tiến trình trích âm thanh của upload {upload_id} không phản hồi, chuyển đổi lại từ file")
+            return None
+        time.sleep(UPLOAD_POLL_INTERVAL)
+    return None
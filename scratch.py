@@ -0,0 +1,208 @@
+"""
+Thư mục tạm theo từng job, có hạn mức dung lượng và dọn dẹp chắc chắn.
+
+  uploads/<job_id>/          file upload và file trung gian (WAV, bản đã lọc khoảng lặng)
+  uploads/outbox/<job_id>/   file kết quả chờ worker email gửi đi; worker xóa sau khi gửi xong
+  /dev/shm/beme/<job_id>/    file trung gian đặt trên tmpfs (RAM) khi còn đủ chỗ
+
+Mỗi job có thư mục riêng nên hai người upload cùng tên file không ghi đè nhau. Thư mục của job
+bị xóa khi job kết thúc theo bất kỳ cách nào; luồng dọn dẹp nền xóa thư mục mồ côi (worker chết
+giữa chừng, upload bỏ dở) và file cũ nằm lẻ trong uploads/. Thư mục khác có hạn lưu (ví dụ
+downloads/ của link tải kết quả) được đăng ký bằng expire() để cùng luồng dọn dẹp xóa khi quá hạn.
+"""
+import os
+import time
+import shutil
+import threading
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+# Đọc cấu hình từ file .env trước khi lấy các biến môi trường bên dưới
+load_dotenv()
+
+SCRATCH_DIR = os.getenv("SCRATCH_DIR", "uploads")
+SCRATCH_QUOTA_BYTES = int(os.getenv("SCRATCH_QUOTA_BYTES", str(50 * 1024 ** 3)))
+# tmpfs cho file trung gian; đặt SCRATCH_TMPFS_DIR="" để tắt
+SCRATCH_TMPFS_DIR = os.getenv("SCRATCH_TMPFS_DIR", "/dev/shm/beme" if os.path.isdir("/dev/shm") else "")
+SCRATCH_TMPFS_QUOTA_BYTES = int(os.getenv("SCRATCH_TMPFS_QUOTA_BYTES", str(1024 ** 3)))
+SCRATCH_TMPFS_MIN_FREE_BYTES = 256 * 1024 * 1024   # Luôn chừa RAM cho hệ thống
+SCRATCH_ORPHAN_SECONDS = int(os.getenv("SCRATCH_ORPHAN_SECONDS", str(6 * 3600)))
+SCRATCH_OUTBOX_SECONDS = int(os.getenv("SCRATCH_OUTBOX_SECONDS", str(3 * 24 * 3600)))
+SCRATCH_SWEEP_INTERVAL = int(os.getenv("SCRATCH_SWEEP_INTERVAL", "600"))
+USAGE_CACHE_SECONDS = 2.0
+OUTBOX = "outbox"
+
+
+class ScratchFullError(Exception):
+    pass
+
+
+def directory_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_blocks * 512  # Dung lượng thật (file thưa)
+            except OSError:
+                pass
+    return total
+
+# Thời điểm sửa đổi mới nhất trong cây thư mục (upload đang nhận khối vẫn được coi là còn sống)
+def newest_mtime(path):
+    newest = os.path.getmtime(path)
+    for root, dirs, files in os.walk(path):
+        for name in dirs + files:
+            try:
+                newest = max(newest, os.path.getmtime(os.path.join(root, name)))
+            except OSError:
+                pass
+    return newest
+
+def remove_path(path):
+    try:
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.remove(path)
+    except OSError as e:
+        print(f"Không xóa được {path}: {e}")
+
+
+class JobScratch:
+    """Thư mục làm việc của một job; file trung gian có thể nằm trên tmpfs."""
+
+    def __init__(self, manager, job_id):
+        self.manager = manager
+        self.job_id = job_id
+        self.dir = manager.job_dir(job_id)
+
+    def path(self, name):
+        return os.path.join(self.dir, name)
+
+    # Đường dẫn cho file trung gian khoảng expected_bytes: tmpfs nếu còn chỗ, không thì đĩa
+    def fast_path(self, name, expected_bytes):
+        tmpfs_dir = self.manager.tmpfs_job_dir(self.job_id, expected_bytes)
+        return os.path.join(tmpfs_dir or self.dir, name)
+
+    # Thư mục kết quả gửi kèm email, không bị xóa khi job xong
+    def outbox(self):
+        return self.manager.outbox_dir(self.job_id)
+
+
+class ScratchManager:
+    def __init__(self, root=SCRATCH_DIR, quota_bytes=SCRATCH_QUOTA_BYTES, tmpfs_root=SCRATCH_TMPFS_DIR,
+                 tmpfs_quota_bytes=SCRATCH_TMPFS_QUOTA_BYTES):
+        self.root = root
+        self.quota_bytes = quota_bytes
+        self.tmpfs_root = tmpfs_root or None
+        self.tmpfs_quota_bytes = tmpfs_quota_bytes
+        self._usage = (0.0, 0)
+        self._lock = threading.Lock()
+        self._sweeper_pid = None
+        self._expiring = {}
+        os.makedirs(os.path.join(root, OUTBOX), exist_ok=True)
+
+    def job_dir(self, job_id):
+        path = os.path.join(self.root, job_id)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def outbox_dir(self, job_id):
+        path = os.path.join(self.root, OUTBOX, job_id)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def tmpfs_job_dir(self, job_id, expected_bytes):
+        if not self.tmpfs_root:
+            return None
+        try:
+            os.makedirs(self.tmpfs_root, exist_ok=True)
+            free = shutil.disk_usage(self.tmpfs_root).free
+        except OSError:
+            return None
+        if (free - expected_bytes < SCRATCH_TMPFS_MIN_FREE_BYTES
+                or directory_size(self.tmpfs_root) + expected_bytes > self.tmpfs_quota_bytes):
+            return None
+        path = os.path.join(self.tmpfs_root, job_id)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    # Dung lượng đang dùng trên đĩa, lưu tạm vài giây vì mỗi request upload đều hỏi
+    def usage(self):
+        with self._lock:
+            checked_at, used = self._usage
+            if time.monotonic() - checked_at > USAGE_CACHE_SECONDS:
+                used = directory_size(self.root)
+                self._usage = (time.monotonic(), used)
+            return used
+
+    # Từ chối upload mới khi thư mục tạm sắp vượt hạn mức
+    def check_quota(self, incoming_bytes):
+        if incoming_bytes and self.usage() + incoming_bytes > self.quota_bytes:
+            raise ScratchFullError('Máy chủ đang hết dung lượng lưu tạm, vui lòng thử lại sau.')
+
+    # Thư mục làm việc của job; luôn bị xóa khi ra khỏi khối with. Job lỗi thì xóa cả outbox.
+    @contextmanager
+    def job(self, job_id):
+        scratch = JobScratch(self, job_id)
+        try:
+            yield scratch
+        except BaseException:
+            remove_path(os.path.join(self.root, OUTBOX, job_id))
+            raise
+        finally:
+            self.release(job_id)
+
+    def release(self, job_id):
+        remove_path(os.path.join(self.root, job_id))
+        if self.tmpfs_root:
+            remove_path(os.path.join(self.tmpfs_root, job_id))
+
+    # Đăng ký thư mục mà mỗi mục con bị xóa sau max_age_seconds kể từ lần sửa đổi cuối
+    def expire(self, directory, max_age_seconds):
+        self._expiring[directory] = max_age_seconds
+
+    # Xóa thư mục job mồ côi, outbox quá hạn, file cũ nằm lẻ trong thư mục gốc và mục quá hạn
+    # trong các thư mục đã đăng ký bằng expire().
+    # is_active(job_id) cho biết job/upload còn đang chạy để không xóa nhầm.
+    def sweep(self, is_active):
+        now = time.time()
+        removed = 0
+        places = [(self.root, SCRATCH_ORPHAN_SECONDS), (os.path.join(self.root, OUTBOX), SCRATCH_OUTBOX_SECONDS)]
+        if self.tmpfs_root and os.path.isdir(self.tmpfs_root):
+            places.append((self.tmpfs_root, SCRATCH_ORPHAN_SECONDS))
+        places += [(directory, max_age) for directory, max_age in self._expiring.items() if os.path.isdir(directory)]
+        for directory, max_age in places:
+            for entry in os.scandir(directory):
+                if entry.name == OUTBOX and directory == self.root:
+                    continue
+                try:
+                    age = now - (newest_mtime(entry.path) if entry.is_dir() else entry.stat().st_mtime)
+                except OSError:
+                    continue
+                if age > max_age and not (entry.is_dir() and is_active(entry.name)):
+                    remove_path(entry.path)
+                    removed += 1
+        if removed:
+            print(f"Dọn thư mục tạm: xóa {removed} mục mồ côi")
+        return removed
+
+    # Luồng dọn dẹp nền, mỗi tiến trình một luồng (an toàn khi gunicorn fork)
+    def start_sweeper(self, is_active, interval=SCRATCH_SWEEP_INTERVAL):
+        with self._lock:
+            if self._sweeper_pid == os.getpid():
+                return
+            self._sweeper_pid = os.getpid()
+
+        def loop():
+            while True:
+                try:
+                    self.sweep(is_active)
+                except OSError as e:
+                    print(f"Lỗi khi dọn thư mục tạm: {e}")
+                time.sleep(interval)
+
+        threading.Thread(target=loop, name="scratch-sweeper", daemon=True).start()
+
+
+scratch = ScratchManager()
@@ -0,0 +1,194 @@
+"""
+Cắt file âm thanh/video thành nhiều phần trong một lượt ffmpeg (segment muxer), không giải mã lại từ đầu
+cho mỗi phần như khi chạy một lệnh ffmpeg với -ss đặt sau -i cho từng phần.
+
+    1. packet_index: ffprobe đọc bảng packet (thời điểm, dung lượng, cờ keyframe), không giải mã
+    2. choose_cut_points: chọn điểm cắt sao cho mỗi phần không vượt dung lượng/thời lượng tối đa,
+       đặt tại keyframe (copy luồng được) và ưu tiên keyframe nằm trong khoảng lặng
+    3. split_media: một lệnh ffmpeg -f segment ghi tất cả các phần, trả về manifest
+       [{'index', 'path', 'start', 'end', 'bytes'}] với offset thực tế do ffmpeg ghi lại
+
+Timestamp trong mỗi phần bắt đầu lại từ 0; dùng apply_offsets để đưa bản phiên âm các phần về
+thời gian của file gốc.
+"""
+import os
+import csv
+import bisect
+import subprocess
+from dotenv import load_dotenv
+
+from transcript import Transcript
+from transcription import MIN_CHUNK_RATIO, detect_silences
+
+# Đọc cấu hình từ file .env trước khi lấy các biến môi trường bên dưới
+load_dotenv()
+
+# Dung lượng tính từ packet chưa gồm phần đầu/chỉ mục của container, chừa biên khi cắt theo dung lượng
+SPLIT_SAFETY_RATIO = float(os.getenv("SPLIT_SAFETY_RATIO", "0.95"))
+# Khi chia đều, điểm cắt được dời vào khoảng lặng cách điểm chia không quá chừng này giây
+SPLIT_SILENCE_WINDOW = float(os.getenv("SPLIT_SILENCE_WINDOW", "30"))
+SEGMENT_TIME_DELTA = 0.05                  # Sai số cho phép khi ffmpeg so thời điểm cắt với keyframe
+COPY_ARGS = ['-c', 'copy']                 # Mặc định: copy luồng, không mã hóa lại
+SEGMENT_LIST_NAME = "segments.csv"
+
+# Đọc bảng packet bằng ffprobe (chỉ đọc container, không giải mã), từng dòng một.
+# Trả về thời điểm + dung lượng cộng dồn của mọi packet và các keyframe của luồng tham chiếu
+# (luồng hình đầu tiên, không có thì luồng âm thanh đầu tiên - giống segment muxer của ffmpeg).
+def packet_index(path, audio_only=False):
+    command = ['ffprobe', '-v', 'error']
+    if audio_only:
+        command += ['-select_streams', 'a:0']
+    command += ['-show_entries', 'stream=index,codec_type:packet=stream_index,pts_time,dts_time,size,flags',
+                '-of', 'csv', path]
+
+    packets, stream_types = [], {}
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    for line in process.stdout:
+        fields = line.strip().split(',')
+        if fields[0] == 'packet' and len(fields) >= 6:
+            _, stream_index, pts_time, dts_time, size, flags = fields[:6]
+            time = pts_time if pts_time != 'N/A' else dts_time
+            if time == 'N/A' or not size.isdigit():
+                continue
+            packets.append((float(time), int(size), int(stream_index), 'K' in flags))
+        elif fields[0] == 'stream' and len(fields) >= 3:
+            stream_types[int(fields[1])] = fields[2]
+    stderr = process.stderr.read()
+    if process.wait() != 0:
+        raise subprocess.CalledProcessError(process.returncode, command, stderr=stderr)
+
+    streams = sorted(stream_types)
+    reference = next((index for index in streams if stream_types[index] == 'video'),
+                     next((index for index in streams if stream_types[index] == 'audio'), None))
+    packets.sort()
+    prefix = [0]
+    for _, size, _, _ in packets:
+        prefix.append(prefix[-1] + size)
+    return {
+        'times': [time for time, _, _, _ in packets],
+        'prefix': prefix,                 # prefix[k] = tổng dung lượng k packet đầu tiên
+        'keyframes': sorted({time for time, _, stream, key in packets if key and stream == reference}),
+        'duration': packets[-1][0] if packets else 0.0,
+    }
+
+# Keyframe trong (earliest, limit] nằm trong khoảng lặng muộn nhất, gần giữa khoảng lặng nhất
+def silence_keyframe(keyframes, silences, earliest, limit):
+    for start, end in sorted(silences, key=lambda silence: silence[0] + silence[1], reverse=True):
+        low, high = max(start, earliest), min(end, limit)
+        if low > high:
+            continue
+        candidates = keyframes[bisect.bisect_left(keyframes, low):bisect.bisect_right(keyframes, high)]
+        candidates = [time for time in candidates if time > earliest]
+        if candidates:
+            middle = (start + end) / 2
+            return min(candidates, key=lambda time: abs(time - middle))
+    return None
+
+# Chọn điểm cắt để mỗi phần không quá max_bytes (theo dung lượng packet, đã trừ biên an toàn)
+# và không quá max_seconds. Điểm cắt luôn là keyframe của luồng tham chiếu, ưu tiên trong khoảng lặng
+# ở nửa sau của phần; không có thì lấy keyframe muộn nhất còn vừa giới hạn.
+def choose_cut_points(index, max_bytes=None, max_seconds=None, silences=(), safety_ratio=SPLIT_SAFETY_RATIO):
+    times, prefix, keyframes, duration = index['times'], index['prefix'], index['keyframes'], index['duration']
+    budget = max_bytes * safety_ratio if max_bytes else None
+    cuts = []
+    start = 0.0
+    while True:
+        limit = start + max_seconds if max_seconds else float('inf')
+        if budget is not None:
+            base = prefix[bisect.bisect_left(times, start)]
+            count = bisect.bisect_right(prefix, base + budget) - 1
+            if count < len(times):
+                limit = min(limit, times[count])   # Packet đầu tiên không còn vừa
+        if limit > duration:
+            return cuts
+
+        earliest = start + (limit - start) * MIN_CHUNK_RATIO
+        cut = silence_keyframe(keyframes, silences, earliest, limit)
+        if cut is None:
+            position = bisect.bisect_right(keyframes, limit) - 1
+            if position >= 0 and keyframes[position] > start:
+                cut = keyframes[position]
+        if cut is None:
+            # Khoảng cách giữa hai keyframe dài hơn giới hạn: phần này sẽ vượt giới hạn
+            position = bisect.bisect_right(keyframes, start)
+            if position == len(keyframes):
+                return cuts
+            cut = keyframes[position]
+            print(f"Không có keyframe trước {limit:.2f}s, phần bắt đầu ở {start:.2f}s sẽ vượt giới hạn")
+        cuts.append(cut)
+        start = cut
+
+# Chia [0, duration] thành parts phần gần bằng nhau; mỗi điểm chia dời vào giữa khoảng lặng gần nhất
+# trong phạm vi window giây, tối đa 1/4 độ dài mỗi phần (dùng khi mã hóa lại âm thanh, cắt được ở bất kỳ frame nào)
+def even_cut_points(duration, parts, silences=(), window=SPLIT_SILENCE_WINDOW):
+    window = min(window, duration / parts / 4)
+    cuts = []
+    for number in range(1, parts):
+        target = duration * number / parts
+        middles = [(start + end) / 2 for start, end in silences if abs((start + end) / 2 - target) <= window]
+        cuts.append(min(middles, key=lambda middle: abs(middle - target)) if middles else target)
+    return sorted(set(cuts))
+
+def _read_segment_list(list_path, output_dir):
+    manifest = []
+    with open(list_path, newline='', encoding='utf-8') as list_file:
+        for number, row in enumerate(csv.reader(list_file), start=1):
+            if not row:
+                continue
+            path = os.path.join(output_dir, os.path.basename(row[0]))
+            manifest.append({
+                'index': number,
+                'path': path,
+                'start': float(row[1]),
+                'end': float(row[2]),
+                'bytes': os.path.getsize(path),
+            })
+    return manifest
+
+# Cắt file trong một lượt ffmpeg, các phần đặt tên <tên gốc>_<số thứ tự><đuôi> trong output_dir.
+#   max_bytes/max_seconds - giới hạn mỗi phần (cắt tại keyframe, ưu tiên khoảng lặng nếu align_silence)
+#   cut_times             - điểm cắt cho sẵn, bỏ qua bước chọn điểm cắt
+#   codec_args            - mặc định copy luồng; truyền tham số mã hóa (hoặc []) để mã hóa lại
+#   audio_only            - chỉ giữ luồng âm thanh đầu tiên
+# Trả về manifest các phần theo thứ tự, start/end là thời điểm trong file gốc.
+def split_media(input_path, output_dir, max_bytes=None, max_seconds=None, cut_times=None, extension=None,
+                codec_args=COPY_ARGS, audio_only=False, align_silence=True):
+    if cut_times is None:
+        index = packet_index(input_path, audio_only)
+        silences = detect_silences(input_path) if align_silence and (max_bytes or max_seconds) else []
+        cut_times = choose_cut_points(index, max_bytes, max_seconds, silences)
+
+    os.makedirs(output_dir, exist_ok=True)
+    stem, input_extension = os.path.splitext(os.path.basename(input_path))
+    pattern = os.path.join(output_dir, f"{stem.replace('%', '%%')}_%d{extension or input_extension}")
+    list_path = os.path.join(output_dir, SEGMENT_LIST_NAME)
+
+    stream_args = ['-map', '0:a:0', '-vn'] if audio_only else []
+    segment_args = ['-segment_times', ','.join(f'{time:.3f}' for time in cut_times)] if cut_times else []
+    try:
+        subprocess.run([
+            'ffmpeg', '-y', '-v', 'error',
+            '-i', input_path,
+            *stream_args,
+            *codec_args,
+            '-f', 'segment',
+            *segment_args,
+            '-segment_time_delta', str(SEGMENT_TIME_DELTA),
+            '-segment_start_number', '1',
+            '-reset_timestamps', '1',
+            '-segment_list', list_path,
+            '-segment_list_type', 'csv',
+            pattern
+        ], check=True)
+        return _read_segment_list(list_path, output_dir)
+    finally:
+        if os.path.exists(list_path):
+            os.remove(list_path)
+
+# Ghép bản phiên âm của từng phần (timestamp tính từ đầu phần) thành bản phiên âm theo thời gian file gốc
+def apply_offsets(manifest, transcripts):
+    merged = Transcript()
+    for part, transcript in zip(manifest, transcripts):
+        for segment in transcript:
+            merged.append(segment.replace(start=segment.start + part['start'], end=segment.end + part['start']))
+    return merged.sort()
@@ -1,26 +1,207 @@
+ // Tên các bước xử lý hiển thị cho người dùng
+        const STAGE_LABELS = {
+            queued: 'Đang chờ trong hàng đợi...',
+            converting: 'Đang chuyển đổi âm thanh...',
+            trimming: 'Đang lọc khoảng lặng...',
+            transcribing: 'Đang phiên âm...',
+            translating: 'Đang dịch song ngữ...',
+            exporting: 'Đang xuất file Word...',
+            emailing: 'Đang gửi email...'
+        };
+        const POLL_INTERVAL_MS = 3000;
+        // Upload nối tiếp được: chia file thành các khối, gửi song song, mất mạng thì chỉ gửi lại khối còn thiếu
+        const RESUMABLE_UPLOAD = true;
+        const PARALLEL_CHUNKS = 4;
+        const CHUNK_RETRIES = 5;
+
+        // SHA-256 của một khối (crypto.subtle chỉ có trên HTTPS/localhost; không có thì bỏ qua checksum)
+        async function chunkChecksum(blob) {
+            if (!window.crypto || !crypto.subtle) {
+                return null;
+            }
+            const digest = await crypto.subtle.digest('SHA-256', await blob.arrayBuffer());
+            return Array.from(new Uint8Array(digest), byte => byte.toString(16).padStart(2, '0')).join('');
+        }
+
+        async function sendChunk(uploadId, file, offset, chunkSize) {
+            const blob = file.slice(offset, offset + chunkSize);
+            const headers = { 'Content-Type': 'application/octet-stream' };
+            const checksum = await chunkChecksum(blob);
+            if (checksum) {
+                headers['X-Chunk-SHA256'] = checksum;
+            }
+            for (let attempt = 1; ; attempt++) {
+                try {
+                    const response = await fetch(`/uploads/${uploadId}?offset=${offset}`, {
+                        method: 'PUT', headers, body: blob
+                    });
+                    if (response.ok) {
+                        return;
+                    }
+                    // Lỗi 4xx khác checksum (phiên hết hạn, file quá lớn...) thì không thử lại
+                    if (response.status < 500 && response.status !== 422) {
+                        throw new Error((await response.json()).error);
+                    }
+                } catch (error) {
+                    if (attempt >= CHUNK_RETRIES || !(error instanceof TypeError)) {
+                        throw error;
+                    }
+                }
+                if (attempt >= CHUNK_RETRIES) {
+                    throw new Error('Không gửi được dữ liệu, vui lòng thử lại.');
+                }
+                await sleep(Math.min(30000, 1000 * 2 ** attempt));
+            }
+        }
+
+        // Tạo phiên upload (hoặc tiếp tục phiên cũ của cùng file), gửi các khối còn thiếu rồi hoàn tất
+        async function resumableUpload(file, email, progressDiv) {
+            const key = `upload:${file.name}:${file.size}:${file.lastModified}:${email}`;
+            let session = null;
+            const savedId = localStorage.getItem(key);
+            if (savedId) {
+                const response = await fetch(`/uploads/${savedId}`);
+                session = response.ok ? await response.json() : null;
+            }
+            if (!session || session.status !== 'uploading') {
+                const response = await fetch('/uploads', {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({ filename: file.name, size: file.size, email })
+                });
+                session = await response.json();
+                if (!response.ok) {
+                    return { response, data: session };
+                }
+                localStorage.setItem(key, session.upload_id);
+            }
+
+            const received = new Set(session.received);
+            const offsets = [];
+            for (let offset = 0; offset < file.size; offset += session.chunk_size) {
+                if (!received.has(offset)) {
+                    offsets.push(offset);
+                }
+            }
+            // Gửi theo thứ tự tăng dần để server trích âm thanh được trên phần đầu đã nhận
+            let sentBytes = session.received_bytes;
+            let next = 0;
+            async function worker() {
+                while (next < offsets.length) {
+                    const offset = offsets[next++];
+                    await sendChunk(session.upload_id, file, offset, session.chunk_size);
+                    sentBytes += Math.min(session.chunk_size, file.size - offset);
+                    progressDiv.textContent = `Đang tải lên... ${Math.floor(sentBytes * 100 / file.size)}%`;
+                }
+            }
+            await Promise.all(Array.from({ length: PARALLEL_CHUNKS }, worker));
+
+            const response = await fetch(`/uploads/${session.upload_id}/complete`, { method: 'POST' });
+            const data = await response.json();
+            if (response.ok) {
+                localStorage.removeItem(key);
+            }
+            return { response, data };
+        }
+
+        // Nhận tiến trình qua Server-Sent Events: bước xử lý và bản dịch hiện dần từng phần.
+        // EventSource tự kết nối lại (gửi Last-Event-ID) nếu mạng chập chờn.
+        function streamJob(eventsUrl, statusUrl, progressDiv, liveDiv) {
+            return new Promise((resolve, reject) => {
+                const source = new EventSource(eventsUrl);
+                const segments = [];
+                source.addEventListener('stage', event => {
+                    const stage = JSON.parse(event.data).stage.split(':')[0];
+                    progressDiv.textContent = STAGE_LABELS[stage] || 'Đang xử lý, vui lòng chờ...';
+                });
+                source.addEventListener('delta', event => {
+                    liveDiv.style.display = 'block';
+                    liveDiv.textContent += JSON.parse(event.data).text;
+                });
+                source.addEventListener('segment', event => {
+                    const segment = JSON.parse(event.data);
+                    segments.push(segment);
+                    segments.sort((a, b) => a.filename.localeCompare(b.filename) || a.index - b.index);
+                    liveDiv.style.display = 'block';
+                    liveDiv.textContent = segments.map(item => item.text).join('\n');
+                });
+                source.addEventListener('done', event => {
+                    source.close();
+                    resolve(JSON.parse(event.data));
+                });
+                source.addEventListener('failed', event => {
+                    source.close();
+                    reject(new Error(JSON.parse(event.data).error));
+                });
+                source.onerror = () => {
+                    // Máy chủ từ chối hẳn (ví dụ 404): chuyển sang hỏi trạng thái định kỳ
+                    if (source.readyState === EventSource.CLOSED) {
+                        waitForJob(statusUrl, progressDiv).then(resolve, reject);
+                    }
+                };
+            });
+        }
+
+        function sleep(ms) {
+            return new Promise(resolve => setTimeout(resolve, ms));
+        }
+
+        // Hỏi trạng thái job định kỳ cho tới khi xong hoặc lỗi
+        async function waitForJob(statusUrl, progressDiv) {
+            while (true) {
+                const response = await fetch(statusUrl);
+                const job = await response.json();
+                if (!response.ok) {
+                    throw new Error(job.error);
+                }
+                if (job.status === 'done') {
+                    return job.result;
+                }
+                if (job.status === 'failed') {
+                    throw new Error(job.error);
+                }
+                const stage = job.stage.split(':')[0];
+                progressDiv.textContent = STAGE_LABELS[stage] || 'Đang xử lý, vui lòng chờ...';
+                await sleep(POLL_INTERVAL_MS);
+            }
+        }
+
  document.getElementById('upload-form').addEventListener('submit', async function(e) {
             e.preventDefault();
-            
+
             const formData = new FormData(this);
             const progressDiv = document.getElementById('progress');
             const resultDiv = document.getElementById('result');
             const errorDiv = document.getElementById('error');
+            const liveDiv = document.getElementById('live-result');
 
             progressDiv.style.display = 'block';
+            progressDiv.textContent = 'Đang tải lên, vui lòng chờ...';
             resultDiv.style.display = 'none';
             errorDiv.style.display = 'none';
+            liveDiv.style.display = 'none';
+            liveDiv.textContent = '';
 
             try {
-                const response = await fetch('/upload', {
-                    method: 'POST',
-                    body: formData
-                });
+                let response, data;
+                if (RESUMABLE_UPLOAD) {
+                    ({ response, data } = await resumableUpload(formData.get('audio'), formData.get('email'),
+                                                                progressDiv));
+                } else {
+                    response = await fetch('/upload', {
+                        method: 'POST',
+                        body: formData
+                    });
+                    data = await response.json();
+                }
 
-                const data = await response.json();
                 if (response.ok) {
+                    const result = (data.events_url && window.EventSource)
+                        ? await streamJob(data.events_url, data.status_url, progressDiv, liveDiv)
+                        : await waitForJob(data.status_url, progressDiv);
                     progressDiv.style.display = 'none';
                     resultDiv.style.display = 'block';
-                    resultDiv.innerHTML = `<p>${data.message}</p>`;
+                    resultDiv.innerHTML = `<p>${result.message}</p>`;
                 } else {
                     progressDiv.style.display = 'none';
                     errorDiv.style.display = 'block';
@@ -29,6 +210,6 @@
             } catch (error) {
                 progressDiv.style.display = 'none';
                 errorDiv.style.display = 'block';
-                errorDiv.textContent = `Lỗi kết nối: ${error.message}`;
+                errorDiv.textContent = `Lỗi: ${error.message}`;
             }
-        });
\ No newline at end of file
+        });
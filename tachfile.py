@@ -1,5 +1,10 @@
-from pydub import AudioSegment
 import os
+import shutil
+import tempfile
+
+from media import probe_media
+from splitter import even_cut_points, split_media
+from transcription import detect_silences
 
 def split_audio_in_half(input_file, output1, output2, format="mp3"):
     # Kiểm tra sự tồn tại của file đầu vào
@@ -8,27 +13,27 @@ def split_audio_in_half(input_file, output1, output2, format="mp3"):
         return
 
     try:
-        # Tải file âm thanh
-        audio = AudioSegment.from_file(input_file)
+        # Đọc độ dài bằng ffprobe và tìm khoảng lặng trong một lượt giải mã, không nạp cả file vào RAM
+        duration = probe_media(input_file)['duration']
+        silences = detect_silences(input_file)
     except Exception as e:
         print(f"Lỗi khi tải file âm thanh: {e}")
         return
 
-    # Tính độ dài của âm thanh (mili giây)
-    audio_length = len(audio)
-    
-    # Tính thời điểm tách ở giữa
-    split_time = audio_length // 2
-
-    # Tách âm thanh thành hai phần
-    first_part = audio[:split_time]
-    second_part = audio[split_time:]
+    # Tách ở giữa, dời vào khoảng lặng gần nhất để không cắt ngang câu nói
+    cut_times = even_cut_points(duration, 2, silences)
 
     try:
-        # Lưu hai phần âm thanh
-        first_part.export(output1, format=format)
-        second_part.export(output2, format=format)
-        print(f"Đã tách âm thanh thành hai phần bằng nhau:\n- {output1}\n- {output2}")
+        # Một lượt ffmpeg mã hóa và ghi cả hai phần (encoder mặc định của định dạng đầu ra)
+        output_dir = os.path.dirname(os.path.abspath(output1))
+        with tempfile.TemporaryDirectory(dir=output_dir) as work_dir:
+            parts = split_media(input_file, work_dir, cut_times=cut_times, extension=f".{format}",
+                                codec_args=[], audio_only=True)
+            if len(parts) != 2:
+                raise ValueError(f"ffmpeg tạo {len(parts)} phần thay vì 2")
+            shutil.move(parts[0]['path'], output1)
+            shutil.move(parts[1]['path'], output2)
+        print(f"Đã tách âm thanh thành hai phần tại {parts[1]['start']:.2f}s:\n- {output1}\n- {output2}")
     except Exception as e:
         print(f"Lỗi khi xuất file âm thanh: {e}")
 
@@ -1,6 +1,8 @@
 import ffmpeg
 import os
 
+from media import plan_conversion, probe_media
+
 def convert_to_wav(input_path, output_dir):
     """
     Chuyển đổi file đầu vào sang định dạng .wav.
@@ -15,14 +17,13 @@ def convert_to_wav(input_path, output_dir):
 
     # Lấy tên file và phần mở rộng
     filename, ext = os.path.splitext(os.path.basename(input_path))
-    ext = ext.lower()
 
     # Đặt đường dẫn file đầu ra
     output_path = os.path.join(output_dir, f"{filename}.wav")
 
-    # Kiểm tra xem file đã là .wav chưa
-    if ext == '.wav':
-        print("File đã ở định dạng .wav. Không cần chuyển đổi.")
+    # Kiểm tra nội dung thật của file bằng ffprobe (không dựa vào phần mở rộng)
+    if plan_conversion(probe_media(input_path)) == 'passthrough':
+        print("File đã ở định dạng WAV 16 kHz mono. Không cần chuyển đổi.")
         return input_path
 
     # Thực hiện chuyển đổi
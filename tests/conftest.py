@@ -0,0 +1,15 @@
+import os
+import sys
+import tempfile
+
+# Các module nằm phẳng ở thư mục gốc dự án
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Một số module mở SQLite/thư mục cache ngay khi import: trỏ sang thư mục tạm để test không đụng dữ liệu thật
+_state_dir = tempfile.mkdtemp(prefix="beme-tests-")
+for name, filename in (("JOBS_DB", "jobs.sqlite3"), ("RATE_LIMIT_DB", "ratelimit.sqlite3"),
+                       ("TRANSLATION_MEMORY_DB", "translation_memory.sqlite3"), ("METRICS_DB", "metrics.sqlite3"),
+                       ("TRANSCRIPT_CACHE_DIR", "transcripts"), ("SCRATCH_DIR", "uploads"),
+                       ("DOWNLOAD_FOLDER", "downloads")):
+    os.environ.setdefault(name, os.path.join(_state_dir, filename))
+os.environ.setdefault("SCRATCH_TMPFS_DIR", "")
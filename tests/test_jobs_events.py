@@ -0,0 +1,86 @@
+import json
+import time
+from contextlib import closing
+
+import pytest
+
+import jobs
+from jobs import STATUS_DONE, STATUS_FAILED, JobQueue, event_stream
+
+KIND = "audio"
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_EVENT_POLL_INTERVAL", 0.0)
+    return JobQueue(str(tmp_path / "jobs.sqlite3"))
+
+def set_updated_at(queue, job_id, updated_at):
+    with closing(queue._connect()) as conn:
+        conn.execute("UPDATE jobs SET updated_at = ? WHERE id = ?", (updated_at, job_id))
+
+# Tách chuỗi SSE thành danh sách (id, event, data); id là None nếu không có dòng id:
+def parse(messages):
+    parsed = []
+    for message in messages:
+        fields = dict(line.split(": ", 1) for line in message.strip().splitlines())
+        parsed.append((fields.get("id"), fields["event"], json.loads(fields["data"])))
+    return parsed
+
+
+def test_purge_events_only_removes_old_finished_jobs(queue):
+    now = time.time()
+    for job_id in ("old-done", "old-failed", "new-done", "old-running"):
+        queue.enqueue(KIND, {}, job_id=job_id)
+        queue.add_event(job_id, "stage", {"stage": "converting"})
+    queue.finish("old-done", {})
+    queue.fail("old-failed", "lỗi")
+    queue.finish("new-done", {})
+    # Job duy nhất còn chờ là old-running: claim chuyển nó sang running
+    assert queue.claim(KIND)["id"] == "old-running"
+    for job_id in ("old-done", "old-failed", "old-running"):
+        set_updated_at(queue, job_id, now - 7200)
+    set_updated_at(queue, "new-done", now - 60)
+    assert queue.purge_events(3600) == 4
+    assert queue.events("old-done") == []
+    assert queue.events("old-failed") == []
+    assert len(queue.events("new-done")) == 2
+    assert len(queue.events("old-running")) == 1
+
+def test_stream_stops_after_done(queue):
+    queue.enqueue(KIND, {}, job_id="job")
+    queue.set_stage("job", "converting")
+    queue.finish("job", {"message": "ok"})
+    events = parse(event_stream(queue, "job"))
+    assert [event for _, event, _ in events] == ["stage", STATUS_DONE]
+    assert events[-1][2] == {"message": "ok"}
+    assert all(event_id is not None for event_id, _, _ in events)
+
+def test_stream_resumes_after_last_event_id(queue):
+    queue.enqueue(KIND, {}, job_id="job")
+    queue.set_stage("job", "converting")
+    queue.set_stage("job", "translating")
+    queue.finish("job", {})
+    first_id = queue.events("job")[0][0]
+    events = parse(event_stream(queue, "job", first_id))
+    assert [(event, data) for _, event, data in events] == [("stage", {"stage": "translating"}), (STATUS_DONE, {})]
+
+def test_purged_finished_job_sends_final_status_once(queue):
+    queue.enqueue(KIND, {}, job_id="done")
+    queue.finish("done", {"message": "ok"})
+    queue.enqueue(KIND, {}, job_id="failed")
+    queue.fail("failed", "lỗi")
+    queue.purge_events(-1)
+    assert parse(event_stream(queue, "done")) == [(None, STATUS_DONE, {"message": "ok"})]
+    assert parse(event_stream(queue, "failed")) == [(None, STATUS_FAILED, {"error": "lỗi"})]
+
+def test_reconnect_after_done_sends_nothing(queue):
+    queue.enqueue(KIND, {}, job_id="job")
+    queue.finish("job", {})
+    done_id = queue.events("job")[-1][0]
+    assert list(event_stream(queue, "job", done_id)) == []
+    queue.purge_events(-1)
+    assert list(event_stream(queue, "job", done_id)) == []
+
+def test_unknown_job_stream_is_empty(queue):
+    assert list(event_stream(queue, "missing")) == []
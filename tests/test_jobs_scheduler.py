@@ -0,0 +1,140 @@
+import time
+from contextlib import closing
+
+import pytest
+
+import jobs
+from jobs import STATUS_DONE, JobQueue, QueueFullError, tenant_key
+
+KIND = "audio"
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_SCHEDULER", "fair")
+    monkeypatch.setattr(jobs, "JOB_AGING_RATE", 10.0)
+    monkeypatch.setattr(jobs, "JOB_TENANT_PENALTY", 1800.0)
+    monkeypatch.setattr(jobs, "JOB_DEFAULT_COST", 600.0)
+    return JobQueue(str(tmp_path / "jobs.sqlite3"))
+
+# Đặt thời điểm tạo/bắt đầu/kết thúc của job để kết quả không phụ thuộc đồng hồ lúc chạy test
+def set_times(queue, job_id, **fields):
+    columns = ", ".join(f"{name} = ?" for name in fields)
+    with closing(queue._connect()) as conn:
+        conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+def claim_order(queue):
+    order = []
+    while (job := queue.claim(KIND)) is not None:
+        order.append(job["id"])
+    return order
+
+
+def test_shortest_job_first(queue):
+    now = time.time()
+    for job_id, cost in (("long", 3 * 3600), ("short", 60), ("medium", 900)):
+        queue.enqueue(KIND, {}, job_id=job_id, cost=cost)
+        set_times(queue, job_id, created_at=now)
+    assert claim_order(queue) == ["short", "medium", "long"]
+
+def test_missing_cost_uses_default(queue):
+    now = time.time()
+    queue.enqueue(KIND, {}, job_id="unknown")
+    queue.enqueue(KIND, {}, job_id="shorter", cost=599)
+    queue.enqueue(KIND, {}, job_id="longer", cost=601)
+    for job_id in ("unknown", "shorter", "longer"):
+        set_times(queue, job_id, created_at=now)
+    assert claim_order(queue) == ["shorter", "unknown", "longer"]
+
+def test_aging_lets_long_job_overtake(queue):
+    now = time.time()
+    queue.enqueue(KIND, {}, job_id="long", cost=3600)
+    queue.enqueue(KIND, {}, job_id="short", cost=60)
+    # Chờ 400 giây x 10 = 4000 giây âm thanh: điểm 3600 - 4000 < 60
+    set_times(queue, "long", created_at=now - 400)
+    set_times(queue, "short", created_at=now)
+    assert claim_order(queue)[0] == "long"
+
+def test_equal_priority_falls_back_to_arrival_order(queue):
+    now = time.time()
+    queue.enqueue(KIND, {}, job_id="second", cost=100)
+    queue.enqueue(KIND, {}, job_id="first", cost=100)
+    set_times(queue, "first", created_at=now - 1)
+    set_times(queue, "second", created_at=now - 1 + 0.1)
+    # Cùng độ dài: job chờ lâu hơn có điểm thấp hơn nhờ aging, và created_at phá hòa
+    assert claim_order(queue) == ["first", "second"]
+
+def test_tenant_with_running_job_is_pushed_back(queue):
+    now = time.time()
+    queue.enqueue(KIND, {}, job_id="busy-running", cost=60, tenant="a@example.com")
+    assert queue.claim(KIND)["id"] == "busy-running"
+    queue.enqueue(KIND, {}, job_id="busy-next", cost=60, tenant="a@example.com")
+    queue.enqueue(KIND, {}, job_id="other", cost=1200, tenant="b@example.com")
+    for job_id in ("busy-next", "other"):
+        set_times(queue, job_id, created_at=now)
+    # 60 + 1800 (một job đang chạy cùng email) > 1200
+    assert claim_order(queue) == ["other", "busy-next"]
+
+def test_fifo_scheduler_ignores_cost(queue, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_SCHEDULER", "fifo")
+    now = time.time()
+    for offset, (job_id, cost) in enumerate((("long", 3600), ("short", 60))):
+        queue.enqueue(KIND, {}, job_id=job_id, cost=cost)
+        set_times(queue, job_id, created_at=now + offset)
+    assert claim_order(queue) == ["long", "short"]
+
+def test_claim_only_takes_requested_kind(queue):
+    queue.enqueue("email", {}, job_id="mail")
+    assert queue.claim(KIND) is None
+    assert queue.claim("email")["id"] == "mail"
+
+def test_global_queue_cap(queue, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_MAX_QUEUED", 2)
+    queue.enqueue(KIND, {}, admit=True)
+    queue.enqueue(KIND, {}, admit=True)
+    with pytest.raises(QueueFullError):
+        queue.enqueue(KIND, {}, job_id="rejected", admit=True)
+    assert queue.get("rejected") is None
+    # Job loại khác (email) không bị tính vào hạn mức
+    queue.check_admission("email")
+
+def test_per_tenant_queue_cap(queue, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_MAX_QUEUED_PER_TENANT", 1)
+    queue.enqueue(KIND, {}, tenant="a@example.com", admit=True)
+    with pytest.raises(QueueFullError):
+        queue.check_admission(KIND, "a@example.com")
+    queue.check_admission(KIND, "b@example.com")
+    queue.check_admission(KIND)
+
+def test_running_jobs_do_not_count_against_cap(queue, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_MAX_QUEUED", 1)
+    queue.enqueue(KIND, {}, admit=True)
+    queue.claim(KIND)
+    queue.enqueue(KIND, {}, admit=True)
+
+def test_retry_after_default_without_history(queue, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_MAX_QUEUED", 0)
+    with pytest.raises(QueueFullError) as error:
+        queue.check_admission(KIND)
+    assert error.value.retry_after == jobs.JOB_RETRY_AFTER_DEFAULT
+
+@pytest.mark.parametrize("runtimes, expected", [
+    ([100, 200], 150),
+    ([1, 2], jobs.JOB_RETRY_AFTER_MIN),
+    ([10 ** 5], jobs.JOB_RETRY_AFTER_MAX),
+])
+def test_retry_after_from_recent_runtimes(queue, monkeypatch, runtimes, expected):
+    now = time.time()
+    for index, runtime in enumerate(runtimes):
+        job_id = f"done-{index}"
+        queue.enqueue(KIND, {}, job_id=job_id)
+        set_times(queue, job_id, status=STATUS_DONE, started_at=now - runtime, updated_at=now)
+    monkeypatch.setattr(jobs, "JOB_MAX_QUEUED", 0)
+    with pytest.raises(QueueFullError) as error:
+        queue.check_admission(KIND)
+    assert error.value.retry_after == expected
+
+def test_tenant_key_normalizes_email():
+    assert tenant_key("  A@Example.COM ") == "a@example.com"
+    assert tenant_key("") is None
+    assert tenant_key(None) is None
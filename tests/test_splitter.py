@@ -0,0 +1,82 @@
+from splitter import apply_offsets, choose_cut_points, even_cut_points
+from transcript import Segment, Transcript
+
+
+# Bảng packet giả lập giống packet_index(): packet đều nhau, keyframe mỗi keyframe_every giây
+def make_index(duration, packet_seconds=0.5, packet_bytes=1000, keyframe_every=2.0):
+    count = int(duration / packet_seconds)
+    times = [index * packet_seconds for index in range(count)]
+    prefix = [0]
+    for _ in times:
+        prefix.append(prefix[-1] + packet_bytes)
+    keyframes = [time for time in times if abs(time / keyframe_every - round(time / keyframe_every)) < 1e-9]
+    return {'times': times, 'prefix': prefix, 'keyframes': keyframes, 'duration': times[-1]}
+
+def part_bytes(index, cuts):
+    bounds = [0.0, *cuts, float('inf')]
+    return [sum(1000 for time in index['times'] if start <= time < end) for start, end in zip(bounds, bounds[1:])]
+
+
+def test_no_cut_when_everything_fits():
+    index = make_index(100)
+    assert choose_cut_points(index, max_bytes=10 ** 9) == []
+    assert choose_cut_points(index, max_seconds=1000) == []
+    assert choose_cut_points(index) == []
+
+def test_cuts_by_duration_on_keyframes():
+    assert choose_cut_points(make_index(100), max_seconds=30) == [30.0, 60.0, 90.0]
+    # Keyframe mỗi 4 giây: cắt ở keyframe muộn nhất không vượt giới hạn
+    assert choose_cut_points(make_index(100, keyframe_every=4.0), max_seconds=30) == [28.0, 56.0, 84.0]
+
+def test_cuts_by_bytes_keep_parts_under_budget():
+    index = make_index(100)   # 2000 byte/giây
+    cuts = choose_cut_points(index, max_bytes=25000, safety_ratio=1.0)
+    assert cuts == [12.0, 24.0, 36.0, 48.0, 60.0, 72.0, 84.0, 96.0]
+    assert all(size <= 25000 for size in part_bytes(index, cuts))
+
+def test_safety_ratio_shrinks_parts():
+    index = make_index(100)
+    assert choose_cut_points(index, max_bytes=25000, safety_ratio=0.8)[0] == 10.0
+
+def test_tighter_of_bytes_and_duration_wins():
+    index = make_index(100)
+    assert choose_cut_points(index, max_bytes=10 ** 9, max_seconds=20)[0] == 20.0
+    assert choose_cut_points(index, max_bytes=25000, max_seconds=60, safety_ratio=1.0)[0] == 12.0
+
+def test_prefers_keyframe_inside_latest_silence():
+    index = make_index(100, packet_seconds=0.25, keyframe_every=0.25)
+    silences = [(17.0, 18.0), (24.0, 25.0), (50.0, 51.0), (55.0, 56.0)]
+    cuts = choose_cut_points(index, max_seconds=30, silences=silences)
+    # Khoảng lặng muộn nhất trong nửa sau của phần đầu là 24-25, cắt ở giữa
+    assert cuts[0] == 24.5
+    # Phần sau bắt đầu ở 24.5, giới hạn 54.5: khoảng lặng 55-56 nằm ngoài, dùng 50-51
+    assert cuts[1] == 50.5
+
+def test_ignores_silence_in_first_half_of_part():
+    index = make_index(100, packet_seconds=0.25, keyframe_every=0.25)
+    assert choose_cut_points(index, max_seconds=30, silences=[(5.0, 6.0)])[0] == 30.0
+
+def test_silence_without_keyframe_falls_back_to_latest_keyframe():
+    index = make_index(100, keyframe_every=10.0)
+    assert choose_cut_points(index, max_seconds=30, silences=[(21.0, 22.0)])[0] == 30.0
+
+def test_sparse_keyframes_allow_oversized_part():
+    index = make_index(100, keyframe_every=50.0)
+    assert choose_cut_points(index, max_seconds=30) == [50.0]
+
+def test_even_cut_points_moves_to_nearest_silence():
+    assert even_cut_points(100, 2) == [50.0]
+    assert even_cut_points(100, 3) == [100 / 3, 200 / 3]
+    assert even_cut_points(100, 2, silences=[(40.0, 41.0), (52.0, 53.0)], window=30) == [52.5]
+
+def test_even_cut_points_window_limited_by_part_length():
+    # Phần dài 12.5 giây: khoảng lặng cách điểm giữa 10 giây là quá xa
+    assert even_cut_points(25, 2, silences=[(22.0, 23.0)], window=30) == [12.5]
+
+def test_apply_offsets_shifts_each_part():
+    manifest = [{'start': 0.0}, {'start': 30.0}]
+    merged = apply_offsets(manifest, [
+        Transcript([Segment(1.0, 2.0, "a")]),
+        Transcript([Segment(0.5, 1.5, "b", en="B")]),
+    ])
+    assert merged.segments == [Segment(1.0, 2.0, "a"), Segment(30.5, 31.5, "b", en="B")]
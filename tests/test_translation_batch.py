@@ -0,0 +1,80 @@
+import json
+
+from transcript import Segment
+from translation import BATCH_ITEM_OVERHEAD_TOKENS, pack_segments, parse_batch_response
+
+
+def make_batch(count, start_index=0):
+    return [(start_index + position, Segment(position * 5.0, position * 5.0 + 4.0, f"câu {position}"))
+            for position in range(count)]
+
+def response(items):
+    return json.dumps({"segments": items}, ensure_ascii=False)
+
+
+def test_pack_segments_respects_token_budget_and_order():
+    items = make_batch(10)
+    per_item = len("câu 0") // 4 + 1 + BATCH_ITEM_OVERHEAD_TOKENS
+    batches = pack_segments(items, budget=per_item * 3, max_segments=100)
+    assert [len(batch) for batch in batches] == [3, 3, 3, 1]
+    assert [item for batch in batches for item in batch] == items
+
+def test_pack_segments_respects_max_segments():
+    batches = pack_segments(make_batch(7), budget=10 ** 6, max_segments=2)
+    assert [len(batch) for batch in batches] == [2, 2, 2, 1]
+
+def test_pack_segments_keeps_oversized_segment_alone():
+    long_segment = (0, Segment(0.0, 4.0, "x" * 4000))
+    batches = pack_segments([long_segment, *make_batch(2, start_index=1)], budget=50)
+    assert batches[0] == [long_segment]
+
+def test_pack_segments_empty():
+    assert pack_segments([]) == []
+
+def test_parse_batch_response_maps_positions_to_original_indexes():
+    batch = make_batch(2, start_index=10)
+    results = parse_batch_response(response([
+        {"i": 1, "vi": "Câu một.", "en": "Sentence one."},
+        {"i": 0, "vi": "Câu không.", "en": "Sentence zero."},
+    ]), batch)
+    assert results == {
+        10: "-  [0:04]: Câu không.\n-> [0:04]: Sentence zero.",
+        11: "-  [0:09]: Câu một.\n-> [0:09]: Sentence one.",
+    }
+
+def test_parse_batch_response_ignores_text_around_json():
+    batch = make_batch(1)
+    content = "Đây là kết quả:\n" + response([{"i": 0, "vi": "A", "en": "B"}]) + "\nXong."
+    assert list(parse_batch_response(content, batch)) == [0]
+
+def test_parse_batch_response_falls_back_to_original_vietnamese():
+    batch = make_batch(1)
+    results = parse_batch_response(response([{"i": 0, "vi": "  ", "en": "B"}]), batch)
+    assert results[0].startswith("-  [0:04]: câu 0\n")
+
+def test_parse_batch_response_rejects_invalid_items():
+    batch = make_batch(3)
+    results = parse_batch_response(response([
+        {"i": True, "vi": "bool", "en": "bool"},
+        {"i": 5, "vi": "ngoài phạm vi", "en": "out of range"},
+        {"i": "2", "vi": "chuỗi", "en": "string"},
+        {"i": 2, "vi": "thiếu tiếng Anh", "en": " "},
+        ["không", "phải", "dict"],
+    ]), batch)
+    assert results == {}
+
+def test_parse_batch_response_drops_duplicate_positions():
+    batch = make_batch(2)
+    results = parse_batch_response(response([
+        {"i": 0, "vi": "A", "en": "first"},
+        {"i": 0, "vi": "A", "en": "second"},
+        {"i": 1, "vi": "B", "en": "ok"},
+    ]), batch)
+    assert list(results) == [1]
+
+def test_parse_batch_response_malformed_content():
+    batch = make_batch(1)
+    assert parse_batch_response("", batch) == {}
+    assert parse_batch_response("{not json}", batch) == {}
+    assert parse_batch_response('{"segments": {"i": 0}}', batch) == {}
+    assert parse_batch_response("[1, 2]", batch) == {}
@@ -0,0 +1,80 @@
+import json
+
+# Kiểu dữ liệu bản phiên âm dùng chung cho mọi bước (phiên âm -> lọc VAD -> dịch -> xuất file).
+# Segment dùng __slots__ nên bản ghi dài vài giờ (hàng chục nghìn đoạn) tốn ít bộ nhớ hơn nhiều so với dict,
+# và được truyền nguyên đối tượng giữa các bước thay vì ghép thành chuỗi rồi tách dòng lại.
+
+
+# Chuyển số giây thành định dạng [phút:giây], dùng trong prompt dịch và các file xuất
+def format_timestamp(seconds):
+    return f"[{int(seconds // 60)}:{int(seconds % 60):02}]"
+
+
+class Segment:
+    __slots__ = ('start', 'end', 'text', 'vi', 'en')
+
+    def __init__(self, start, end, text, vi=None, en=None):
+        self.start = start
+        self.end = end
+        self.text = text      # Văn bản gốc từ Whisper
+        self.vi = vi          # Câu tiếng Việt đã chỉnh sửa (None = dùng text)
+        self.en = en          # Bản dịch tiếng Anh (None = chưa dịch)
+
+    def replace(self, **fields):
+        values = {name: getattr(self, name) for name in self.__slots__}
+        values.update(fields)
+        return Segment(**values)
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__ if getattr(self, name) is not None}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['start'], data['end'], data['text'], data.get('vi'), data.get('en'))
+
+    def __eq__(self, other):
+        return isinstance(other, Segment) and all(
+            getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self):
+        return f"Segment({self.start:.2f}-{self.end:.2f}, {self.text!r})"
+
+
+class Transcript:
+    """Danh sách Segment theo thứ tự thời gian; ghi/đọc dạng JSON lines (mỗi dòng một đoạn)."""
+    __slots__ = ('segments',)
+
+    def __init__(self, segments=()):
+        self.segments = list(segments)
+
+    def __len__(self):
+        return len(self.segments)
+
+    def __iter__(self):
+        return iter(self.segments)
+
+    def __getitem__(self, index):
+        return self.segments[index]
+
+    # Toàn bộ văn bản gốc, dùng cho bản dịch cả bài (app.py) và phần "Nội Dung Gốc"
+    @property
+    def text(self):
+        return " ".join(segment.text for segment in self.segments)
+
+    def append(self, segment):
+        self.segments.append(segment)
+
+    def sort(self):
+        self.segments.sort(key=lambda segment: segment.start)
+        return self
+
+    def iter_jsonl(self):
+        for segment in self.segments:
+            yield json.dumps(segment.to_dict(), ensure_ascii=False) + "\n"
+
+    def write_jsonl(self, file):
+        file.writelines(self.iter_jsonl())
+
+    @classmethod
+    def read_jsonl(cls, file):
+        return cls(Segment.from_dict(json.loads(line)) for line in file if line.strip())
@@ -0,0 +1,154 @@
+import os
+import time
+import wave
+import hashlib
+import threading
+from concurrent.futures import Future
+from dotenv import load_dotenv
+
+from transcript import Transcript
+
+# Đọc cấu hình từ file .env trước khi lấy các biến môi trường bên dưới
+load_dotenv()
+
+# Cache kết quả phiên âm theo nội dung âm thanh, lưu trên đĩa dạng JSON lines (mỗi dòng một đoạn)
+TRANSCRIPT_CACHE_DIR = os.getenv("TRANSCRIPT_CACHE_DIR", os.path.join("cache", "transcripts"))
+TRANSCRIPT_CACHE_MAX_BYTES = int(os.getenv("TRANSCRIPT_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+TRANSCRIPT_LOCK_TIMEOUT = int(os.getenv("TRANSCRIPT_LOCK_TIMEOUT", "3600"))  # Khóa cũ hơn mức này coi như bị bỏ
+LOCK_POLL_INTERVAL = 1.0
+READ_BLOCK_SIZE = 1024 * 1024
+
+# Băm dữ liệu PCM (bỏ qua header WAV) để cùng một bản ghi luôn cho cùng một khóa
+def audio_fingerprint(path):
+    digest = hashlib.sha256()
+    try:
+        with wave.open(path, 'rb') as wav_file:
+            digest.update(f"{wav_file.getframerate()}:{wav_file.getnchannels()}:{wav_file.getsampwidth()}".encode())
+            frames_per_block = max(1, READ_BLOCK_SIZE // (wav_file.getsampwidth() * wav_file.getnchannels()))
+            while True:
+                frames = wav_file.readframes(frames_per_block)
+                if not frames:
+                    break
+                digest.update(frames)
+    except (wave.Error, EOFError):
+        # Không phải WAV PCM: băm toàn bộ nội dung file
+        digest = hashlib.sha256()
+        with open(path, 'rb') as audio_file:
+            for block in iter(lambda: audio_file.read(READ_BLOCK_SIZE), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+def transcript_key(path, model, language, codec=""):
+    return hashlib.sha256(f"{audio_fingerprint(path)}:{model}:{language}:{codec}".encode()).hexdigest()
+
+
+class TranscriptCache:
+    def __init__(self, cache_dir=TRANSCRIPT_CACHE_DIR, max_bytes=TRANSCRIPT_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._inflight = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.jsonl")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as cache_file:
+                transcript = Transcript.read_jsonl(cache_file)
+            os.utime(path)  # Cập nhật thời điểm dùng gần nhất cho LRU
+            return transcript
+        except (FileNotFoundError, ValueError, KeyError):
+            return None
+
+    def put(self, key, transcript):
+        path = self._path(key)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as cache_file:
+            transcript.write_jsonl(cache_file)
+        os.replace(temp_path, path)
+        self._evict()
+
+    # Xóa các mục dùng lâu nhất cho tới khi tổng dung lượng dưới giới hạn
+    def _evict(self):
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(('.jsonl', '.json')):  # .json: định dạng cũ, chỉ chờ bị dọn
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except FileNotFoundError:
+                pass
+
+    # Trả về kết quả trong cache, hoặc chạy compute() đúng một lần cho mỗi khóa
+    # dù có nhiều yêu cầu đồng thời (trong cùng tiến trình lẫn giữa các worker)
+    def get_or_compute(self, key, compute):
+        segments = self.get(key)
+        if segments is not None:
+            print(f"Dùng lại bản phiên âm trong cache: {key[:12]}")
+            return segments
+
+        with self._lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = Future()
+        if not leader:
+            return flight.result()
+
+        try:
+            segments = self._compute_locked(key, compute)
+            flight.set_result(segments)
+            return segments
+        except Exception as e:
+            flight.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    # Khóa file giữa các tiến trình: chỉ một worker gọi Whisper, các worker khác chờ kết quả
+    def _compute_locked(self, key, compute):
+        lock_path = f"{self._path(key)}.lock"
+        while True:
+            try:
+                os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                break
+            except FileExistsError:
+                segments = self.get(key)
+                if segments is not None:
+                    return segments
+                try:
+                    if time.time() - os.path.getmtime(lock_path) > TRANSCRIPT_LOCK_TIMEOUT:
+                        os.remove(lock_path)
+                        continue
+                except FileNotFoundError:
+                    continue
+                time.sleep(LOCK_POLL_INTERVAL)
+
+        try:
+            segments = self.get(key)
+            if segments is None:
+                segments = compute()
+                if segments:
+                    self.put(key, segments)
+            return segments
+        finally:
+            try:
+                os.remove(lock_path)
+            except FileNotFoundError:
+                pass
+
+
+transcript_cache = TranscriptCache()
@@ -0,0 +1,223 @@
+import os
+import re
+import subprocess
+import tempfile
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+from local_whisper import local_model_id, transcribe_local
+from media import WHISPER_ACCEPTED_EXTENSIONS, WHISPER_UPLOAD_CODEC, encode_audio, upload_extension
+from metrics import current_span
+from openai_client import call_with_retries
+from ratelimit import get_limiter
+from transcript import Segment, Transcript
+from transcript_cache import transcript_cache, transcript_key
+
+# Đọc cấu hình từ file .env trước khi lấy các biến môi trường bên dưới
+load_dotenv()
+
+# Nơi phiên âm: "api" (OpenAI Whisper), "local" (faster-whisper trên CPU, xem local_whisper.py)
+# hoặc "auto" (gọi API, API lỗi/hết hạn mức sau khi đã thử lại thì phiên âm local)
+TRANSCRIBE_BACKEND = os.getenv("TRANSCRIBE_BACKEND", "api")
+
+# Cấu hình phiên âm file dài bằng cách cắt thành nhiều đoạn
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "whisper-1")
+WHISPER_LANGUAGE = os.getenv("WHISPER_LANGUAGE", "vi")
+WHISPER_MAX_BYTES = int(os.getenv("WHISPER_MAX_BYTES", str(24 * 1024 * 1024)))  # API giới hạn 25 MB, chừa biên an toàn
+WHISPER_CONCURRENCY = int(os.getenv("WHISPER_CONCURRENCY", "4"))                # Số đoạn phiên âm song song
+WHISPER_RPM = int(os.getenv("WHISPER_RPM", "50"))                                # Request/phút, 0 = không giới hạn
+SILENCE_NOISE = os.getenv("SILENCE_NOISE", "-30dB")   # Ngưỡng coi là im lặng
+SILENCE_MIN_SECONDS = 0.5                             # Khoảng lặng tối thiểu để cắt
+CHUNK_OVERLAP_SECONDS = 2.0                           # Phần chồng lấn khi buộc phải cắt giữa lời nói
+MIN_CHUNK_RATIO = 0.5                                 # Chỉ tìm điểm cắt trong nửa sau của đoạn
+VBR_SAFETY_RATIO = 0.9                                # Bitrate FLAC/Opus thay đổi theo nội dung, chừa biên khi chia
+
+# Lấy độ dài file âm thanh (giây) bằng ffprobe
+def get_duration(path):
+    result = subprocess.run([
+        'ffprobe', '-v', 'error',
+        '-show_entries', 'format=duration',
+        '-of', 'default=noprint_wrappers=1:nokey=1',
+        path
+    ], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True)
+    return float(result.stdout.strip())
+
+# Tìm các khoảng lặng trong một lượt đọc file bằng bộ lọc silencedetect
+def detect_silences(path, noise=SILENCE_NOISE, min_silence=SILENCE_MIN_SECONDS):
+    result = subprocess.run([
+        'ffmpeg', '-hide_banner', '-nostats', '-i', path,
+        '-af', f'silencedetect=noise={noise}:d={min_silence}',
+        '-f', 'null', '-'
+    ], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True)
+    starts = [float(x) for x in re.findall(r'silence_start: (-?[\d.]+)', result.stderr)]
+    ends = [float(x) for x in re.findall(r'silence_end: (-?[\d.]+)', result.stderr)]
+    return list(zip(starts, ends))
+
+# Chia [0, duration] thành các đoạn không quá max_seconds, ưu tiên cắt ở giữa khoảng lặng.
+# Mỗi đoạn có phạm vi cắt (start, end) và phạm vi "sở hữu" (keep_from, keep_until) để loại trùng.
+def plan_chunks(duration, silences, max_seconds, overlap=CHUNK_OVERLAP_SECONDS):
+    overlap = min(overlap, max_seconds / 4)
+    cut_points = sorted((s + e) / 2 for s, e in silences)
+    chunks = []
+    keep_from = 0.0
+    previous_hard_cut = False
+    while keep_from < duration:
+        start = max(0.0, keep_from - overlap) if previous_hard_cut else keep_from
+        limit = start + max_seconds
+        if limit >= duration:
+            cut, hard_cut = float('inf'), False
+        else:
+            earliest = keep_from + (limit - keep_from) * MIN_CHUNK_RATIO
+            candidates = [p for p in cut_points if earliest <= p <= limit]
+            if candidates:
+                cut, hard_cut = candidates[-1], False
+            else:
+                # Không có khoảng lặng phù hợp: cắt cứng và để hai đoạn chồng lên nhau
+                cut, hard_cut = limit - overlap, True
+
+        chunks.append({
+            'start': start,
+            'end': min(duration, cut + overlap if hard_cut else cut),
+            'keep_from': keep_from,
+            'keep_until': cut
+        })
+        keep_from = cut
+        previous_hard_cut = hard_cut
+    return chunks
+
+# Gọi Whisper cho một file, cộng thêm offset vào timestamp của từng đoạn
+def transcribe_file(client, path, offset=0.0, model=WHISPER_MODEL, language=WHISPER_LANGUAGE):
+    # Mở lại file trong mỗi lần thử để lần gửi lại luôn đọc từ đầu
+    def request():
+        with open(path, 'rb') as audio_file:
+            return client.audio.transcriptions.create(
+                model=model,
+                file=audio_file,
+                language=language,
+                response_format="verbose_json"  # Định dạng phản hồi bao gồm timestamps
+            )
+
+    response = call_with_retries(request, limiter=get_limiter(f"audio:{model}", WHISPER_RPM))
+
+    if hasattr(response, 'segments') and response.segments:
+        return Transcript(
+            Segment(segment.start + offset, segment.end + offset, segment.text.strip())
+            for segment in response.segments
+        )
+    # Nếu không có segments, chỉ lấy toàn bộ văn bản
+    return Transcript([Segment(offset, offset, response.text.strip())])
+
+# Ghép kết quả các đoạn: mỗi đoạn chỉ giữ các segment có tâm nằm trong phạm vi nó sở hữu
+def merge_chunk_segments(chunks, chunk_segments):
+    merged = Transcript()
+    for chunk, segments in zip(chunks, chunk_segments):
+        for segment in segments:
+            middle = (segment.start + segment.end) / 2
+            if chunk['keep_from'] <= middle < chunk['keep_until']:
+                merged.append(segment)
+    return merged.sort()
+
+# Phiên âm file có độ dài bất kỳ: file nén sẵn (luồng copy) vừa giới hạn thì gửi nguyên,
+# WAV được mã hóa gọn (FLAC/Opus) rồi gửi một lần, file lớn hơn thì cắt ở khoảng lặng và gửi song song.
+# duration lấy từ kết quả ffprobe có sẵn nếu có, để không phải chạy lại ffprobe.
+def transcribe_long_audio(client, path, model=WHISPER_MODEL, language=WHISPER_LANGUAGE,
+                          max_bytes=WHISPER_MAX_BYTES, concurrency=WHISPER_CONCURRENCY,
+                          codec=WHISPER_UPLOAD_CODEC, duration=None):
+    source_extension = os.path.splitext(path)[1].lower()
+    if (source_extension != '.wav' and source_extension in WHISPER_ACCEPTED_EXTENSIONS
+            and os.path.getsize(path) <= max_bytes):
+        return transcribe_file(client, path, 0.0, model, language)
+
+    extension = upload_extension(codec)
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(path))) as chunk_dir:
+        encoded_path = os.path.join(chunk_dir, f"full{extension}")
+        encode_audio(path, encoded_path, codec)
+        encoded_size = os.path.getsize(encoded_path)
+        if encoded_size <= max_bytes:
+            return transcribe_file(client, encoded_path, 0.0, model, language)
+        os.remove(encoded_path)
+
+        duration = duration or get_duration(path)
+        max_seconds = max_bytes * VBR_SAFETY_RATIO / (encoded_size / duration)
+        chunks = plan_chunks(duration, detect_silences(path), max_seconds)
+        print(f"Chia {path} ({duration:.0f}s) thành {len(chunks)} đoạn {codec} để phiên âm song song.")
+
+        def transcribe_chunk(item):
+            index, chunk = item
+            chunk_path = os.path.join(chunk_dir, f"chunk_{index:04d}{extension}")
+            encode_audio(path, chunk_path, codec, chunk['start'], chunk['end'])
+            try:
+                return transcribe_file(client, chunk_path, chunk['start'], model, language)
+            finally:
+                os.remove(chunk_path)
+
+        with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(chunks)))) as pool:
+            # Mỗi đoạn chạy trong bản sao context của luồng gọi để số lần thử lại được tính vào span "transcribe"
+            chunk_segments = list(pool.map(lambda args: args[0].run(transcribe_chunk, args[1]),
+                                           [(contextvars.copy_context(), item) for item in enumerate(chunks)]))
+
+    return merge_chunk_segments(chunks, chunk_segments)
+
+
+class APIBackend:
+    """Whisper API của OpenAI; file dài được cắt ở khoảng lặng và gửi song song."""
+    name = "api"
+
+    def __init__(self, client, model=WHISPER_MODEL, language=WHISPER_LANGUAGE, codec=WHISPER_UPLOAD_CODEC):
+        self.client = client
+        self.model = model
+        self.language = language
+        self.codec = codec
+
+    def cache_key(self, path):
+        return transcript_key(path, self.model, self.language, self.codec)
+
+    def transcribe(self, path, duration=None):
+        return transcribe_long_audio(self.client, path, self.model, self.language, codec=self.codec,
+                                     duration=duration)
+
+
+class LocalBackend:
+    """faster-whisper trên CPU, model nạp một lần cho mỗi tiến trình."""
+    name = "local"
+
+    def __init__(self, language=WHISPER_LANGUAGE):
+        self.language = language
+
+    def cache_key(self, path):
+        return transcript_key(path, local_model_id(), self.language)
+
+    def transcribe(self, path, duration=None):
+        return transcribe_local(path, self.language)
+
+
+# Các backend sẽ thử theo thứ tự cho một lần phiên âm
+def select_backends(client, name=TRANSCRIBE_BACKEND, model=WHISPER_MODEL, language=WHISPER_LANGUAGE,
+                    codec=WHISPER_UPLOAD_CODEC):
+    api = APIBackend(client, model, language, codec)
+    local = LocalBackend(language)
+    backends = {'api': [api], 'local': [local], 'auto': [api, local]}
+    if name not in backends:
+        raise ValueError(f"TRANSCRIBE_BACKEND không hợp lệ: {name} (api, local hoặc auto)")
+    return backends[name]
+
+# Phiên âm có cache theo nội dung âm thanh: upload lại cùng bản ghi không phải phiên âm lần nữa.
+# Backend nào lỗi thì chuyển sang backend tiếp theo (chế độ "auto").
+def transcribe_audio_cached(client, path, model=WHISPER_MODEL, language=WHISPER_LANGUAGE,
+                            codec=WHISPER_UPLOAD_CODEC, duration=None, backend=TRANSCRIBE_BACKEND):
+    backends = select_backends(client, backend, model, language, codec)
+    for index, current in enumerate(backends):
+        try:
+            transcript = transcript_cache.get_or_compute(
+                current.cache_key(path), lambda: current.transcribe(path, duration)
+            )
+        except Exception as e:
+            if index == len(backends) - 1:
+                raise
+            print(f"Phiên âm bằng {current.name} lỗi ({e}), chuyển sang {backends[index + 1].name}")
+            continue
+        span = current_span()
+        if span is not None:
+            span.set(backend=current.name)
+        return transcript
@@ -0,0 +1,316 @@
+import os
+import json
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+from openai_client import call_with_retries, call_with_retries_async
+from prompts import get_prompt
+from ratelimit import estimate_tokens, get_limiter
+from transcript import Transcript, format_timestamp
+from translation_memory import translation_memory
+
+# Đọc cấu hình từ file .env trước khi lấy các biến môi trường bên dưới
+load_dotenv()
+
+# Cấu hình dịch song ngữ theo từng đoạn
+TRANSLATE_MODEL = os.getenv("TRANSLATE_MODEL", "gpt-4")
+TRANSLATE_CONCURRENCY = int(os.getenv("TRANSLATE_CONCURRENCY", "8"))   # Số request dịch chạy song song
+TRANSLATE_RPM = int(os.getenv("TRANSLATE_RPM", "500"))                 # Request/phút, 0 = không giới hạn
+TRANSLATE_TPM = int(os.getenv("TRANSLATE_TPM", "30000"))               # Token/phút, 0 = không giới hạn
+SEGMENT_MAX_TOKENS = 500  # Một đoạn Whisper ngắn, không cần tới 3000 token đầu ra
+# Gộp các đoạn liên tiếp vào một request: phần hướng dẫn chỉ gửi một lần cho cả nhóm
+TRANSLATE_BATCH_TOKENS = int(os.getenv("TRANSLATE_BATCH_TOKENS", "1200"))          # Token văn bản gốc mỗi request
+TRANSLATE_BATCH_MAX_SEGMENTS = int(os.getenv("TRANSLATE_BATCH_MAX_SEGMENTS", "60"))
+BATCH_ITEM_OVERHEAD_TOKENS = 8     # {"i": .., "t": ".."} quanh mỗi đoạn
+BATCH_OUTPUT_RATIO = 3             # Đầu ra gồm câu tiếng Việt đã sửa + tiếng Anh + khung JSON
+BATCH_MAX_OUTPUT_TOKENS = 4000
+# Model hỗ trợ response_format={"type": "json_object"}; model khác chỉ dựa vào hướng dẫn trong prompt
+JSON_MODE_MODELS = ('gpt-4o', 'gpt-4-turbo', 'gpt-4.1', 'gpt-3.5-turbo-0125')
+
+# Dùng chung giữa mọi job và mọi worker gunicorn để cùng tôn trọng hạn mức của tổ chức
+default_limiter = get_limiter(f"chat:{TRANSLATE_MODEL}", TRANSLATE_RPM, TRANSLATE_TPM)
+
+# Prompt nằm trong prompts/segment.txt và prompts/batch.txt (xem prompts.py)
+SEGMENT_PROMPT = get_prompt("segment")
+BATCH_PROMPT = get_prompt("batch")
+# Bộ nhớ dịch lưu kết quả của cả hai prompt; sửa một trong hai thì kết quả cũ không được dùng lại
+PROMPT_VERSION = f"{SEGMENT_PROMPT.version}.{BATCH_PROMPT.version}"
+TIME_PLACEHOLDER = "{time}"    # Bộ nhớ dịch lưu bản dịch không kèm timestamp cụ thể
+
+# Tin nhắn cho một đoạn: hướng dẫn + mẫu ở system (giống nhau mọi request), mốc thời gian và nội dung ở cuối
+def build_segment_messages(vietnamese_text, time_formatted):
+    return SEGMENT_PROMPT.messages(time=time_formatted, text=vietnamese_text)
+
+# Tin nhắn cho một nhóm đoạn liên tiếp; "i" là số thứ tự trong nhóm để ánh xạ kết quả về đúng đoạn
+def build_batch_messages(batch):
+    items = [{"i": position, "t": segment.text} for position, (_, segment) in enumerate(batch)]
+    return BATCH_PROMPT.messages(items=json.dumps(items, ensure_ascii=False))
+
+def _message_tokens(messages):
+    return estimate_tokens("".join(message["content"] for message in messages))
+
+# Cùng định dạng dòng với prompt từng đoạn, để bộ nhớ dịch, SSE và split_bilingual dùng chung
+def format_translation(time_formatted, vietnamese, english):
+    return f"-  {time_formatted}: {vietnamese}\n-> {time_formatted}: {english}"
+
+# Kết quả dự phòng khi không dịch được một đoạn
+def fallback_translation(vietnamese_text, time_formatted):
+    return f"A (Tiếng Việt) {time_formatted}: {vietnamese_text}\nB (English) {time_formatted}: ..."
+
+# Phần nội dung sau mốc thời gian trong một dòng kết quả, ví dụ "-> [0:02]: Remember..." -> "Remember..."
+def _line_content(line):
+    if ']:' in line:
+        return line.split(']:', 1)[1].strip()
+    return line.split(':', 1)[1].strip() if ':' in line else line
+
+# Tách kết quả dịch của một đoạn thành câu tiếng Việt (đã chỉnh sửa) và câu tiếng Anh
+def split_bilingual(translated_text, vietnamese_text):
+    vietnamese, english = vietnamese_text.strip(), ""
+    for line in translated_text.splitlines():
+        line = line.strip()
+        if line.startswith('->') or line.startswith('B (English)'):
+            english = _line_content(line)
+        elif line.startswith('-') or line.startswith('A (Tiếng Việt)'):
+            vietnamese = _line_content(line) or vietnamese
+    return vietnamese, english
+
+# Gắn bản dịch vào từng đoạn (vi, en) cho bước xuất file
+def bilingual_segments(transcript, translations):
+    results = Transcript()
+    for segment, translated_text in zip(transcript, translations):
+        vietnamese, english = split_bilingual(translated_text, segment.text)
+        results.append(segment.replace(vi=vietnamese, en=english))
+    return results
+
+# Request cho một đoạn và số token ước lượng để trừ hạn mức
+def _segment_request(segment, model):
+    messages = build_segment_messages(segment.text, format_timestamp(segment.end))
+    request = {
+        'model': model,
+        'messages': messages,
+        'max_tokens': SEGMENT_MAX_TOKENS,
+        'temperature': 0.3,
+    }
+    return request, _message_tokens(messages) + SEGMENT_MAX_TOKENS
+
+def _segment_result(response):
+    return response.choices[0].message.content.strip()
+
+# Lỗi chỉ ảnh hưởng tới đoạn đó: ghi log và trả về kết quả dự phòng
+def _segment_failed(segment, error):
+    print(f"ChatGPT API error: {error}")
+    return fallback_translation(segment.text, format_timestamp(segment.end))
+
+def _remembered(memory, segment, model):
+    remembered = memory.get(segment.text, model, PROMPT_VERSION) if memory else None
+    if remembered is not None:
+        return remembered.replace(TIME_PLACEHOLDER, format_timestamp(segment.end))
+    return None
+
+def _remember(memory, segment, model, translated_text):
+    if memory:
+        memory.put(segment.text, model, PROMPT_VERSION,
+                   translated_text.replace(format_timestamp(segment.end), TIME_PLACEHOLDER))
+
+# Dịch một đoạn Whisper; tra bộ nhớ dịch trước, lỗi chỉ ảnh hưởng tới đoạn đó
+def translate_segment(client, segment, model=TRANSLATE_MODEL, limiter=default_limiter, memory=translation_memory):
+    remembered = _remembered(memory, segment, model)
+    if remembered is not None:
+        return remembered
+
+    request, tokens = _segment_request(segment, model)
+    try:
+        response = call_with_retries(lambda: client.chat.completions.create(**request),
+                                     limiter=limiter, tokens=tokens)
+        translated_text = _segment_result(response)
+    except Exception as e:
+        return _segment_failed(segment, e)
+
+    _remember(memory, segment, model, translated_text)
+    return translated_text
+
+# Bản bất đồng bộ của translate_segment cho pipeline asyncio (client là AsyncOpenAI).
+# Bộ nhớ dịch là SQLite (có thể chờ khóa tới 30 giây) nên được gọi trong thread, không chặn event loop.
+async def translate_segment_async(client, segment, model=TRANSLATE_MODEL, limiter=default_limiter,
+                                  memory=translation_memory):
+    remembered = await asyncio.to_thread(_remembered, memory, segment, model)
+    if remembered is not None:
+        return remembered
+
+    request, tokens = _segment_request(segment, model)
+    try:
+        response = await call_with_retries_async(lambda: client.chat.completions.create(**request),
+                                                 limiter=limiter, tokens=tokens)
+        translated_text = _segment_result(response)
+    except Exception as e:
+        return _segment_failed(segment, e)
+
+    await asyncio.to_thread(_remember, memory, segment, model, translated_text)
+    return translated_text
+
+# Chia các đoạn cần dịch [(index, segment), ...] thành các nhóm liên tiếp trong ngân sách token
+def pack_segments(items, budget=TRANSLATE_BATCH_TOKENS, max_segments=TRANSLATE_BATCH_MAX_SEGMENTS):
+    batches, current, current_tokens = [], [], 0
+    for item in items:
+        tokens = estimate_tokens(item[1].text) + BATCH_ITEM_OVERHEAD_TOKENS
+        if current and (current_tokens + tokens > budget or len(current) >= max_segments):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(item)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+def _batch_request(batch, model):
+    messages = build_batch_messages(batch)
+    text_tokens = sum(estimate_tokens(segment.text) + BATCH_ITEM_OVERHEAD_TOKENS for _, segment in batch)
+    max_tokens = min(BATCH_MAX_OUTPUT_TOKENS, text_tokens * BATCH_OUTPUT_RATIO + 50)
+    request = {
+        'model': model,
+        'messages': messages,
+        'max_tokens': max_tokens,
+        'temperature': 0.3,
+    }
+    if model.startswith(JSON_MODE_MODELS):
+        request['response_format'] = {"type": "json_object"}
+    return request, _message_tokens(messages) + max_tokens
+
+# Đọc JSON trả về của một nhóm, chỉ giữ các đoạn hợp lệ: {index gốc: kết quả dạng "-  [m:ss]: ..."}
+def parse_batch_response(content, batch):
+    start, end = content.find('{'), content.rfind('}')
+    if start < 0 or end < start:
+        return {}
+    try:
+        items = json.loads(content[start:end + 1]).get('segments')
+    except (ValueError, AttributeError):
+        return {}
+
+    results, seen = {}, set()
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict):
+            continue
+        position, vietnamese, english = item.get('i'), item.get('vi'), item.get('en')
+        # type() thay cho isinstance: JSON true/false là bool, cũng là int trong Python
+        if (type(position) is not int or not 0 <= position < len(batch)
+                or not isinstance(vietnamese, str) or not isinstance(english, str) or not english.strip()):
+            continue
+        if position in seen:
+            # "i" lặp lại: không biết bản nào đúng, bỏ cả hai để đoạn được dịch lại riêng
+            results.pop(batch[position][0], None)
+            continue
+        seen.add(position)
+        index, segment = batch[position]
+        results[index] = format_translation(format_timestamp(segment.end),
+                                            vietnamese.strip() or segment.text, english.strip())
+    return results
+
+def _store_batch(memory, batch, model, results):
+    for index, segment in batch:
+        if index in results:
+            _remember(memory, segment, model, results[index])
+
+# Dịch một nhóm bằng một request; lỗi API trả về rỗng để các đoạn được dịch lại từng đoạn
+def translate_batch(client, batch, model=TRANSLATE_MODEL, limiter=default_limiter, memory=translation_memory):
+    request, tokens = _batch_request(batch, model)
+    try:
+        response = call_with_retries(lambda: client.chat.completions.create(**request),
+                                     limiter=limiter, tokens=tokens)
+        results = parse_batch_response(response.choices[0].message.content or "", batch)
+    except Exception as e:
+        print(f"ChatGPT API error (nhóm {len(batch)} đoạn): {e}")
+        return {}
+    _store_batch(memory, batch, model, results)
+    return results
+
+async def translate_batch_async(client, batch, model=TRANSLATE_MODEL, limiter=default_limiter,
+                                memory=translation_memory):
+    request, tokens = _batch_request(batch, model)
+    try:
+        response = await call_with_retries_async(lambda: client.chat.completions.create(**request),
+                                                 limiter=limiter, tokens=tokens)
+        results = parse_batch_response(response.choices[0].message.content or "", batch)
+    except Exception as e:
+        print(f"ChatGPT API error (nhóm {len(batch)} đoạn): {e}")
+        return {}
+    await asyncio.to_thread(_store_batch, memory, batch, model, results)
+    return results
+
+# Tra bộ nhớ dịch cho mọi đoạn: kết quả đã có (None = cần dịch) và các [(index, segment)] cần dịch
+def _recall_all(segments, model, memory):
+    results = [_remembered(memory, segment, model) for segment in segments]
+    pending = [(index, segment) for index, segment in enumerate(segments) if results[index] is None]
+    return results, pending
+
+def _report_missing(batch, results):
+    missing = [(index, segment) for index, segment in batch if index not in results]
+    if missing:
+        print(f"Nhóm {len(batch)} đoạn thiếu {len(missing)} kết quả, dịch lại từng đoạn")
+    return missing
+
+# Dịch song song các đoạn theo nhóm, giữ nguyên thứ tự ban đầu.
+# Đoạn bị thiếu hoặc sai trong kết quả của nhóm được dịch lại riêng từng đoạn.
+def translate_segments(client, segments, model=TRANSLATE_MODEL,
+                       concurrency=TRANSLATE_CONCURRENCY, limiter=default_limiter, memory=translation_memory):
+    if not segments:
+        return []
+    results, pending = _recall_all(segments, model, memory)
+
+    def translate_group(batch):
+        translated = translate_batch(client, batch, model, limiter, memory)
+        for index, segment in _report_missing(batch, translated):
+            translated[index] = translate_segment(client, segment, model, limiter, memory=memory)
+        return translated
+
+    batches = pack_segments(pending)
+    if batches:
+        with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(batches)))) as pool:
+            # Bản sao context của luồng gọi để token và số lần thử lại được tính vào span hiện tại
+            for translated in pool.map(lambda args: args[0].run(translate_group, args[1]),
+                                       [(contextvars.copy_context(), batch) for batch in batches]):
+                for index, text in translated.items():
+                    results[index] = text
+        print(f"Dịch {len(pending)} đoạn theo {len(batches)} nhóm")
+    if memory:
+        stats = memory.stats()
+        print(f"Bộ nhớ dịch: {stats['hits']} lần trúng, {stats['misses']} lần trượt (từ khi khởi động)")
+    return results
+
+# Dịch các đoạn theo nhóm bằng coroutine; semaphore dùng chung giới hạn số request dịch
+# của mọi file trong pipeline.
+# on_result(index, text) được gọi ngay khi từng đoạn có bản dịch (có thể không theo thứ tự). Hàm này và
+# bộ nhớ dịch thường ghi SQLite nên chạy trong thread để không chặn các coroutine khác.
+async def translate_segments_async(client, segments, semaphore, model=TRANSLATE_MODEL,
+                                   limiter=default_limiter, memory=translation_memory, on_result=None):
+    # Tra bộ nhớ dịch cho cả file một lần trước khi vào vòng dịch
+    results, pending = await asyncio.to_thread(_recall_all, segments, model, memory)
+
+    def report(items):
+        for index, text in items:
+            on_result(index, text)
+
+    async def deliver(items):
+        for index, text in items:
+            results[index] = text
+        if on_result and items:
+            await asyncio.to_thread(report, items)
+
+    await deliver([(index, text) for index, text in enumerate(results) if text is not None])
+
+    async def translate_one(index, segment):
+        async with semaphore:
+            text = await translate_segment_async(client, segment, model, limiter, memory)
+        await deliver([(index, text)])
+
+    async def translate_group(batch):
+        async with semaphore:
+            translated = await translate_batch_async(client, batch, model, limiter, memory)
+        await deliver(list(translated.items()))
+        missing = _report_missing(batch, translated)
+        await asyncio.gather(*(translate_one(index, segment) for index, segment in missing))
+
+    batches = pack_segments(pending)
+    await asyncio.gather(*(translate_group(batch) for batch in batches))
+    return results
@@ -0,0 +1,121 @@
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from dotenv import load_dotenv
+
+# Đọc cấu hình từ file .env trước khi lấy các biến môi trường bên dưới
+load_dotenv()
+
+# Bộ nhớ dịch: lưu bản dịch của từng đoạn để các câu lặp lại không phải gọi GPT
+TRANSLATION_MEMORY_DB = os.getenv("TRANSLATION_MEMORY_DB", os.path.join("cache", "translation_memory.sqlite3"))
+TRANSLATION_MEMORY_MAX_ENTRIES = int(os.getenv("TRANSLATION_MEMORY_MAX_ENTRIES", "200000"))
+TRANSLATION_MEMORY_TTL = int(os.getenv("TRANSLATION_MEMORY_TTL", str(90 * 24 * 3600)))  # Giây, 0 = không hết hạn
+EVICT_BATCH_RATIO = 0.1  # Khi vượt giới hạn, xóa thêm 10% để không phải dọn sau mỗi lần ghi
+EVICT_CHECK_INTERVAL = 1000  # Đếm lại bảng sau chừng này lần ghi (các tiến trình khác cũng ghi vào cùng DB)
+
+# Chuẩn hóa văn bản tiếng Việt: NFC, chữ thường, gộp khoảng trắng
+def normalize_text(text):
+    text = unicodedata.normalize('NFC', text).lower()
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+class TranslationMemory:
+    def __init__(self, db_path=TRANSLATION_MEMORY_DB, max_entries=TRANSLATION_MEMORY_MAX_ENTRIES,
+                 ttl_seconds=TRANSLATION_MEMORY_TTL):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._counter_lock = threading.Lock()
+        # Số dòng ước lượng: đếm thật một lần lúc mở, sau đó cộng theo số lần ghi của tiến trình này
+        self._estimated_rows = 0
+        self._puts_since_check = 0
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS translations (
+                    key TEXT PRIMARY KEY,
+                    translation TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_translations_last_used ON translations (last_used)")
+            self._estimated_rows = conn.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+
+    @staticmethod
+    def _key(text, model, prompt_version):
+        return hashlib.sha256(f"{prompt_version}\0{model}\0{normalize_text(text)}".encode()).hexdigest()
+
+    def _count(self, hit):
+        with self._counter_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, text, model, prompt_version):
+        key = self._key(text, model, prompt_version)
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT translation, created_at FROM translations WHERE key = ?", (key,)
+            ).fetchone()
+            if row and self.ttl_seconds and now - row[1] > self.ttl_seconds:
+                conn.execute("DELETE FROM translations WHERE key = ?", (key,))
+                row = None
+            if row:
+                conn.execute("UPDATE translations SET last_used = ? WHERE key = ?", (now, key))
+        self._count(row is not None)
+        return row[0] if row else None
+
+    def put(self, text, model, prompt_version, translation):
+        key = self._key(text, model, prompt_version)
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO translations (key, translation, created_at, last_used) "
+                "VALUES (?, ?, ?, ?)",
+                (key, translation, now, now)
+            )
+            if self._needs_check():
+                self._evict(conn)
+
+    # COUNT(*) quét cả bảng: chỉ đếm lại khi ước lượng vượt giới hạn hoặc sau EVICT_CHECK_INTERVAL lần ghi
+    def _needs_check(self):
+        with self._counter_lock:
+            self._estimated_rows += 1
+            self._puts_since_check += 1
+            if self._estimated_rows <= self.max_entries and self._puts_since_check < EVICT_CHECK_INTERVAL:
+                return False
+            self._puts_since_check = 0
+            return True
+
+    def _evict(self, conn):
+        count = conn.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+        if count > self.max_entries:
+            excess = count - self.max_entries + int(self.max_entries * EVICT_BATCH_RATIO)
+            conn.execute(
+                "DELETE FROM translations WHERE key IN "
+                "(SELECT key FROM translations ORDER BY last_used LIMIT ?)",
+                (excess,)
+            )
+            count -= excess
+        with self._counter_lock:
+            self._estimated_rows = count
+
+    def stats(self):
+        with self._counter_lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+
+translation_memory = TranslationMemory()
@@ -0,0 +1,154 @@
+import os
+import wave
+import struct
+import bisect
+import numpy as np
+from dotenv import load_dotenv
+
+from transcript import Transcript
+
+# Đọc cấu hình từ file .env trước khi lấy các biến môi trường bên dưới
+load_dotenv()
+
+# Lọc khoảng lặng (VAD) theo năng lượng và tỉ lệ qua điểm 0 trước khi gửi Whisper
+VAD_ENABLED = os.getenv("VAD_ENABLED", "1") == "1"
+VAD_FRAME_MS = 30                                              # Độ dài một khung phân tích
+VAD_ENERGY_DB = float(os.getenv("VAD_ENERGY_DB", "12"))       # Cao hơn nền nhiễu bao nhiêu dB thì coi là lời nói
+VAD_WEAK_ENERGY_DB = 6.0                                       # Ngưỡng thấp cho âm xát (s, x, ph...) có ZCR cao
+VAD_ZCR_MIN = 0.25                                             # Tỉ lệ qua điểm 0 của âm vô thanh
+VAD_MIN_SILENCE_MS = int(os.getenv("VAD_MIN_SILENCE_MS", "1000"))  # Chỉ cắt các khoảng lặng dài hơn mức này
+VAD_PADDING_MS = 200                                           # Giữ thêm hai bên mỗi đoạn lời nói
+VAD_KEEP_SILENCE_MS = 300                                      # Khoảng lặng bị cắt được nén còn lại chừng này
+BLOCK_SECONDS = 60                                             # Xử lý theo khối để bộ nhớ không tăng theo độ dài file
+
+# Tìm vị trí và kích thước khối dữ liệu PCM trong file WAV để ánh xạ bộ nhớ trực tiếp
+def _pcm_data_chunk(path):
+    with open(path, 'rb') as wav_file:
+        riff, _, wave_id = struct.unpack('<4sI4s', wav_file.read(12))
+        if riff != b'RIFF' or wave_id != b'WAVE':
+            raise ValueError("Không phải file WAV.")
+        while True:
+            header = wav_file.read(8)
+            if len(header) < 8:
+                raise ValueError("File WAV không có khối dữ liệu.")
+            chunk_id, chunk_size = struct.unpack('<4sI', header)
+            if chunk_id == b'data':
+                return wav_file.tell(), chunk_size
+            wav_file.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+
+# Đọc WAV PCM 16-bit mono qua memmap (không nạp cả file vào RAM)
+def open_pcm(path):
+    with wave.open(path, 'rb') as wav_file:
+        if wav_file.getsampwidth() != 2 or wav_file.getnchannels() != 1:
+            raise ValueError("VAD chỉ hỗ trợ WAV PCM 16-bit mono.")
+        sample_rate = wav_file.getframerate()
+    offset, size = _pcm_data_chunk(path)
+    # ffmpeg ghi header khi đọc từ pipe có thể để kích thước 0xFFFFFFFF: lấy theo kích thước file
+    size = min(size, os.path.getsize(path) - offset)
+    samples = np.memmap(path, dtype='<i2', mode='r', offset=offset, shape=(size // 2,))
+    return samples, sample_rate
+
+# Tính năng lượng (dBFS) và tỉ lệ qua điểm 0 cho từng khung, vector hóa theo khối
+def frame_features(samples, frame_size):
+    num_frames = len(samples) // frame_size
+    energy = np.empty(num_frames, dtype=np.float32)
+    zcr = np.empty(num_frames, dtype=np.float32)
+    frames_per_block = max(1, BLOCK_SECONDS * 1000 // VAD_FRAME_MS)
+    for first in range(0, num_frames, frames_per_block):
+        last = min(num_frames, first + frames_per_block)
+        block = np.asarray(samples[first * frame_size:last * frame_size], dtype=np.float32)
+        block = block.reshape(last - first, frame_size) / 32768.0
+        energy[first:last] = 10 * np.log10(np.mean(block * block, axis=1) + 1e-10)
+        signs = np.signbit(block)
+        zcr[first:last] = np.mean(signs[:, 1:] != signs[:, :-1], axis=1)
+    return energy, zcr
+
+# Đánh dấu các khung có lời nói, nới rộng theo padding và lấp các khoảng lặng ngắn
+def speech_frames(energy, zcr, frame_ms=VAD_FRAME_MS):
+    if len(energy) == 0:
+        return np.zeros(0, dtype=bool)
+    noise_floor = float(np.percentile(energy, 10))
+    speech = (energy > noise_floor + VAD_ENERGY_DB) | (
+        (energy > noise_floor + VAD_WEAK_ENERGY_DB) & (zcr > VAD_ZCR_MIN))
+
+    padding = VAD_PADDING_MS // frame_ms
+    if padding:
+        speech = np.convolve(speech, np.ones(2 * padding + 1), mode='same') > 0
+
+    # Lấp các khoảng lặng ngắn hơn VAD_MIN_SILENCE_MS
+    min_gap = VAD_MIN_SILENCE_MS // frame_ms
+    starts, ends = _runs(~speech)
+    for start, end in zip(starts, ends):
+        if end - start < min_gap and start > 0 and end < len(speech):
+            speech[start:end] = True
+    return speech
+
+# Vị trí bắt đầu/kết thúc của các dãy True liên tiếp
+def _runs(mask):
+    padded = np.concatenate(([False], mask, [False]))
+    changes = np.flatnonzero(padded[1:] != padded[:-1])
+    return changes[0::2], changes[1::2]
+
+# Cắt/nén khoảng lặng, ghi file WAV mới và trả về bảng ánh xạ thời gian về bản ghi gốc.
+# offset_map: danh sách (giây trong file mới, giây trong file gốc, độ dài giây) cho mỗi đoạn giữ lại.
+def trim_silence(wav_path, output_path=None):
+    if not VAD_ENABLED or os.path.splitext(wav_path)[1].lower() != '.wav':
+        return wav_path, None, None
+    try:
+        samples, sample_rate = open_pcm(wav_path)
+    except (ValueError, wave.Error, EOFError) as e:
+        print(f"Bỏ qua VAD cho {wav_path}: {e}")
+        return wav_path, None, None
+
+    frame_size = sample_rate * VAD_FRAME_MS // 1000
+    energy, zcr = frame_features(samples, frame_size)
+    starts, ends = _runs(speech_frames(energy, zcr))
+    original_seconds = len(samples) / sample_rate
+    if len(starts) == 0:
+        return wav_path, None, {'original_seconds': original_seconds, 'kept_seconds': original_seconds,
+                                'removed_seconds': 0.0}
+
+    output_path = output_path or f"{os.path.splitext(wav_path)[0]}_speech.wav"
+    gap = np.zeros(sample_rate * VAD_KEEP_SILENCE_MS // 1000, dtype='<i2')
+    offset_map = []
+    written = 0
+    with wave.open(output_path, 'wb') as output:
+        output.setnchannels(1)
+        output.setsampwidth(2)
+        output.setframerate(sample_rate)
+        for index, (start, end) in enumerate(zip(starts, ends)):
+            first = int(start) * frame_size
+            last = len(samples) if end == len(energy) else int(end) * frame_size
+            if index:
+                output.writeframes(gap.tobytes())
+                written += len(gap)
+            output.writeframes(np.asarray(samples[first:last]).tobytes())
+            offset_map.append((written / sample_rate, first / sample_rate, (last - first) / sample_rate))
+            written += last - first
+    del samples
+
+    kept_seconds = written / sample_rate
+    stats = {
+        'original_seconds': round(original_seconds, 2),
+        'kept_seconds': round(kept_seconds, 2),
+        'removed_seconds': round(original_seconds - kept_seconds, 2),
+    }
+    print(f"VAD: bỏ {stats['removed_seconds']:.1f}s / {original_seconds:.1f}s không có lời nói trong {wav_path}")
+    return output_path, offset_map, stats
+
+# Đổi một mốc thời gian trong file đã cắt về thời gian trong bản ghi gốc
+def _to_original(seconds, offset_map, output_starts):
+    index = max(0, bisect.bisect_right(output_starts, seconds) - 1)
+    output_start, original_start, duration = offset_map[index]
+    return original_start + min(max(seconds - output_start, 0.0), duration)
+
+# Đưa timestamp của các segment Whisper về đúng vị trí trong bản ghi gốc.
+# Trả về Transcript mới: bản từ cache có thể đang được job khác dùng chung.
+def restore_timestamps(transcript, offset_map):
+    if not offset_map:
+        return transcript
+    output_starts = [entry[0] for entry in offset_map]
+    return Transcript(segment.replace(
+        start=_to_original(segment.start, offset_map, output_starts),
+        end=_to_original(segment.end, offset_map, output_starts),
+    ) for segment in transcript)
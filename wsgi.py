@@ -1,3 +1,5 @@
+# Chạy production: gunicorn wsgi:app (đọc gunicorn.conf.py - worker gthread để kết nối SSE
+# /jobs/<id>/events không chiếm hết worker và chặn upload mới)
 from app import app
 
 if __name__ == "__main__":